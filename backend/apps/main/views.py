@@ -10,7 +10,8 @@ from dual_momentum.ticker_config import TICKER_CONFIG
 import time
 import json
 
-from dual_momentum.dm_composite import DualMomentumComposite
+from dual_momentum.dm_composite import DualMomentumComposite, DEFAULT_SUMMARY_SECTIONS, \
+    monthly_data_to_arrow
 
 from IPython import embed
 
@@ -27,6 +28,18 @@ def get_test_data(request):
     config = json.loads(request.GET['conf'])['dm_config']
     components = json.loads(request.GET['conf'])['dm_components']
 
+    # the headline metrics (DEFAULT_SUMMARY_SECTIONS) get loaded first, then the monthly data
+    # with ?sections=monthly_data. ?sections=start_dates,rolling for optional sections
+    if request.GET.get('sections'):
+        sections = request.GET['sections'].split(',')
+    else:
+        sections = DEFAULT_SUMMARY_SECTIONS
+
+    # ?format=arrow returns only the monthly data (chart series) as an Arrow IPC stream
+    response_format = request.GET.get('format', 'json')
+    if response_format == 'arrow':
+        sections = ['monthly_data']
+
     if config['simulate_taxes']:
         tax_config = config['tax_rates']
         for key, val in tax_config.items():
@@ -56,8 +69,8 @@ def get_test_data(request):
                                leverage=config['leverage'],
                                borrowing_cost_above_libor=config['borrowing_costs_above_libor'])
 
-        dm.run_multi_component_dual_momentum()
-        dm.generate_results_summary()
+        # only runs the simulation if a requested section is not cached yet
+        dm.generate_results_summary(sections=sections)
 
         config_hash = dm.__hash__()
         data = dm.summary
@@ -69,6 +82,10 @@ def get_test_data(request):
 
     print("dual mom took ", time.time() - start)
 
+    if response_format == 'arrow' and error is None:
+        return HttpResponse(monthly_data_to_arrow(data['monthly_data']),
+                            content_type='application/vnd.apache.arrow.stream')
+
     return JsonResponse({'data': data, 'config_hash': config_hash, 'data_load_error': error})
 
     # with open('temp_data.json', 'r') as infile:
@@ -0,0 +1,143 @@
+"""
+Registry of benchmark and money market series, e.g. SPY or a 60/40 portfolio.
+
+Their returns only depend on the tickers and the tax config, not on a user's portfolio.
+Hence, each series gets simulated once per data version and tax config and then shared by
+all composites in the process.
+
+>>> spy = get_benchmark('SPY', tax_config=tax_config)
+>>> spy['performance_pretax']
+
+>>> register_benchmark('80/20', {'SPY': 0.8, 'VGIT': 0.2})
+>>> get_benchmark('80/20', tax_config=tax_config)
+
+"""
+
+from collections import OrderedDict
+
+from dual_momentum.dm_component import DualMomentumComponent
+from dual_momentum.panel import MonthlyPanel
+from dual_momentum.storage import get_data_version
+
+# benchmarks made up of multiple tickers, rebalanced every month. {name: {ticker: weight}}
+# Any single ticker can be used as a benchmark without registering it.
+BENCHMARK_DEFINITIONS = {
+    '60/40': {'SPY': 0.6, 'VGIT': 0.4}
+}
+
+BENCHMARK_COLUMNS = ['performance_pretax', 'performance_posttax', 'taxes']
+
+# {(name, tax config, use_early_replacements, day_of_month): (data version, MonthlyPanel)}
+# Least recently used series get dropped once there are more than MAX_CACHED_BENCHMARKS.
+_BENCHMARKS = OrderedDict()
+MAX_CACHED_BENCHMARKS = 256
+
+
+def register_benchmark(name: str, weights: dict):
+    """
+    Adds a benchmark made up of multiple tickers
+
+    :param name: str, e.g. '60/40'
+    :param weights: dict, e.g. {'SPY': 0.6, 'VGIT': 0.4}
+    :return:
+    """
+    if abs(sum(weights.values()) - 1) > 0.0001:
+        raise ValueError(f'The weights of benchmark {name} need to sum to one, not '
+                         f'{sum(weights.values())}.')
+    BENCHMARK_DEFINITIONS[name] = weights
+
+    # drop series simulated with an earlier definition
+    for key in [key for key in _BENCHMARKS if key[0] == name]:
+        del _BENCHMARKS[key]
+
+
+def get_benchmark(name: str, tax_config: dict, use_early_replacements: bool = True,
+                  day_of_month_for_monthly_data: int = -1,
+                  force_new_data: bool = False, data_version: int = None,
+                  simulate=None) -> MonthlyPanel:
+    """
+    Returns the monthly performance_pretax, performance_posttax and taxes of a benchmark
+
+    :param name: str, a registered benchmark or a ticker
+    :param tax_config: dict
+    :param use_early_replacements: bool
+    :param day_of_month_for_monthly_data: int
+    :param force_new_data: bool
+    :param data_version: int, version the shared series has to match. Default: current version
+    :param simulate: function (ticker, tax_config, ...) -> MonthlyPanel that simulates buying
+                     and holding a ticker. Default: simulate_buy_and_hold
+    :return: MonthlyPanel
+    """
+
+    key = (name, tuple(sorted(tax_config.items())), use_early_replacements,
+           day_of_month_for_monthly_data)
+    if data_version is None:
+        data_version = get_data_version()
+    if not force_new_data and key in _BENCHMARKS and _BENCHMARKS[key][0] == data_version:
+        _BENCHMARKS.move_to_end(key)
+        return _BENCHMARKS[key][1]
+
+    if simulate is None:
+        simulate = simulate_buy_and_hold
+    weights = BENCHMARK_DEFINITIONS.get(name, {name: 1.0})
+    panel = blend_benchmark(weights, {
+        ticker: simulate(ticker, tax_config=tax_config,
+                         use_early_replacements=use_early_replacements,
+                         day_of_month_for_monthly_data=day_of_month_for_monthly_data,
+                         force_new_data=force_new_data)
+        for ticker in weights
+    })
+
+    _BENCHMARKS[key] = (data_version, panel)
+    _BENCHMARKS.move_to_end(key)
+    if len(_BENCHMARKS) > MAX_CACHED_BENCHMARKS:
+        _BENCHMARKS.popitem(last=False)
+    return panel
+
+
+def blend_benchmark(weights: dict, ticker_panels: dict) -> MonthlyPanel:
+    """
+    Combines the buy and hold series of multiple tickers into one benchmark that gets
+    rebalanced to the weights every month, i.e. every month it has the weighted average of
+    the performance and taxes of the tickers. Aligned to the months of the first ticker.
+
+    :param weights: dict, e.g. {'SPY': 0.6, 'VGIT': 0.4}
+    :param ticker_panels: dict, {ticker: MonthlyPanel}, see simulate_buy_and_hold
+    :return: MonthlyPanel
+    """
+
+    panel = None
+    for ticker, weight in weights.items():
+        ticker_panel = ticker_panels[ticker]
+        if panel is None:
+            panel = MonthlyPanel(first_month=ticker_panel.first_month,
+                                 n_months=len(ticker_panel))
+            for column in BENCHMARK_COLUMNS:
+                panel[column] = 0.0
+        for column in BENCHMARK_COLUMNS:
+            panel[column] += weight * ticker_panel.column(column, panel.first_month, len(panel))
+    return panel
+
+
+def simulate_buy_and_hold(ticker: str, tax_config: dict, use_early_replacements: bool = True,
+                          day_of_month_for_monthly_data: int = -1,
+                          force_new_data: bool = False) -> MonthlyPanel:
+    """
+    Simulates buying and holding one ticker
+
+    :param ticker: str
+    :param tax_config: dict
+    :param use_early_replacements: bool
+    :param day_of_month_for_monthly_data: int
+    :param force_new_data: bool
+    :return: MonthlyPanel
+    """
+    component = DualMomentumComponent(
+        name=f'__{ticker}', ticker_list=[ticker], tax_config=tax_config, lookback_months=12,
+        max_holdings=1, use_dual_momentum=False, start_date='1980-01-01',
+        money_market_holding=ticker, force_new_data=force_new_data,
+        use_early_replacements=use_early_replacements,
+        day_of_month_for_monthly_data=day_of_month_for_monthly_data
+    )
+    component.run_dual_momentum()
+    return component.panel
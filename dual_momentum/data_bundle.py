@@ -0,0 +1,177 @@
+"""
+Compiles the index CSVs in DATA_PATH/index_data (index replacements like alpha_architect.csv
+and FRED series like TB3MS.csv) into one Arrow IPC file of month-aligned arrays.
+
+Every numeric column of every file becomes one float64 array on a common month axis, with NaN
+for months without a value. At runtime, the bundle gets memory mapped once per process, so
+loading an index doesn't parse any CSV.
+
+The bundle stores the size and modification time of each CSV. If a CSV changed since the
+bundle was compiled (e.g. because newer FRED data was downloaded) or if there is no bundle,
+the CSV gets parsed instead.
+
+Build the bundle (e.g. in the Dockerfile) with
+python -m dual_momentum.data_bundle
+
+>>> load_index_data('eq_reit.csv')['Close']
+1971  12    100.00
+1972  1      98.65
+...
+
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dual_momentum.dm_config import DATA_PATH
+from dual_momentum.panel import month_ordinal, ordinal_to_year_month
+
+INDEX_DATA_PATH = Path(DATA_PATH, 'index_data')
+BUNDLE_PATH = Path(DATA_PATH, 'index_data.arrow')
+
+# memory mapped bundle of this process: ((path, modification time), table, file info)
+_BUNDLE = None
+
+
+def parse_index_csv(file_path: Path) -> pd.DataFrame:
+    """
+    Parses an index CSV into monthly data indexed by (year, month) with the last valid value
+    of each month for every numeric column.
+
+    FRED files (with a DATE column) mark missing values as '.' or 0.
+
+    :param file_path: Path
+    :return: pd.DataFrame
+    """
+
+    raw_data = pd.read_csv(file_path, float_precision='round_trip')
+    is_fred_data = 'DATE' in raw_data.columns
+    dates = pd.to_datetime(raw_data.pop('DATE' if is_fred_data else 'Date'))
+
+    values = raw_data.apply(pd.to_numeric, errors='coerce')
+    values = values.loc[:, values.notna().any()].astype(float)
+    if is_fred_data:
+        values = values.mask(values == 0)
+
+    monthly_data = values.groupby(by=[dates.dt.year.to_numpy(),
+                                      dates.dt.month.to_numpy()]).last()
+    monthly_data.index.names = [None, None]
+    return monthly_data
+
+
+def build_data_bundle(index_data_path: Path = INDEX_DATA_PATH,
+                      bundle_path: Path = BUNDLE_PATH) -> list:
+    """
+    Compiles all CSVs in index_data_path into one bundle
+
+    :param index_data_path: Path
+    :param bundle_path: Path
+    :return: list, names of the compiled files
+    """
+
+    monthly_data = {file_path.name: parse_index_csv(file_path)
+                    for file_path in sorted(Path(index_data_path).glob('*.csv'))}
+    if not monthly_data:
+        raise ValueError(f'No CSVs to compile in {index_data_path}.')
+
+    months = {name: np.array([month_ordinal(year, month) for year, month in df.index])
+              for name, df in monthly_data.items()}
+    first_month = min(file_months.min() for file_months in months.values())
+    n_months = max(file_months.max() for file_months in months.values()) - first_month + 1
+
+    columns = {}
+    files = {}
+    for name, df in monthly_data.items():
+        for column in df.columns:
+            values = np.full(n_months, np.nan)
+            values[months[name] - first_month] = df[column].to_numpy()
+            columns[f'{name}:{column}'] = values
+
+        stat = Path(index_data_path, name).stat()
+        files[name] = {
+            'columns': list(df.columns),
+            'first_month': int(months[name].min()),
+            'last_month': int(months[name].max()),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        }
+
+    batch = pa.RecordBatch.from_arrays([pa.array(values) for values in columns.values()],
+                                       names=list(columns))
+    batch = batch.replace_schema_metadata({'first_month': str(first_month),
+                                           'files': json.dumps(files)})
+    with pa.OSFile(str(bundle_path), 'wb') as sink:
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.close()
+
+    print(f'compiled {len(files)} files into {bundle_path}')
+    return list(files)
+
+
+def load_index_data(file_name: str, index_data_path: Path = INDEX_DATA_PATH,
+                    bundle_path: Path = BUNDLE_PATH) -> pd.DataFrame:
+    """
+    Loads the monthly data of an index CSV from the bundle or, if the CSV is not in the bundle
+    or changed since the bundle was compiled, from the CSV itself. See parse_index_csv
+
+    :param file_name: str, e.g. 'alpha_architect.csv'
+    :param index_data_path: Path
+    :param bundle_path: Path
+    :return: pd.DataFrame
+    """
+
+    file_path = Path(index_data_path, file_name)
+    bundle = get_bundle(bundle_path)
+    if bundle is not None:
+        _, table, files = bundle
+        info = files.get(file_name)
+        stat = file_path.stat() if file_path.exists() else None
+        if info and stat and (stat.st_size, stat.st_mtime_ns) == (info['size'],
+                                                                 info['mtime_ns']):
+            start = info['first_month'] - int(table.schema.metadata[b'first_month'])
+            length = info['last_month'] - info['first_month'] + 1
+            index = pd.MultiIndex.from_tuples([
+                ordinal_to_year_month(month) for month in range(info['first_month'],
+                                                                info['last_month'] + 1)])
+            return pd.DataFrame({
+                column: table.column(f'{file_name}:{column}').chunk(0).slice(start, length
+                                                                            ).to_numpy()
+                for column in info['columns']
+            }, index=index)
+
+    return parse_index_csv(file_path)
+
+
+def get_bundle(bundle_path: Path = BUNDLE_PATH):
+    """
+    Returns the memory mapped bundle, mapping it again if it was compiled again.
+    None if there is no bundle.
+
+    :param bundle_path: Path
+    :return: ((Path, int), pa.Table, dict) or None, the dict has the info of each file
+    """
+
+    global _BUNDLE
+
+    bundle_path = Path(bundle_path)
+    if not bundle_path.exists():
+        return None
+
+    modified_at = bundle_path.stat().st_mtime_ns
+    if _BUNDLE is None or _BUNDLE[0] != (bundle_path, modified_at):
+        # the table references the memory map, which stays open as long as the table is used
+        table = pa.ipc.open_file(pa.memory_map(str(bundle_path))).read_all()
+        _BUNDLE = ((bundle_path, modified_at), table,
+                   json.loads(table.schema.metadata[b'files']))
+    return _BUNDLE
+
+
+if __name__ == '__main__':
+    from dual_momentum.fred_data import download_missing_fred_data
+    download_missing_fred_data()
+    build_data_bundle()
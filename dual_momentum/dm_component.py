@@ -2,10 +2,17 @@ from dual_momentum.rates import load_tbill_rates, get_tax_rates_by_category, get
 from dual_momentum.fred_data import load_fred_data
 from dual_momentum.ticker_data import TickerData
 import re
+import heapq
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from dual_momentum.storage import write_to_redis, read_from_redis
+from dual_momentum.storage import write_to_redis, read_from_redis, get_data_version, \
+    HISTORY_EXPIRATION
+from dual_momentum.dm_engine import calculate_hurdle, select_holdings, calculate_returns, \
+    calculate_position_weights, encode_holdings, decode_holdings, CASH, HOLDING_DTYPE
+from dual_momentum.panel import MonthlyPanel, ordinal_to_year_month, months_checksum
+from dual_momentum.momentum import get_momentum_store
+from dual_momentum.result_schema import COMPONENT_RESULT_COLUMNS, apply_schema, to_result_frame
 
 
 import hashlib
@@ -31,7 +38,7 @@ class DualMomentumComponent:
                tax_config: dict,
                force_new_data: bool = False, use_early_replacements: bool = True,
                day_of_month_for_monthly_data: int = -1,
-                 weight = None,
+                 weight = None, engine: str = 'numpy', holding_weighting: str = 'equal'
                ):
 
         if not use_dual_momentum and len(ticker_list) > 1:
@@ -44,8 +51,11 @@ class DualMomentumComponent:
             raise ValueError(f'ticker_list has to be list, not {type(ticker_list)}.')
         if not isinstance(lookback_months, int):
             raise ValueError(f'lookback_months has to be int, not {type(lookback_months)}.')
-        if max_holdings not in [1,2]:
-            raise ValueError(f'max_holdings has to be 1 or 2 but not {max_holdings}')
+        if not isinstance(max_holdings, int) or max_holdings < 1:
+            raise ValueError(f'max_holdings has to be an int of at least 1 but not {max_holdings}')
+        if holding_weighting not in ['equal', 'momentum']:
+            raise ValueError(f'holding_weighting has to be "equal" or "momentum", not '
+                             f'{holding_weighting}.')
         if not re.match(r'[\d]{4}-[\d]{2}-[\d]{2}', start_date):
             raise ValueError(f'start_date has to be in the format "YYYY-MM-DD", not {start_date}.')
         if not isinstance(money_market_holding, str):
@@ -54,6 +64,8 @@ class DualMomentumComponent:
 
         if not (weight is None or 0 <= weight <= 1):
             raise ValueError(f'weight has to be None or value between 0 and 1, not {weight}.')
+        if engine not in ['numpy', 'python']:
+            raise ValueError(f'engine has to be "numpy" or "python", not {engine}.')
 
         self.name = name
         self.ticker_list = ticker_list
@@ -86,15 +98,19 @@ class DualMomentumComponent:
                 self.ticker_list.append(ticker)
 
 
-        self.max_holdings = max_holdings
-        if len(self.ticker_list) == 1:
-            self.max_holdings = 1
+        # can't hold more tickers than there are
+        self.max_holdings = min(max_holdings, len(self.ticker_list))
+        self.holding_weighting = holding_weighting
 
         # tickerdata config
         self.force_new_data = force_new_data
         self.use_early_replacements = use_early_replacements
         self.day_of_month_for_monthly_data = day_of_month_for_monthly_data
+
+        # both engines produce the same results -> engine is not part of the hash
+        self.engine = engine
         self.df = None
+        self._panel = None
 
 
     def __hash__(self) -> str:
@@ -108,11 +124,98 @@ class DualMomentumComponent:
         string_to_hash = (f'{self.name}{self.ticker_list}{self.lookback_months}{self.max_holdings}'
                     f'{self.start_date}{self.use_dual_momentum}{self.money_market_holding}'
                     f'{self.force_new_data}{self.use_early_replacements}{self.weight}'
-                    f'{self.day_of_month_for_monthly_data}{self.tax_config}')
+                    f'{self.day_of_month_for_monthly_data}{self.tax_config}'
+                    f'{self.holding_weighting}')
         md5 = hashlib.md5(string_to_hash.encode('utf8')).hexdigest()
         return md5
 
 
+    def signal_hash(self) -> str:
+        """
+        Unique identifier for the current signal of a configuration. Unlike __hash__, it does
+        not include the start date, taxes, or weight, which don't change what to hold.
+
+        :return: str
+        """
+        string_to_hash = (f'{self.ticker_list}{self.lookback_months}{self.max_holdings}'
+                          f'{self.use_dual_momentum}{self.holding_weighting}'
+                          f'{self.use_early_replacements}{self.day_of_month_for_monthly_data}')
+        return hashlib.md5(string_to_hash.encode('utf8')).hexdigest()
+
+    def get_current_signal(self) -> dict:
+        """
+        Returns what to hold this month without running a backtest. Only reads the last
+        lookback_months + 12 months of monthly prices from the shared momentum store.
+
+        >>> dmc.get_current_signal()
+        {'name': 'equities', 'month': (2020, 6), 'holdings': ['VTI'], 'weights': [1.0],
+         'momentum': {'VTI': 1.08, 'QQQ': 1.04, 'IEFA': 0.97}, 'hurdle': 1.0008}
+
+        :return: dict
+        """
+
+        key = f'signal_{self.signal_hash()}_{get_data_version()}'
+        if not self.force_new_data:
+            signal = read_from_redis(key=key)
+            if signal is not None:
+                signal['name'] = self.name
+                return signal
+
+        # the momentum store is shared by all components -> only the last months get read
+        momentum_store = get_momentum_store(
+            tickers=self.ticker_list, use_early_replacements=self.use_early_replacements,
+            day_of_month_for_monthly_data=self.day_of_month_for_monthly_data,
+            force_new_data=self.force_new_data)
+        last_month = momentum_store.last_month
+        n_months = self.lookback_months + 12
+        first_month = last_month - n_months + 1
+
+        adj_close = np.column_stack([
+            momentum_store.prices(ticker, first_month, n_months)[1]
+            for ticker in self.ticker_list
+        ])
+        tbil_rate = load_fred_data('tbil_rate', return_type='panel').column(
+            'index', last_month, 1)[0]
+
+        signal = self.evaluate_signal(adj_close, (tbil_rate / 100) ** (1 / 12),
+                                      ordinal_to_year_month(last_month))
+        write_to_redis(key=key, value=signal, expiration=3600)
+        return signal
+
+    def evaluate_signal(self, adj_close: np.ndarray, tbil_performance_pretax: float,
+                        month: tuple) -> dict:
+        """
+        Selects the holdings for the last month of adj_close, the same way as the simulation.
+
+        :param adj_close: np.ndarray (months x tickers), at least lookback_months + 1 months
+        :param tbil_performance_pretax: float, t-bill performance of the last month
+        :param month: tuple, (year, month) of the last month
+        :return: dict
+        """
+
+        momentum = adj_close[-1:] / adj_close[-1 - self.lookback_months]
+        hurdle = calculate_hurdle(np.array([tbil_performance_pretax]), self.lookback_months)
+
+        if self.use_dual_momentum:
+            holdings = select_holdings(momentum, hurdle, self.max_holdings)
+            weights = calculate_position_weights(momentum, hurdle, holdings,
+                                                 self.holding_weighting)[0]
+            holdings = decode_holdings(holdings, self.ticker_list)[0]
+            # only CASH -> one position
+            weights = weights[:len(holdings)] if holdings != ['CASH'] else [1.0]
+        else:
+            holdings = self.ticker_list
+            weights = [1.0]
+
+        return {
+            'name': self.name,
+            'month': month,
+            'holdings': holdings,
+            'weights': [float(w) for w in weights],
+            'momentum': {ticker: float(m) for ticker, m in zip(self.ticker_list, momentum[0])},
+            'hurdle': float(hurdle[0])
+        }
+
     def run_dual_momentum(self):
         """
         Runs a dual-momentum backtest
@@ -122,6 +225,7 @@ class DualMomentumComponent:
         """
 
         self.df = None
+        self.panel = None
         if not self.force_new_data:
             self.df = read_from_redis(key=self.__hash__())
 
@@ -130,59 +234,436 @@ class DualMomentumComponent:
             return self.df
 
         else:
-            # initialize df with tbil rates
-            tbil_df = load_fred_data('tbil_rate', return_type='df')
-            self.df = TickerData('ONES').data_monthly
-            self.df.drop(['Close', 'Adj Close'], inplace=True, axis=1)
-            self.df['tbil_rate'] = tbil_df['index']
-            self.df['tbil_rate'] += 100
-            self.df['tbil_performance_pretax'] = (self.df['tbil_rate'] / 100) ** (1 / 12)
-
-            # we're calculating momentum after taxes, so tbils should be compared on a posttax
-            # basis. I don't have data on tbil cap gains bet it seems reasonable to assume that
-            # they are close to 0.
-            self.df['tbil_performance_posttax'] = 1 + \
-                (self.df['tbil_performance_pretax'] - 1) * \
-                (1 - self.tax_rates_by_ticker['TBIL']['INCOME'])
-            self.df['holding'] = ''
-            self.df['cap_gains'] = 0.0
-            self.df['div_gains'] = 0.0
-
-            self.df['performance_pretax'] = 1.0
-            self.df['taxes'] = 0.0
-            self.df['performance_posttax'] = 1.0
-            self.df['cash_portion'] = 0.0
-
-            if self.money_market_holding != 'TBIL':
-                self.add_ticker_to_df(self.money_market_holding)
+            self.prepare_panel()
 
-            for ticker in self.ticker_list:
-                self.add_ticker_to_df(ticker)
+            # only simulate the new months if an earlier simulation is available
+            if not self.extend_from_history():
+                if self.engine == 'numpy':
+                    self.run_vectorized_simulation()
+                else:
+                    self.run_python_simulation()
 
-            # store df as dict for better performance on row-based tasks
-            self.df_as_dict = self.df.to_dict('index')
-            self.df_indexes = list(self.df.index)
+            self.store_results()
 
-            # identify the holdings for each month
-            self.identify_holdings_by_month()
+        return self.df
 
-            # calculate the returns based on the holdings
-            self.calculate_returns_based_on_holdings()
+    def store_results(self):
+        """
+        Keeps only the results, not the intermediate columns, and caches them.
+        The results also get stored as history, which later runs can extend by new months,
+        together with a checksum of the inputs of the months that get kept when extending.
 
-            # finally turn the dict back into a df
-            self.df = pd.DataFrame.from_dict(self.df_as_dict, orient='index')
+        :return:
+        """
+        input_checksum = self.get_input_checksum(len(self.panel) - 1)
+        self.df = to_result_frame(self.panel, self.result_schema)
+        self.panel = apply_schema(self.panel, self.result_schema)
 
-            write_to_redis(key=self.__hash__(), value=self.df, expiration=3600)
+        write_to_redis(key=self.__hash__(), value=self.df, expiration=3600)
+        write_to_redis(key=f'history_{self.__hash__()}',
+                       value={'results': self.df, 'input_checksum': input_checksum},
+                       expiration=HISTORY_EXPIRATION)
 
-        return self.df
+    def extend_from_history(self) -> bool:
+        """
+        Loads the history of an earlier simulation and extends it to the months of the
+        prepared panel.
+
+        :return: bool, True if the simulation was extended
+        """
+        if self.force_new_data:
+            return False
+
+        history = read_from_redis(key=f'history_{self.__hash__()}')
+        if not isinstance(history, dict):
+            return False
+        return self.extend_simulation(MonthlyPanel.from_frame(history['results']),
+                                      input_checksum=history['input_checksum'])
+
+    def extend_simulation(self, history: MonthlyPanel, input_checksum: str = None) -> bool:
+        """
+        Extends the results of an earlier simulation to the months of the prepared panel.
+
+        The last month of the history was simulated with the prices of an unfinished month.
+        Hence, its holdings and the returns of the last two months get recalculated. Holding
+        periods only matter up to 12 months, so returns get recalculated on a window that
+        starts 12 months earlier.
+
+        If the prices or t-bill rates of the months that get kept changed since the history was
+        simulated (e.g. because yahoo restated a ticker or FRED revised a rate), the history
+        can't be extended.
+
+        :param history: MonthlyPanel with the results of an earlier simulation
+        :param input_checksum: str, see get_input_checksum. None -> not checked
+        :return: bool, True if the simulation was extended
+        """
+
+        n_history = len(history)
+        if (history.first_month != self.panel.first_month or n_history < 2 or
+                n_history > len(self.panel) or
+                not all(column in history for column in self.result_schema)):
+            return False
+        if input_checksum is not None and \
+                input_checksum != self.get_input_checksum(n_history - 1):
+            return False
+
+        # months from start get recalculated, window is needed for the holding periods
+        start = n_history - 2
+        window = max(start - 12, 0)
+
+        close, adj_close = self.get_price_arrays()
+        holdings = np.column_stack([history[column] for column in self.holding_columns])
+        if self.use_dual_momentum:
+            momentum, hurdle = self.get_momentum_arrays()
+            new_holdings = select_holdings(momentum[start + 1:], hurdle[start + 1:],
+                                           self.max_holdings)
+            holdings = np.concatenate([holdings[:start + 1], new_holdings])
+            position_weights = calculate_position_weights(
+                momentum[window:], hurdle[window:], holdings[window:], self.holding_weighting)
+        else:
+            holdings = np.zeros((len(self.panel), 1), dtype=int)
+            position_weights = None
+
+        window_results = calculate_returns(
+            close=close[window:], adj_close=adj_close[window:], holdings=holdings[window:],
+            position_weights=position_weights, **self.get_tax_rate_arrays())
+
+        results = {}
+        for column, values in window_results.items():
+            if column in history:
+                results[column] = np.concatenate([history[column][:start],
+                                                  values[start - window:]])
+        self.store_simulation_results(holdings, results)
+        return True
+
+    def get_input_checksum(self, n_months: int) -> str:
+        """
+        Returns a checksum of the t-bill rates, prices and momentum of the first n_months of
+        the prepared panel, see extend_simulation.
+
+        :param n_months: int
+        :return: str
+        """
+        columns = [self.panel['tbil_performance_pretax'], self.panel['tbil_performance_posttax']]
+        for ticker in self.ticker_list:
+            for column in [f'{ticker}_close', f'{ticker}_adj_close', f'{ticker}_pretax_mom']:
+                if column in self.panel:
+                    columns.append(self.panel[column])
+        return months_checksum(columns, n_months)
+
+    def prepare_panel(self):
+        """
+        Initializes the panel with t-bill rates and adds prices and momentum for all tickers
+
+        :return:
+        """
+
+        # initialize panel with tbil rates
+        ones = TickerData('ONES').panel_monthly
+        self.panel = MonthlyPanel(first_month=ones.first_month, n_months=len(ones))
+        self.panel.align(load_fred_data('tbil_rate', return_type='panel'),
+                         columns={'index': 'tbil_rate'})
+        self.panel['tbil_performance_pretax'] = (self.panel['tbil_rate'] / 100) ** (1 / 12)
+
+        # we're calculating momentum after taxes, so tbils should be compared on a posttax
+        # basis. I don't have data on tbil cap gains bet it seems reasonable to assume that
+        # they are close to 0.
+        self.panel['tbil_performance_posttax'] = 1 + \
+            (self.panel['tbil_performance_pretax'] - 1) * \
+            (1 - self.tax_rates_by_ticker['TBIL']['INCOME'])
+        self.panel['cap_gains'] = 0.0
+        self.panel['div_gains'] = 0.0
+
+        self.panel['performance_pretax'] = 1.0
+        self.panel['taxes'] = 0.0
+        self.panel['performance_posttax'] = 1.0
+        self.panel['cash_portion'] = 0.0
+
+        tickers_to_add = self.ticker_list
+        if self.money_market_holding != 'TBIL':
+            tickers_to_add = [self.money_market_holding] + tickers_to_add
+        self.momentum_store = get_momentum_store(
+            tickers=tickers_to_add, use_early_replacements=self.use_early_replacements,
+            day_of_month_for_monthly_data=self.day_of_month_for_monthly_data,
+            force_new_data=self.force_new_data)
+
+        if self.money_market_holding != 'TBIL':
+            self.add_ticker_to_panel(self.money_market_holding)
+
+        for ticker in self.ticker_list:
+            self.add_ticker_to_panel(ticker)
+
+    @property
+    def panel(self) -> MonthlyPanel:
+        """
+        Simulation results as a MonthlyPanel. Gets created from the df if the simulation was
+        loaded from redis.
+
+        :return: MonthlyPanel
+        """
+        if self._panel is None and self.df is not None:
+            self._panel = MonthlyPanel.from_frame(self.df)
+        return self._panel
+
+    @panel.setter
+    def panel(self, panel: MonthlyPanel):
+        self._panel = panel
+
+    def run_python_simulation(self):
+        """
+        Identifies the holdings and calculates the returns month by month.
+
+        :return:
+        """
+
+        # store df as dict for better performance on row-based tasks
+        self.df = self.panel.to_frame()
+        self.df_as_dict = self.df.to_dict('index')
+        self.df_indexes = list(self.df.index)
+
+        # identify the holdings for each month
+        self.identify_holdings_by_month()
+
+        # calculate the returns based on the holdings
+        self.calculate_returns_based_on_holdings()
+
+        # finally turn the dict back into a df and encode the holdings
+        self.df = pd.DataFrame.from_dict(self.df_as_dict, orient='index')
+        holdings = encode_holdings(list(self.df.pop('holding')), self.ticker_list,
+                                   len(self.holding_columns))
+        self.panel = MonthlyPanel.from_frame(self.df)
+        self.store_simulation_results(holdings, {})
+
+    def run_vectorized_simulation(self):
+        """
+        Identifies the holdings and calculates the returns for all months at once on
+        (months x tickers) arrays. Produces the same results as identify_holdings_by_month and
+        calculate_returns_based_on_holdings.
+
+        :return:
+        """
+
+        close, adj_close = self.get_price_arrays()
+        if self.use_dual_momentum:
+            momentum, hurdle = self.get_momentum_arrays()
+            holdings = select_holdings(momentum, hurdle, self.max_holdings)
+            position_weights = calculate_position_weights(momentum, hurdle, holdings,
+                                                          self.holding_weighting)
+        else:
+            holdings = np.zeros((len(self.panel), 1), dtype=int)
+            position_weights = None
 
+        results = calculate_returns(close=close, adj_close=adj_close, holdings=holdings,
+                                    position_weights=position_weights,
+                                    **self.get_tax_rate_arrays())
+        self.store_simulation_results(holdings, results)
+
+    @classmethod
+    def run_variants(cls, variants: list, **kwargs) -> list:
+        """
+        Runs multiple parameter variants of one component, e.g. different lookback_months or
+        max_holdings for the same ticker_list. Prices get loaded once and all uncached variants
+        get simulated together as stacked (variant x months x tickers) arrays. Variants with
+        different prices (e.g. a different day_of_month_for_monthly_data) get simulated in
+        separate batches.
+
+        >>> components = DualMomentumComponent.run_variants(
+        ...     variants=[{'lookback_months': 6, 'max_holdings': 1},
+        ...               {'lookback_months': 12, 'max_holdings': 2}],
+        ...     name='equities', ticker_list=['VTI', 'QQQ', 'IEFA'], start_date='1980-01-01',
+        ...     use_dual_momentum=True, money_market_holding='VGIT', tax_config=tax_config)
+
+        :param variants: list of dicts with arguments that differ between the variants
+        :param kwargs: arguments shared by all variants
+        :return: list of DualMomentumComponents with simulation results, one per variant
+        """
+
+        for variant in variants:
+            if 'ticker_list' in variant or 'tax_config' in variant:
+                raise ValueError('Variants have to share ticker_list and tax_config. Pass them '
+                                 'as keyword arguments.')
+
+        components = [cls(**{**kwargs, **variant}) for variant in variants]
+
+        to_simulate = []
+        for component in components:
+            component.df = None
+            component.panel = None
+            if not component.force_new_data:
+                component.df = read_from_redis(key=component.__hash__())
+            if component.df is None:
+                to_simulate.append(component)
+
+        if not to_simulate:
+            return components
+
+        for component in to_simulate:
+            component.prepare_panel()
+
+        # variants with an earlier simulation only need to simulate the new months
+        to_batch = [c for c in to_simulate if not c.extend_from_history()]
+        for batch in cls.batch_variants(to_batch):
+            cls.simulate_variants(batch)
+
+        for component in to_simulate:
+            component.store_results()
+
+        return components
+
+    @staticmethod
+    def batch_variants(components: list) -> list:
+        """
+        Groups components into batches that can be simulated together, i.e. that share their
+        prices (see price_config) and tax rates.
+
+        :param components: list of DualMomentumComponents
+        :return: list of lists of DualMomentumComponents
+        """
+        batches = {}
+        for component in components:
+            key = (component.price_config, str(component.tax_config))
+            batches.setdefault(key, []).append(component)
+        return list(batches.values())
+
+    @staticmethod
+    def simulate_variants(components: list):
+        """
+        Simulates components that share their prices and tax rates at once. Their panels
+        need to be prepared (see prepare_panel).
+
+        :param components: list of DualMomentumComponents
+        :return:
+        """
+
+        if len(DualMomentumComponent.batch_variants(components)) > 1:
+            raise ValueError('Only variants with the same ticker_list, tax_config, '
+                             'use_early_replacements, day_of_month_for_monthly_data and '
+                             'force_new_data can be simulated together.')
+
+        # all variants share one ticker_list -> the same prices
+        close, adj_close = components[0].get_price_arrays()
+        n_months = len(components[0].panel)
+
+        # buy and hold variants have a single position
+        n_positions = [c.max_holdings if c.use_dual_momentum else 1 for c in components]
+        max_positions = max(n_positions)
+        holdings = np.full((len(components), n_months, max_positions), CASH)
+        # positions beyond a variant's max_holdings do not exist (weight 0)
+        position_weights = np.zeros((len(components), n_months, max_positions))
+
+        dm_variants = [idx for idx, c in enumerate(components) if c.use_dual_momentum]
+        if dm_variants:
+            momentum_arrays = [components[idx].get_momentum_arrays() for idx in dm_variants]
+            holdings[dm_variants] = select_holdings(np.stack([m for m, _ in momentum_arrays]),
+                                                    np.stack([h for _, h in momentum_arrays]),
+                                                    max_positions)
+            for idx, (momentum, hurdle) in zip(dm_variants, momentum_arrays):
+                n = n_positions[idx]
+                holdings[idx, :, n:] = CASH
+                position_weights[idx, :, :n] = calculate_position_weights(
+                    momentum, hurdle, holdings[idx, :, :n], components[idx].holding_weighting)
+
+        for idx, component in enumerate(components):
+            if not component.use_dual_momentum:
+                holdings[idx, :, 0] = 0
+                position_weights[idx, :, 0] = 1.0
+
+        results = calculate_returns(close=close, adj_close=adj_close, holdings=holdings,
+                                    position_weights=position_weights,
+                                    **components[0].get_tax_rate_arrays())
+
+        for idx, component in enumerate(components):
+            component.store_simulation_results(
+                holdings[idx, :, :n_positions[idx]],
+                {column: values[idx] for column, values in results.items()})
+
+    @property
+    def price_config(self) -> tuple:
+        """
+        Settings that determine the prices in the prepared panel. Components with different
+        price configs can't be simulated together (see simulate_variants).
+
+        :return: tuple
+        """
+        return (tuple(self.ticker_list), self.use_early_replacements,
+                self.day_of_month_for_monthly_data, self.force_new_data)
+
+    def get_price_arrays(self) -> tuple:
+        """
+        Returns close and adj close prices as (months x tickers) arrays
+
+        :return: (np.ndarray, np.ndarray)
+        """
+        close = np.column_stack([self.panel[f'{t}_close'] for t in self.ticker_list])
+        adj_close = np.column_stack([self.panel[f'{t}_adj_close'] for t in self.ticker_list])
+        return close, adj_close
+
+    def get_momentum_arrays(self) -> tuple:
+        """
+        Returns the momentum as (months x tickers) array and the hurdle the momentum needs to
+        beat as (months) array.
+
+        :return: (np.ndarray, np.ndarray)
+        """
+        momentum = np.column_stack([self.panel[f'{t}_pretax_mom'] for t in self.ticker_list])
+        hurdle = calculate_hurdle(self.panel['tbil_performance_pretax'], self.lookback_months)
+        return momentum, hurdle
+
+    def get_tax_rate_arrays(self) -> dict:
+        """
+        Returns the tax rates by ticker as arrays in the order of the ticker_list
+
+        :return: dict
+        """
+        rates = [self.tax_rates_by_ticker[t] for t in self.ticker_list]
+        return {
+            'st_gains_rates': np.array([r['ST_GAINS'] for r in rates]),
+            'lt_gains_rates': np.array([r['LT_GAINS'] for r in rates]),
+            'income_rates': np.array([r['INCOME'] for r in rates])
+        }
+
+    def store_simulation_results(self, holdings: np.ndarray, results: dict):
+        """
+        Stores the holdings and the results of calculate_returns in the panel
+
+        :param holdings: np.ndarray (months x positions) of ticker indexes
+        :param results: dict of np.ndarrays
+        :return:
+        """
+        for column, values in results.items():
+            self.panel[column] = values
+
+        for position, column in enumerate(self.holding_columns):
+            self.panel[column] = holdings[:, position].astype(HOLDING_DTYPE)
+
+    @property
+    def result_schema(self) -> dict:
+        """
+        Columns and dtypes of the simulation results that get cached (see result_schema.py)
+
+        :return: dict
+        """
+        schema = dict(COMPONENT_RESULT_COLUMNS)
+        schema.update({column: HOLDING_DTYPE for column in self.holding_columns})
+        return schema
+
+    @property
+    def holding_columns(self) -> list:
+        """
+        Names of the holding columns, one per position, e.g. ['holding_0', 'holding_1'].
+        They store indexes into ticker_list, CASH is -1 (see dm_engine.decode_holdings).
+
+        :return: list
+        """
+        n_positions = self.max_holdings if self.use_dual_momentum else 1
+        return [f'holding_{position}' for position in range(n_positions)]
 
     def identify_holdings_by_month(self):
         """
         For each month, finds and stores the tickers with the best momentum.
         If buy and hold -> only store that one ticker
-        if low momentum -> 1 or both holdings are CASH
-        else: tow tickers
+        if no ticker beats the hurdle -> ['CASH']
+        else: the max_holdings best tickers, positions that cannot be filled are CASH
         """
 
         # pandas dataframes are slow with df.iterrows. It's much faster to turn the df into
@@ -217,17 +698,13 @@ class DualMomentumComponent:
                 self.df_as_dict[date]['holding'] = self.ticker_list
             elif len(momentums) == 0:
                 self.df_as_dict[date]['holding'] = ['CASH']
-            elif len(momentums) == 1:
-                if self.max_holdings == 1:
-                    self.df_as_dict[date]['holding'] = [list(momentums)[0]]
-                else:
-                    self.df_as_dict[date]['holding'] = [list(momentums)[0], 'CASH']
             else:
-                sorted_moms = sorted(momentums.items(), key=lambda x: x[1], reverse=True)
-                if self.max_holdings == 1:
-                    self.df_as_dict[date]['holding'] = [sorted_moms[0][0]]
-                else:
-                    self.df_as_dict[date]['holding'] = [sorted_moms[0][0], sorted_moms[1][0]]
+                # only the best max_holdings tickers are needed, no need to sort all of them
+                best = heapq.nlargest(self.max_holdings, momentums.items(), key=lambda x: x[1])
+                holding = [ticker for ticker, _ in best]
+                # every position without a ticker beating the hurdle is CASH
+                holding += ['CASH'] * (self.max_holdings - len(holding))
+                self.df_as_dict[date]['holding'] = holding
 
     def calculate_returns_based_on_holdings(self):
         """
@@ -249,126 +726,90 @@ class DualMomentumComponent:
                 # self.df.at[date, 'performance_posttax'] = 1.0
                 continue
 
-            holding1 = row['holding'][0]
-            if len(row['holding']) > 1:
-                holding2 = row['holding'][1]
-            else:
-                holding2 = None
-
-            if holding2 and holding2 == 'CASH':
-                self.df_as_dict[date]['cash_portion'] = 0.5
-                # self.df.at[date, 'cash_portion'] = 0.5
+            weights = self.get_holding_weights(row)
+            self.df_as_dict[date]['cash_portion'] = float(sum(
+                weight for ticker, weight in zip(row['holding'], weights) if ticker == 'CASH'))
 
             # break at last row (we don't know the returns yet)
             if idx + 1 == len(self.df_as_dict):
                 break
 
-            # process holding 1
             next_month_date = self.df_indexes[idx+1]
-
-            h1_next_month_close = self.df_as_dict[next_month_date][f'{holding1}_close']
-            # h1_next_month_close = self.df.at[next_month_date, f'{holding1}_close']
-            h1_next_month_adj_close = self.df_as_dict[next_month_date][f'{holding1}_adj_close']
-            # h1_next_month_adj_close = self.df.at[next_month_date, f'{holding1}_adj_close']
-
-
-            cap_gains = h1_next_month_close / row[f'{holding1}_close'] - 1
-            total_gains = h1_next_month_adj_close / row[f'{holding1}_adj_close'] - 1
-            div_gains = total_gains - cap_gains
-
-            h1_months_held = self.determine_holding_period(holding1, idx)
-            if h1_months_held >= 12:
-                taxes = cap_gains * self.tax_rates_by_ticker[holding1]['LT_GAINS']
-            else:
-                taxes = cap_gains * self.tax_rates_by_ticker[holding1]['ST_GAINS']
-            taxes += div_gains * self.tax_rates_by_ticker[holding1]['INCOME']
-
-            if holding2:
-                if holding2 == 'CASH':
-                    div_gains = div_gains * 0.5     # div_gains are just div_gains from h1
-                    cap_gains = cap_gains * 0.5     # now, we're holding 50% cash -> only 50% gains
-                    taxes = taxes * 0.5
-                    self.df_as_dict[date]['cash_portion'] = 0.5
-                    # self.df.at[date, 'cash_portion'] = 0.5
-
+            div_gains = 0.0
+            cap_gains = 0.0
+            taxes = 0.0
+            for ticker, weight in zip(row['holding'], weights):
+                if ticker == 'CASH':
+                    continue
+
+                next_month_close = self.df_as_dict[next_month_date][f'{ticker}_close']
+                next_month_adj_close = self.df_as_dict[next_month_date][f'{ticker}_adj_close']
+                ticker_cap_gains = next_month_close / row[f'{ticker}_close'] - 1
+                ticker_total_gains = next_month_adj_close / row[f'{ticker}_adj_close'] - 1
+                ticker_div_gains = ticker_total_gains - ticker_cap_gains
+
+                months_held = self.determine_holding_period(ticker, idx)
+                if months_held >= 12:
+                    ticker_taxes = ticker_cap_gains * self.tax_rates_by_ticker[ticker]['LT_GAINS']
                 else:
-                    # h2_next_month_close = self.df.at[next_month_date, f'{holding2}_close']
-                    h2_next_month_close = self.df_as_dict[next_month_date][f'{holding2}_close']
-                    # h2_next_month_adj_close = self.df.at[next_month_date,
-                    #                                      f'{holding2}_adj_close']
-                    h2_next_month_adj_close = self.df_as_dict[next_month_date][
-                                                              f'{holding2}_adj_close']
-                    h2_cap_gains = h2_next_month_close / row[f'{holding2}_close'] - 1
-                    h2_total_gains = h2_next_month_adj_close / row[f'{holding2}_adj_close'] - 1
-                    h2_div_gains = h2_total_gains - h2_cap_gains
-
-                    h2_months_held = self.determine_holding_period(holding2, idx)
-                    if h2_months_held >= 12:
-                        h2_taxes = h2_cap_gains * self.tax_rates_by_ticker[holding2]['LT_GAINS']
-                    else:
-                        h2_taxes = h2_cap_gains * self.tax_rates_by_ticker[holding2]['ST_GAINS']
-
-                    h2_taxes += h2_div_gains * self.tax_rates_by_ticker[holding2]['INCOME']
-
-                    # with 2 non-cash holdings, gains and taxes are averaged.
-                    div_gains = div_gains * 0.5 + h2_div_gains * 0.5
-                    cap_gains = cap_gains * 0.5 + h2_cap_gains * 0.5
-                    taxes = taxes * 0.5 + h2_taxes * 0.5
+                    ticker_taxes = ticker_cap_gains * self.tax_rates_by_ticker[ticker]['ST_GAINS']
+                ticker_taxes += ticker_div_gains * self.tax_rates_by_ticker[ticker]['INCOME']
+
+                # gains and taxes are weighted by the share of each holding
+                div_gains += ticker_div_gains * weight
+                cap_gains += ticker_cap_gains * weight
+                taxes += ticker_taxes * weight
 
             # finally, add the data to the dataframe
-            # self.df.at[date, 'div_gains'] = div_gains
-            # self.df.at[date, 'cap_gains'] = cap_gains
-            # self.df.at[date, 'taxes'] = taxes
-            # self.df.at[date, 'performance_pretax'] = cap_gains + div_gains + 1
-            # self.df.at[date, 'performance_posttax'] = cap_gains + div_gains - taxes + 1
             self.df_as_dict[date]['div_gains'] = div_gains
             self.df_as_dict[date]['cap_gains'] = cap_gains
             self.df_as_dict[date]['taxes'] = taxes
             self.df_as_dict[date]['performance_pretax'] = cap_gains + div_gains + 1
             self.df_as_dict[date]['performance_posttax'] = cap_gains + div_gains - taxes + 1
 
-    def add_ticker_to_df(self, ticker):
+    def get_holding_weights(self, row: dict) -> list:
+        """
+        Returns the share of the portfolio in each holding of a month.
+        See dm_engine.calculate_position_weights
+
+        :param row: dict
+        :return: list
+        """
+
+        holding = row['holding']
+        equal_weights = [1 / len(holding)] * len(holding)
+        if self.holding_weighting == 'equal' or not self.use_dual_momentum:
+            return equal_weights
+
+        hurdle = (row['tbil_performance_pretax'] - 1) * self.lookback_months / 12 + 1
+        excess = [0.0 if t == 'CASH' else row[f'{t}_pretax_mom'] - hurdle for t in holding]
+        total_excess = sum(excess)
+        if not total_excess > 0:
+            return equal_weights
+
+        invested = len([t for t in holding if t != 'CASH']) / len(holding)
+        return [1 / len(holding) if t == 'CASH' else invested * e / total_excess
+                for t, e in zip(holding, excess)]
+
+    def add_ticker_to_panel(self, ticker):
         """
-        Adds a ticker to the dataframe
+        Adds a ticker to the panel. Prices and momentum get looked up from the momentum store
         :param ticker: str
         :return:
         """
 
-        new_stock = TickerData(ticker=ticker, use_early_replacements=self.use_early_replacements,
-                               day_of_month_for_monthly_data=self.day_of_month_for_monthly_data,
-                               force_new_data=self.force_new_data,
-                               ).data_monthly
-
-        new_stock['cap_gains'] = new_stock['Close'].shift(-1) / new_stock['Close']
-        new_stock['total_gains'] = new_stock['Adj Close'].shift(-1) / new_stock['Adj Close']
-        new_stock['div_gains'] = new_stock['total_gains'] - new_stock['cap_gains'] + 1
-
-        # capital gains, total gains, dividend gains during duration.
-        new_stock['cap_dur'] = new_stock['Close'] / new_stock['Close'].shift(self.lookback_months)
-        new_stock['total_dur'] = (new_stock['Adj Close'] /
-                                     new_stock['Adj Close'].shift(self.lookback_months))
-        new_stock['div_dur'] = new_stock['total_dur'] - new_stock['cap_dur']
-
-        st = 1 - self.tax_rates_by_ticker[ticker]['ST_GAINS']
-        lt = 1 - self.tax_rates_by_ticker[ticker]['LT_GAINS']
-        div = 1 - self.tax_rates_by_ticker[ticker]['INCOME']
-
-        # ST momentum = capital gains + dividends. Tax cap gains only if greater than 1
-        new_stock['st_mom'] = np.where(new_stock['cap_dur'] <= 1.0,
-                                       new_stock['cap_dur'],
-                                       (new_stock['cap_dur'] - 1) * st + 1)
-        new_stock['st_mom'] += new_stock['div_dur'] * div
-        new_stock['lt_mom'] = np.where(new_stock['cap_dur'] <= 1.0,
-                                       new_stock['cap_dur'],
-                                       (new_stock['cap_dur'] - 1) * lt + 1)
-        new_stock['lt_mom'] += new_stock['div_dur'] * div
-
-        # add to main df for component
-        self.df[f'{ticker}_adj_close'] = new_stock['Adj Close']
-        self.df[f'{ticker}_close'] = new_stock['Close']
-        self.df[f'{ticker}_st_mom'] = new_stock['st_mom']
-        self.df[f'{ticker}_lt_mom'] = new_stock['lt_mom']
-        self.df[f'{ticker}_pretax_mom'] = new_stock['total_dur']
+        first_month, n_months = self.panel.first_month, len(self.panel)
+        close, adj_close = self.momentum_store.prices(ticker, first_month, n_months)
+        st_mom, lt_mom = self.momentum_store.tax_adjusted_momentum(
+            ticker, self.lookback_months, self.tax_rates_by_ticker[ticker], first_month, n_months)
+
+        # add to main panel for component
+        self.panel[f'{ticker}_adj_close'] = adj_close
+        self.panel[f'{ticker}_close'] = close
+        self.panel[f'{ticker}_st_mom'] = st_mom
+        self.panel[f'{ticker}_lt_mom'] = lt_mom
+        self.panel[f'{ticker}_pretax_mom'] = self.momentum_store.pretax_momentum(
+            ticker, self.lookback_months, first_month, n_months)
 
     def determine_holding_period(self, ticker: str, idx : int) -> int:
         """
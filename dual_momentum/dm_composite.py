@@ -1,17 +1,45 @@
 from dual_momentum.dm_component import DualMomentumComponent
+from dual_momentum.fetcher import fetch_tickers
+from dual_momentum.benchmarks import get_benchmark
 from IPython import embed
 from dual_momentum.fred_data import load_fred_data
 import numpy as np
 import pandas as pd
 import hashlib
+import json
 from pathlib import Path
 from dual_momentum.ticker_config import TICKER_CONFIG
 from dual_momentum.ticker_data import TickerData
-import multiprocessing
 import datetime
 import time
 
-from dual_momentum.storage import write_to_redis, read_from_redis
+from dual_momentum.storage import write_to_redis, read_from_redis, HISTORY_EXPIRATION
+from dual_momentum.dm_engine import calculate_leveraged_ledger, CASH
+from dual_momentum.dm_metrics import calculate_metrics, calculate_window_metrics, \
+    calculate_rolling_metrics
+from dual_momentum.panel import MonthlyPanel, months_checksum
+from dual_momentum.result_schema import COMPOSITE_RESULT_COLUMNS, apply_schema, to_result_frame, \
+    to_arrow_ipc
+
+#TODO: implement other money market holding options
+# money market holdings that the cash portion gets invested in
+INVESTED_MONEY_MARKET_HOLDINGS = ['SHY', 'VGIT', 'IEF', 'TLT', 'BOND', 'BND', 'ONES']
+
+# sections of the results summary, each cached separately. monthly_data is by far the largest.
+# Optional sections only get generated if they are requested explicitly.
+# the monthly data is the most expensive section and gets loaded after the headline metrics
+DEFAULT_SUMMARY_SECTIONS = ['metrics', 'correlations']
+SUMMARY_SECTIONS = DEFAULT_SUMMARY_SECTIONS + ['monthly_data', 'start_dates', 'rolling']
+# windows in months of the rolling section
+ROLLING_WINDOWS = [12, 36, 60]
+# (name, tax_type) of the series in the metrics section
+SUMMARY_SERIES = [(name, tax_type) for name in ['strategy', 'sp500']
+                  for tax_type in ['pretax', 'posttax']]
+
+# number of weightings that sweep_weights runs through the ledger at once
+SWEEP_CHUNK_SIZE = 1000
+# number of paths that run_block_bootstrap runs through the ledger at once
+BOOTSTRAP_CHUNK_SIZE = 1000
 
 
 class DualMomentumComposite:
@@ -52,7 +80,8 @@ class DualMomentumComposite:
                 lookback_months=part['lookback_months'], max_holdings=part['max_holdings'],
                 use_dual_momentum=part['use_dual_momentum'], start_date=start_date,
                 money_market_holding=money_market_holding, weight=part['weight'],
-                force_new_data=force_new_data
+                force_new_data=force_new_data,
+                holding_weighting=part.get('holding_weighting', 'equal')
             )
             self.components.append(component)
 
@@ -73,6 +102,8 @@ class DualMomentumComposite:
 
         self.simulation_finished = False
         self.summary = None
+        self.df = None
+        self._panel = None
 
     def __hash__(self) -> str:
         """
@@ -89,6 +120,22 @@ class DualMomentumComposite:
         md5 = hashlib.md5(string_to_hash.encode('utf8')).hexdigest()
         return md5
 
+    @property
+    def panel(self) -> MonthlyPanel:
+        """
+        Simulation results as a MonthlyPanel. Gets created from the df if the simulation was
+        loaded from redis.
+
+        :return: MonthlyPanel
+        """
+        if self._panel is None and self.df is not None:
+            self._panel = MonthlyPanel.from_frame(self.df)
+        return self._panel
+
+    @panel.setter
+    def panel(self, panel: MonthlyPanel):
+        self._panel = panel
+
     # @property
     # def file_path(self):
     #     """
@@ -103,54 +150,23 @@ class DualMomentumComposite:
         """
         Preload all necessary ticker data in parallel
 
-        Loading ticker data one after another is slow--each one takes 1-2 seconds -> by just
-        loading all at the beginning as separate processes, we get all the data in 1-2 seconds
+        Loading ticker data one after another is slow--each one takes 1-2 seconds -> the
+        tickers of all components, the benchmarks and their early replacements that are not
+        cached yet get downloaded by a pool of threads before the simulation starts.
 
-        :return:
+        :return: dict, {ticker: seconds it took to fetch}
         """
 
-        tickers_to_init = {'TLT', 'VUSTX', 'VWESX', 'VGIT', 'VFITX', 'FGOVX', 'SPY',
-                           'VFINX', self.money_market_holding}
-
+        tickers = ['SPY', self.money_market_holding, 'ONES']
         for component in self.components:
-            for ticker in component.ticker_list:
-
-                tickers_to_init.add(ticker)
-                while True:
-                    early_replacement = TICKER_CONFIG[ticker]['early_replacement']
-                    if not early_replacement:
-                        break
-                    else:
-                        ticker = TICKER_CONFIG[ticker]['early_replacement']
-                        tickers_to_init.add(ticker)
-
-        if 'ONES' in tickers_to_init: tickers_to_init.remove('ONES')
-        mp_results_queue = multiprocessing.Queue()
-        for ticker in tickers_to_init:
-            multiprocessing.Process(target=self.preload_data_in_parallel_worker,
-                                    args=(ticker, mp_results_queue)).start()
-        for _ in tickers_to_init:
-            mp_results_queue.get()
-
-    @staticmethod
-    def preload_data_in_parallel_worker(ticker, mp_results_queue):
-        """
-        Multiprocessing worker to load data for one ticker from disk or from yahoo
-
-        Puts True into mp_results_queue once it's done fetching
-
-        :param ticker: str
-        :param mp_results_queue: multiprocessing.Queue
-        :return:
-        """
-        t = TickerData(ticker=ticker, force_new_data=False)
-        t.load_raw_data_or_get_from_yahoo()
-        mp_results_queue.put(True)
+            tickers += component.ticker_list
+        return fetch_tickers(tickers)
 
     def run_multi_component_dual_momentum(self):
 
 
         self.df = None
+        self.panel = None
         if not self.force_new_data:
             self.df = read_from_redis(key=self.__hash__())
 
@@ -160,141 +176,425 @@ class DualMomentumComposite:
             return self.df
         else:
             start_time = time.time()
-            self.libor = load_fred_data('libor_rate', return_type='dict')
-
-
-            self.preload_data_in_parallel()
-            self.df = TickerData('ONES').data_monthly
-            df = self.df
-            df.drop(['Adj Close', 'Close'], inplace=True, axis=1)
-            df['cash_portion'] = 0.0
-            df['performance_pretax'] = 0.0
-            df['taxes'] = 0.0
-
-            # each money market holding works like a buy and hold component
-            for mm_holding in {'TLT', 'VGIT', 'SPY', self.money_market_holding}:
-                component = DualMomentumComponent(
-                    name=f'__{mm_holding}', ticker_list=[mm_holding], tax_config=self.tax_config,
-                    lookback_months=12, max_holdings=1, use_dual_momentum=False, start_date=self.start_date,
-                    money_market_holding=mm_holding, force_new_data=self.force_new_data
-                )
-                component.run_dual_momentum()
-
-                df[f'__{mm_holding}_performance_pretax'] = component.df['performance_pretax']
-                df[f'__{mm_holding}_performance_posttax'] = component.df['performance_posttax']
-                df[f'__{mm_holding}_taxes'] = component.df['taxes']
-
-            for idx, component in enumerate(self.components):
-                component.run_dual_momentum()
-
-                if idx == 0:
-                    df['tbil_performance_pretax'] = component.df['tbil_performance_pretax']
-
-                df[f'{component.name}_holding'] = component.df['holding']
-                df[f'{component.name}_performance_pretax'] = component.df['performance_pretax']
-                df[f'{component.name}_taxes'] = component.df['taxes']
-                df[f'{component.name}_performance_posttax'] = component.df['performance_posttax']
-
-                df['performance_pretax'] += component.weight * component.df['performance_pretax']
-                df['taxes'] += component.weight * component.df['taxes']
-                df['cash_portion'] += component.weight * component.df['cash_portion']
-
-            df['leverage'] = 0.0
-            df['mmh'] = self.money_market_holding
-            df['leverage_costs'] = 0
-            df['lev_performance_pretax'] = 1.0
-            df['taxes_month'] = 0.0
-            df['taxes_due_total'] = 0.0
-            df['taxes_paid'] = 0.0
-            df['lev_performance_posttax'] = 10000
-            df['lev_dd'] = 0.0
-
-            # pandas dataframes are slow with df.iterrows. It's much faster to turn the df into
-            # a dict and then pick values from it
-            df_as_dict = df.to_dict('index')
-            df_indexes = list(df.index)
-
-            for idx, date in enumerate(df_indexes):
-                if idx < self.max_lookback_months:
-                    continue
-
-                row = df_as_dict[date]
-                year, month = date
-
-                # prev_total = df.at[df.index[idx - 1], 'lev_performance_posttax']
-                prev_total = df_as_dict[df_indexes[idx-1]]['lev_performance_posttax']
-
-                # months_for_lev would go here...
-
-                # calculate leveraged return and update cash portion accordingly
-                lev_performance_pretax = self.leverage * (row['performance_pretax'] - 1) + 1
-                percentage_cash = 1 - ((1 - row['cash_portion']) * self.leverage)
-
-                taxes_month = self.leverage * row['taxes'] * prev_total
-
-                # if we hold some cash, put it now into the money market holding
-                if percentage_cash >= 0:
-                    #TODO: implement other money market holding options
-                    if self.money_market_holding in ['SHY', 'VGIT', 'IEF', 'TLT', 'BOND', 'BND',
-                                                     'ONES']:
-                        mm_pretax = row[f'__{self.money_market_holding}_performance_pretax'] - 1
-                        lev_performance_pretax += percentage_cash * mm_pretax
-                        taxes_month += row[f'__{self.money_market_holding}_taxes'] * \
-                                       percentage_cash * prev_total
-                        df.at[date, 'mmh'] = self.money_market_holding
-
-                # otherwise, we are borrowing money for leverage -> account for that
-                else:
-                    leverage_percentage = -percentage_cash
-                    libor = self.libor[date]
-
-                    # monthly_borrowing_rate is the monthly borrowing cost
-                    # e.g. 0.01 -> leverage costs 1% of the the leveraged capital per month
-                    monthly_borrowing_rate = ((libor + self.borrowing_cost_above_libor) / 100) ** (1/12)
-                    monthly_borrowing_rate -= 1
-
-                    # we only pay leverage cost for the percentage of the portfolio that's leveraged
-                    leverage_cost = leverage_percentage * monthly_borrowing_rate
-
-                    df_as_dict[date]['leverage_cost'] = leverage_cost
-                    lev_performance_pretax -= leverage_cost
-
-                # taxes_due_total = taxes_month + df.at[df.index[idx - 1], 'taxes_due_total']
-                taxes_due_total = taxes_month + df_as_dict[df_indexes[idx - 1]]['taxes_due_total']
-                taxes_paid = 0
-
-                # calculate returns after taxes
-                lev_performance_posttax = lev_performance_pretax * prev_total
-                # if end of january (200x, 12), pay taxes
-                if month == 12 and taxes_due_total > 0:
-                    lev_performance_posttax -= taxes_due_total
-                    taxes_paid = taxes_due_total
-                    taxes_due_total = 0
-
-                df_as_dict[date]['lev_performance_pretax'] = lev_performance_pretax
-                df_as_dict[date]['taxes_month'] = taxes_month
-                df_as_dict[date]['taxes_due_total'] = taxes_due_total
-                df_as_dict[date]['taxes_paid'] = taxes_paid
-                df_as_dict[date]['lev_performance_posttax'] = lev_performance_posttax
-                df_as_dict[date]['leverage'] = self.leverage
-                df_as_dict[date]['cash_portion'] = max(0, percentage_cash)
-
-            self.df = pd.DataFrame.from_dict(df_as_dict, orient='index')
+            panel = self.prepare_panel()
+            panel['cash_portion'] = 0.0
+            panel['performance_pretax'] = 0.0
+            panel['taxes'] = 0.0
+            for component in self.components:
+                panel['performance_pretax'] += component.weight * panel[
+                    f'{component.name}_performance_pretax']
+                panel['taxes'] += component.weight * panel[f'{component.name}_taxes']
+                panel['cash_portion'] += component.weight * panel[
+                    f'{component.name}_cash_portion']
+
+            mm_performance_pretax, mm_taxes = self.get_money_market_arrays(panel)
+            libor = self.libor.column('index', panel.first_month, len(panel))
+            ledger_inputs = [panel['performance_pretax'], panel['taxes'], panel['cash_portion'],
+                             libor] + [values for values in [mm_performance_pretax, mm_taxes]
+                                       if values is not None]
+
+            # continue the ledger of an earlier simulation if available. The last month of
+            # the history used prices of an unfinished month -> redo the last two months
+            history = self.load_history(panel, ledger_inputs)
+            if history is not None:
+                start_idx = len(history) - 2
+                initial_value = history['lev_performance_posttax'][start_idx - 1]
+                initial_taxes_due = history['taxes_due_total'][start_idx - 1]
+            else:
+                start_idx = self.max_lookback_months
+                initial_value = 10000
+                initial_taxes_due = 0.0
+
+            ledger = calculate_leveraged_ledger(
+                performance_pretax=panel['performance_pretax'], taxes=panel['taxes'],
+                cash_portion=panel['cash_portion'],
+                mm_performance_pretax=mm_performance_pretax, mm_taxes=mm_taxes,
+                libor=libor,
+                months_of_year=panel.months_of_year,
+                leverage=self.leverage,
+                borrowing_cost_above_libor=self.borrowing_cost_above_libor,
+                start_idx=start_idx, initial_value=initial_value,
+                initial_taxes_due=initial_taxes_due
+            )
+            for column, values in ledger.items():
+                if history is not None and column in history:
+                    values = np.concatenate([history[column][:start_idx], values[start_idx:]])
+                panel[column] = values
+            panel['lev_dd'] = 0.0
+
+            # only keep and cache the columns used by the summaries
+            self.df = to_result_frame(panel, self.result_schema)
+            self.panel = apply_schema(panel, self.result_schema)
 
             write_to_redis(key=self.__hash__(), value = self.df, expiration=3600)
+            write_to_redis(key=f'history_{self.__hash__()}',
+                           value={'results': self.df, 'input_checksum': months_checksum(
+                               ledger_inputs, len(panel) - 2)},
+                           expiration=HISTORY_EXPIRATION)
             print(f"running dual momentum on composite took {time.time() - start_time}.")
 
         self.simulation_finished = True
         return self.df
 
-    def generate_results_summary(self):
+    def prepare_panel(self) -> MonthlyPanel:
+        """
+        Runs all components and returns a panel with their returns, taxes, cash portions and
+        holdings as well as the returns of the S&P 500 and the money market holding.
+        The components don't get weighted yet.
+
+        :return: MonthlyPanel
+        """
+
+        self.libor = load_fred_data('libor_rate', return_type='panel')
+
+        self.preload_data_in_parallel()
+        ones = TickerData('ONES').panel_monthly
+        panel = MonthlyPanel(first_month=ones.first_month, n_months=len(ones))
+
+        # S&P 500 and money market holding come from the shared benchmark registry
+        for mm_holding in dict.fromkeys(['SPY', self.money_market_holding]):
+            benchmark = get_benchmark(mm_holding, tax_config=self.tax_config,
+                                      force_new_data=self.force_new_data)
+            panel.align(benchmark, columns={
+                'performance_pretax': f'__{mm_holding}_performance_pretax',
+                'performance_posttax': f'__{mm_holding}_performance_posttax',
+                'taxes': f'__{mm_holding}_taxes'
+            })
+
+        for idx, component in enumerate(self.components):
+            component.run_dual_momentum()
+
+            if idx == 0:
+                panel.align(component.panel, columns={
+                    'tbil_performance_pretax': 'tbil_performance_pretax'})
+
+            panel.align(component.panel, columns={
+                **{column: f'{component.name}_{column}'
+                   for column in component.holding_columns},
+                'performance_pretax': f'{component.name}_performance_pretax',
+                'taxes': f'{component.name}_taxes',
+                'performance_posttax': f'{component.name}_performance_posttax',
+                'cash_portion': f'{component.name}_cash_portion'
+            })
+
+        panel['mmh'] = np.full(len(panel), self.money_market_holding, dtype=object)
+        return panel
+
+    def get_money_market_arrays(self, panel: MonthlyPanel) -> tuple:
+        """
+        Returns the pretax performance and the taxes of the money market holding that the cash
+        portion gets invested in. (None, None) if the cash portion does not get invested.
+
+        :param panel: MonthlyPanel, see prepare_panel
+        :return: (np.ndarray, np.ndarray) or (None, None)
+        """
+        if self.money_market_holding in INVESTED_MONEY_MARKET_HOLDINGS:
+            return (panel[f'__{self.money_market_holding}_performance_pretax'],
+                    panel[f'__{self.money_market_holding}_taxes'])
+        return None, None
+
+    def get_component_arrays(self, panel: MonthlyPanel) -> dict:
+        """
+        Returns the pretax performance, taxes and cash portions of all components as
+        (components x months) arrays, which can be weighted with a matrix product.
+
+        :param panel: MonthlyPanel, see prepare_panel
+        :return: dict of np.ndarrays
+        """
+        return {
+            column: np.stack([panel[f'{component.name}_{column}'].astype(float)
+                              for component in self.components])
+            for column in ['performance_pretax', 'taxes', 'cash_portion']
+        }
+
+    def sweep_weights(self, weights) -> pd.DataFrame:
+        """
+        Evaluates many weightings of the components at once, e.g. to find a good allocation.
+
+        The components only get simulated once. The pretax returns, taxes and cash portions
+        of all weightings are one matrix product, which then runs through the leverage and
+        tax ledger and the metrics together, SWEEP_CHUNK_SIZE weightings at a time.
+        Weightings don't get cached.
+
+        >>> dm.sweep_weights([[0.5, 0.5], [0.8, 0.2]])
+           equities  reits  cagr_pretax  cagr_posttax  sharpe  sortino  max_dd_pretax ...
+        0       0.5    0.5     1.1031      1.0812     0.71   1.02      0.6544 ...
+
+        :param weights: np.ndarray (weightings x components), each row has to sum to one
+        :return: pd.DataFrame, one row per weighting
+        """
+
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        if weights.shape[1] != len(self.components):
+            raise ValueError(f'Weights need one column per component ({len(self.components)}), '
+                             f'not {weights.shape[1]}.')
+        if np.any(weights < 0) or np.any(weights > 1) or \
+                np.any(np.abs(weights.sum(axis=1) - 1) > 0.0001):
+            raise ValueError('Weights have to be between 0 and 1 and sum to one for every '
+                             'weighting.')
+
+        panel = self.prepare_panel()
+        mm_performance_pretax, mm_taxes = self.get_money_market_arrays(panel)
+        component_arrays = self.get_component_arrays(panel)
+
+        results = {component.name: weights[:, idx]
+                   for idx, component in enumerate(self.components)}
+        columns = ['cagr_pretax', 'cagr_posttax', 'total_returns_pretax',
+                   'total_returns_posttax', 'sharpe', 'sortino', 'annual_volatility',
+                   'max_dd_pretax', 'max_dd_posttax']
+        for column in columns:
+            results[column] = np.zeros(len(weights))
+
+        for chunk_start in range(0, len(weights), SWEEP_CHUNK_SIZE):
+            chunk = slice(chunk_start, chunk_start + SWEEP_CHUNK_SIZE)
+            ledger = calculate_leveraged_ledger(
+                performance_pretax=weights[chunk] @ component_arrays['performance_pretax'],
+                taxes=weights[chunk] @ component_arrays['taxes'],
+                cash_portion=weights[chunk] @ component_arrays['cash_portion'],
+                mm_performance_pretax=mm_performance_pretax, mm_taxes=mm_taxes,
+                libor=self.libor.column('index', panel.first_month, len(panel)),
+                months_of_year=panel.months_of_year,
+                leverage=self.leverage,
+                borrowing_cost_above_libor=self.borrowing_cost_above_libor,
+                start_idx=self.max_lookback_months
+            )
+
+            values_posttax = ledger['lev_performance_posttax']
+            performance_posttax = np.concatenate([
+                np.ones((len(values_posttax), 1)), values_posttax[:, 1:] / values_posttax[:, :-1]
+            ], axis=1)
+            pretax = calculate_metrics(ledger['lev_performance_pretax'],
+                                       riskfree=panel['tbil_performance_pretax'],
+                                       start_idx=self.max_lookback_months)
+            posttax = calculate_metrics(performance_posttax,
+                                        riskfree=panel['tbil_performance_pretax'],
+                                        start_idx=self.max_lookback_months)
+
+            for metric in ['cagr', 'total_returns', 'max_dd']:
+                results[f'{metric}_pretax'][chunk] = pretax[metric]
+                results[f'{metric}_posttax'][chunk] = posttax[metric]
+            # sharpe, sortino and volatility are based on pretax returns
+            for metric in ['sharpe', 'sortino', 'annual_volatility']:
+                results[metric][chunk] = pretax[metric]
+
+        return pd.DataFrame(results)
+
+    def run_block_bootstrap(self, n_paths: int = 10000, block_months: int = 12,
+                            seed: int = None,
+                            percentiles: tuple = (5, 25, 50, 75, 95)) -> dict:
+        """
+        Tests how robust the strategy is by simulating n_paths alternative histories.
+
+        Each path is made up of randomly drawn blocks of block_months consecutive months, which
+        keeps momentum and volatility clusters within a block. The same months get drawn for the
+        components, the money market holding, libor and t-bills, so correlations between them
+        are kept. Paths are as long as the backtest and run through the leverage and tax ledger
+        (BOOTSTRAP_CHUNK_SIZE paths at a time to limit memory).
+
+        :param n_paths: int
+        :param block_months: int
+        :param seed: int, for reproducible paths
+        :param percentiles: tuple of ints
+        :return: dict, {metric: np.ndarray of percentiles}
+        """
+
+        panel = self.prepare_panel()
+        mm_performance_pretax, mm_taxes = self.get_money_market_arrays(panel)
+        weights = np.array([component.weight for component in self.components])
+        monthly = {column: weights @ values
+                   for column, values in self.get_component_arrays(panel).items()}
+        monthly['tbil_performance_pretax'] = panel['tbil_performance_pretax'].astype(float)
+        monthly['libor'] = self.libor.column('index', panel.first_month, len(panel))
+        if mm_performance_pretax is not None:
+            monthly['mm_performance_pretax'] = mm_performance_pretax
+            monthly['mm_taxes'] = mm_taxes
+
+        # only simulated months that are complete (the last month isn't) get drawn
+        start_idx = self.max_lookback_months
+        n_months = len(panel) - 1 - start_idx
+        if not 0 < block_months <= n_months:
+            raise ValueError(f'block_months has to be between 1 and {n_months}, not '
+                             f'{block_months}.')
+        n_blocks = -(-n_months // block_months)
+        months_of_year = panel.months_of_year[start_idx:start_idx + n_months]
+
+        random_state = np.random.RandomState(seed)
+        metrics = {f'{metric}_{tax_type}': np.zeros(n_paths)
+                   for metric in ['cagr', 'max_dd', 'terminal_wealth']
+                   for tax_type in ['pretax', 'posttax']}
+
+        for chunk_start in range(0, n_paths, BOOTSTRAP_CHUNK_SIZE):
+            chunk = slice(chunk_start, min(chunk_start + BOOTSTRAP_CHUNK_SIZE, n_paths))
+            n_chunk_paths = chunk.stop - chunk.start
+
+            # (paths x months) indexes into the months of the panel
+            block_starts = random_state.randint(start_idx, start_idx + n_months - block_months + 1,
+                                                size=(n_chunk_paths, n_blocks))
+            month_idx = (block_starts[:, :, None] + np.arange(block_months)).reshape(
+                n_chunk_paths, -1)[:, :n_months]
+            paths = {column: values[month_idx] for column, values in monthly.items()}
+
+            ledger = calculate_leveraged_ledger(
+                performance_pretax=paths['performance_pretax'], taxes=paths['taxes'],
+                cash_portion=paths['cash_portion'],
+                mm_performance_pretax=paths.get('mm_performance_pretax'),
+                mm_taxes=paths.get('mm_taxes'), libor=paths['libor'],
+                months_of_year=months_of_year, leverage=self.leverage,
+                borrowing_cost_above_libor=self.borrowing_cost_above_libor, initial_value=1.0
+            )
+
+            values_posttax = ledger['lev_performance_posttax']
+            performance_posttax = np.concatenate([
+                values_posttax[:, :1], values_posttax[:, 1:] / values_posttax[:, :-1]
+            ], axis=1)
+            for tax_type, performance in [('pretax', ledger['lev_performance_pretax']),
+                                          ('posttax', performance_posttax)]:
+                path_metrics = calculate_metrics(performance,
+                                                 riskfree=paths['tbil_performance_pretax'],
+                                                 start_idx=0)
+                metrics[f'cagr_{tax_type}'][chunk] = path_metrics['cagr']
+                metrics[f'max_dd_{tax_type}'][chunk] = path_metrics['max_dd']
+                metrics[f'terminal_wealth_{tax_type}'][chunk] = path_metrics['cumulative'][:, -1]
+
+        results = {'percentiles': list(percentiles), 'n_paths': n_paths,
+                   'block_months': block_months}
+        for metric, values in metrics.items():
+            results[metric] = np.nanpercentile(values, percentiles)
+        return results
+
+    def get_current_signal(self) -> dict:
+        """
+        Returns what each component should hold this month without running a backtest.
+        Every CASH position goes into the money market holding.
+
+        :return: dict
+        """
+
+        components = []
+        cash_portion = 0.0
+        for component in self.components:
+            signal = {**component.get_current_signal(), 'weight': component.weight}
+            cash_portion += component.weight * sum(
+                weight for ticker, weight in zip(signal['holdings'], signal['weights'])
+                if ticker == 'CASH')
+            components.append(signal)
+
+        return {
+            'month': components[0]['month'],
+            'money_market_holding': self.money_market_holding,
+            'cash_portion': cash_portion,
+            'components': components
+        }
+
+    def load_history(self, panel: MonthlyPanel, ledger_inputs: list):
+        """
+        Returns the results of an earlier simulation if they can be extended to the months of
+        panel. Otherwise returns None.
+
+        The history can't be extended if the inputs of the ledger changed for the months that
+        get kept, e.g. because a component was simulated again with restated prices or FRED
+        revised the libor rates.
+
+        :param panel: MonthlyPanel
+        :param ledger_inputs: list of np.ndarrays (months), the inputs of the ledger
+        :return: MonthlyPanel or None
+        """
+
+        if self.force_new_data:
+            return None
+        history = read_from_redis(key=f'history_{self.__hash__()}')
+        if not isinstance(history, dict):
+            return None
+
+        results = MonthlyPanel.from_frame(history['results'])
+        if (results.first_month != panel.first_month or len(results) > len(panel) or
+                len(results) - 2 <= self.max_lookback_months or
+                not all(column in results for column in self.result_schema) or
+                history['input_checksum'] != months_checksum(ledger_inputs, len(results) - 2)):
+            return None
+        return results
+
+    @property
+    def result_schema(self) -> dict:
+        """
+        Columns and dtypes of the simulation results that get cached (see result_schema.py)
+
+        :return: dict
+        """
+        schema = dict(COMPOSITE_RESULT_COLUMNS)
+        for mm_holding in dict.fromkeys(['SPY', self.money_market_holding]):
+            for tax_type in ['pretax', 'posttax']:
+                schema[f'__{mm_holding}_performance_{tax_type}'] = np.float64
+
+        for component in self.components:
+            schema[f'{component.name}_performance_pretax'] = np.float64
+            schema[f'{component.name}_performance_posttax'] = np.float64
+            component_schema = component.result_schema
+            for column in component.holding_columns:
+                schema[f'{component.name}_{column}'] = component_schema[column]
+        return schema
+
+    def generate_results_summary(self, sections: list = None):
+        """
+        Generates the summary sections, e.g. only ['metrics'] for the headline numbers.
+        Every section is cached under its own key (summary_{section}_{hash}), so the expensive
+        monthly_data only gets generated once it is requested.
+
+        Sections that are not cached yet need the simulation, which gets run if necessary.
+        The requested sections get stored in self.summary (metrics as top-level keys).
 
+        :param sections: list of SUMMARY_SECTIONS, DEFAULT_SUMMARY_SECTIONS if None
+        :return: dict
+        """
 
-        self.summary = read_from_redis(f'summary_{self.__hash__()}')
-        if self.summary:
-            return
+        if sections is None:
+            sections = DEFAULT_SUMMARY_SECTIONS
+        for section in sections:
+            if section not in SUMMARY_SECTIONS:
+                raise ValueError(f'Summary section has to be one of {SUMMARY_SECTIONS}, not '
+                                 f'{section}.')
+
+        section_data = {}
+        for section in sections:
+            section_data[section] = read_from_redis(f'summary_{section}_{self.__hash__()}')
+
+        missing_sections = [section for section, data in section_data.items() if data is None]
+        if missing_sections:
+            if self.df is None:
+                self.run_multi_component_dual_momentum()
+            metrics = self.add_summary_columns()
+
+            for section in missing_sections:
+                if section == 'metrics':
+                    data = self.get_metrics_summary_data(metrics)
+                elif section == 'correlations':
+                    data = self.get_correlation_summary_data()
+                elif section == 'monthly_data':
+                    data = self.get_monthly_returns_summaries()
+                elif section == 'start_dates':
+                    data = self.get_start_date_summary_data()
+                else:
+                    data = self.get_rolling_summary_data()
+                section_data[section] = data
+                write_to_redis(key=f'summary_{section}_{self.__hash__()}', value=data,
+                               expiration=3600)
 
         summary = {}
+        for section in sections:
+            if section == 'metrics':
+                summary.update(section_data[section])
+            else:
+                summary[section] = section_data[section]
+        self.summary = summary
+        return summary
+
+    def add_summary_columns(self) -> dict:
+        """
+        Adds the strategy and S&P 500 performance, cumulative and drawdown columns to the df,
+        which all summary sections are based on.
+
+        :return: dict of metrics, see calculate_metrics
+        """
 
         self.df['performance_strategy_pretax'] = self.df['lev_performance_pretax']
         self.df['performance_strategy_posttax'] = self.df['lev_performance_posttax'].pct_change(
@@ -302,80 +602,139 @@ class DualMomentumComposite:
         self.df['performance_sp500_pretax'] = self.df['__SPY_performance_pretax']
         self.df['performance_sp500_posttax'] = self.df['__SPY_performance_posttax']
 
-        for name in ['strategy', 'sp500']:
-            for tax_type in ['pretax', 'posttax']:
-                self.df[f'performance_{name}_{tax_type}_cumulative'] = np.cumprod(self.df[
-                                                              f'performance_{name}_{tax_type}'])
-
-                dd_arr, max_dd, max_dd_date = self.generate_drawdown_data(self.df[
-                                                f'performance_{name}_{tax_type}_cumulative'])
-                self.df[f'drawdown_{name}_{tax_type}'] = dd_arr
-                summary[f'max_dd_{name}_{tax_type}'] = max_dd
-                summary[f'max_dd_{name}_{tax_type}_str'] = f'{round((1 - max_dd) * 100, 2)}%'
-                summary[f'max_dd_date_{name}_{tax_type}'] = max_dd_date
-                summary[f'max_dd_date_{name}_{tax_type}_str'] = datetime.datetime(
-                    max_dd_date[0], max_dd_date[1], 1).strftime("%b %Y")
-
-                returns = self.df[f'performance_{name}_{tax_type}_cumulative'][-1] - 1
-                summary[f'total_returns_{name}_{tax_type}'] = returns
-                cagr = returns ** (1 / ((len(self.df) - self.max_lookback_months) / 12))
-                summary[f'cagr_{name}_{tax_type}'] = cagr
-                summary[f'cagr_{name}_{tax_type}_str'] = f'{round((cagr - 1) * 100, 2)}%'
-
-
-            return_minus_riskfree = (self.df[f'performance_{name}_pretax'] -
-                             self.df['tbil_performance_pretax'])[self.max_lookback_months: -1]
-            summary[f'sharpe_{name}'] = np.sqrt(12) * return_minus_riskfree.mean() / \
-                                        return_minus_riskfree.std()
+        # all four series get evaluated together
+        metrics = calculate_metrics(
+            performance=np.stack([self.df[f'performance_{name}_{tax_type}'].to_numpy(float)
+                                  for name, tax_type in SUMMARY_SERIES]),
+            riskfree=self.df['tbil_performance_pretax'].to_numpy(float),
+            start_idx=self.max_lookback_months)
 
-            downside_dev = return_minus_riskfree.copy()
-            downside_dev[downside_dev > 0] = 0
-            downside_dev = np.sqrt(np.mean(downside_dev ** 2)) * np.sqrt(12)
-            summary[f'sortino_{name}'] = np.mean(return_minus_riskfree) / downside_dev * 12
+        for idx, (name, tax_type) in enumerate(SUMMARY_SERIES):
+            self.df[f'performance_{name}_{tax_type}_cumulative'] = metrics['cumulative'][idx]
+            self.df[f'drawdown_{name}_{tax_type}'] = metrics['drawdowns'][idx]
+        return metrics
 
-            # alpha = 2
-            ann_vol = return_minus_riskfree.std() * (12 ** 0.5)
-            summary[f'annual_volatility_{name}'] = ann_vol
-            summary[f'annual_volatility_{name}_str'] = f'{round(ann_vol * 100, 2)}%'
+    def get_metrics_summary_data(self, metrics: dict) -> dict:
+        """
+        Returns drawdowns, returns, sharpe, sortino and volatility of the strategy and the
+        S&P 500
 
-        # get correlations
-        summary['correlations'] = self.get_correlation_summary_data()
+        :param metrics: dict, see add_summary_columns
+        :return: dict
+        """
 
-        # get monthly holdings and return data
-        summary['monthly_data'] = self.get_monthly_returns_summaries()
+        summary = {}
+        for idx, (name, tax_type) in enumerate(SUMMARY_SERIES):
+            max_dd = float(metrics['max_dd'][idx])
+            summary[f'max_dd_{name}_{tax_type}'] = max_dd
+            summary[f'max_dd_{name}_{tax_type}_str'] = f'{round((1 - max_dd) * 100, 2)}%'
+            if metrics['max_dd_idx'][idx] >= 0:
+                max_dd_date = tuple(int(x) for x in self.df.index[metrics['max_dd_idx'][idx]])
+                summary[f'max_dd_date_{name}_{tax_type}'] = max_dd_date
+                summary[f'max_dd_date_{name}_{tax_type}_str'] = datetime.datetime(
+                    max_dd_date[0], max_dd_date[1], 1).strftime("%b %Y")
+            else:
+                summary[f'max_dd_date_{name}_{tax_type}'] = None
+                summary[f'max_dd_date_{name}_{tax_type}_str'] = ''
+            summary[f'max_underwater_months_{name}_{tax_type}'] = int(
+                metrics['underwater_months'][idx])
+            summary[f'recovery_months_{name}_{tax_type}'] = int(metrics['recovery_months'][idx])
+
+            summary[f'total_returns_{name}_{tax_type}'] = float(metrics['total_returns'][idx])
+            cagr = float(metrics['cagr'][idx])
+            summary[f'cagr_{name}_{tax_type}'] = cagr
+            summary[f'cagr_{name}_{tax_type}_str'] = f'{round((cagr - 1) * 100, 2)}%'
+
+            # sharpe, sortino and volatility are based on pretax returns
+            if tax_type == 'pretax':
+                summary[f'sharpe_{name}'] = float(metrics['sharpe'][idx])
+                summary[f'sortino_{name}'] = float(metrics['sortino'][idx])
+                ann_vol = float(metrics['annual_volatility'][idx])
+                summary[f'annual_volatility_{name}'] = ann_vol
+                summary[f'annual_volatility_{name}_str'] = f'{round(ann_vol * 100, 2)}%'
 
         for key, val in summary.items():
             if isinstance(val, float):
                 summary[key] = round(val, 4)
-        self.summary = summary
+        return summary
 
-        write_to_redis(key=f'summary_{self.__hash__()}', value=summary, expiration=3600)
+    def get_start_date_summary_data(self) -> dict:
+        """
+        Returns how much CAGR, max drawdown and sharpe ratio of the strategy depend on when
+        it was started (and stopped), all taken from the one simulated history:
+        - for every pair of start year (january) and end year (december) as a heatmap
+        - for every start month until the last complete month
+
+        Posttax values are approximate because taxes due at the start get ignored.
 
+        :return: dict
+        """
 
-    @staticmethod
-    def generate_drawdown_data(cumulative_series: pd.Series):
+        # only complete months, the last month is still running
+        first_idx = self.max_lookback_months
+        last_idx = len(self.df) - 2
+        months = np.arange(first_idx, last_idx + 1)
+        months_of_year = np.array([date[1] for date in self.df.index])[months]
+        years = np.array([date[0] for date in self.df.index])[months]
+
+        starts = months[months_of_year == 1]
+        ends = months[(months_of_year == 12) | (months == last_idx)]
+        riskfree = self.df['tbil_performance_pretax'].to_numpy(float)
+
+        heatmap = {'start_years': [int(year) for year in years[starts - first_idx]],
+                   'end_years': [int(year) for year in years[ends - first_idx]]}
+        by_start_month = {'year': years.tolist(), 'month': months_of_year.tolist()}
+        for tax_type in ['pretax', 'posttax']:
+            performance = self.df[f'performance_strategy_{tax_type}'].to_numpy(float)
+            by_year = calculate_window_metrics(performance, riskfree, starts, ends)
+            by_month = calculate_window_metrics(performance, riskfree, months, months[-1:])
+            metrics = ['cagr', 'max_dd', 'sharpe'] if tax_type == 'pretax' else \
+                ['cagr', 'max_dd']
+            for metric in metrics:
+                name = 'sharpe' if metric == 'sharpe' else f'{metric}_{tax_type}'
+                heatmap[name] = to_json_values(by_year[metric])
+                by_start_month[name] = to_json_values(by_month[metric][:, 0])
+
+        return {**heatmap, 'by_start_month': by_start_month}
+
+    def get_rolling_summary_data(self) -> dict:
         """
-        Calculate monthly drawdowns in %
+        Returns CAGR, volatility, sharpe ratio, max drawdown and correlation to the S&P 500 over
+        the last 12, 36 and 60 months (ROLLING_WINDOWS) for every complete month, for the
+        strategy and every component (pretax).
 
-        :param cumulative_series:
-        :return:
+        >>> rolling['windows']['36']['equities']['sharpe']
+        [None, None, ..., 0.8123, 0.7934]
+
+        :return: dict
         """
 
-        perf_arr = np.array(cumulative_series)
-        index_arr = np.array(cumulative_series.index)
-        dd_arr = np.zeros(len(cumulative_series), dtype=float)
-        max_dd = 1.0
-        max_dd_date = None
-        for i in range(1, (len(perf_arr))):
-            max_performance_so_far = np.max(perf_arr[0:i])
+        # only simulated, complete months
+        months = slice(self.max_lookback_months, len(self.df) - 1)
+        df = self.df.iloc[months]
 
-            dd = min(1.0, 1.0 * perf_arr[i] / max_performance_so_far)
-            dd_arr[i] = dd
-            if dd < max_dd:
-                max_dd = dd
-                max_dd_date = index_arr[i]
+        series = {'strategy': 'performance_strategy_pretax'}
+        series.update({component.name: f'{component.name}_performance_pretax'
+                       for component in self.components})
+        performance = np.stack([df[column].to_numpy(float) for column in series.values()])
 
-        return dd_arr, max_dd, max_dd_date
+        rolling = {
+            'year': [int(date[0]) for date in df.index],
+            'month': [int(date[1]) for date in df.index],
+            'series': list(series),
+            'windows': {}
+        }
+        for window in ROLLING_WINDOWS:
+            if window > len(df):
+                continue
+            metrics = calculate_rolling_metrics(
+                performance, benchmark=df['performance_sp500_pretax'].to_numpy(float),
+                riskfree=df['tbil_performance_pretax'].to_numpy(float), window=window)
+            rolling['windows'][str(window)] = {
+                name: {metric: to_json_values(values[idx]) for metric, values in metrics.items()}
+                for idx, name in enumerate(series)
+            }
+        return rolling
 
     def get_correlation_summary_data(self):
         """
@@ -416,74 +775,131 @@ class DualMomentumComposite:
             'data': correlation_data
         }
 
-    def get_monthly_returns_summaries(self):
+    def get_monthly_returns_summaries(self) -> dict:
         """
-        Returns data on components and holdings month by month
+        Returns data on components and holdings month by month as columns, one list per field.
 
-        :return:
-        """
+        Holdings are indexes into the tickers string table, one list per position, with -1 for
+        positions that are not held. Months that are fully in cash hold the money market
+        holding, CASH positions of partly invested months return the money market holding.
 
-        monthly_data = []
+        >>> monthly_data['components'][0]['holdings']
+        [[0, 0, 2, ...], [1, -1, 3, ...]]
 
-        self.df['prev_total_pretax'] = self.df.performance_strategy_pretax_cumulative.shift(
-            1).fillna(1)
-        self.df['prev_total_posttax'] = self.df.performance_strategy_posttax_cumulative.shift(
-            1).fillna(1)
-        df_as_dict = self.df.to_dict('index')
-        # df_indexes = list(df.index)
+        :return: dict
+        """
 
-        for idx, date in enumerate(self.df.index):
-            if idx < self.max_lookback_months:
-                continue
-            if idx == len(df_as_dict) - 1:
-                continue
-            row = df_as_dict[date]
+        months = slice(self.max_lookback_months, len(self.df) - 1)
+        df = self.df.iloc[months]
+
+        cumulative_pretax = self.df.performance_strategy_pretax_cumulative.to_numpy(float)
+        cumulative_posttax = self.df.performance_strategy_posttax_cumulative.to_numpy(float)
 
-            return_mmh_pretax = round(row[f'__{row["mmh"]}_performance_pretax'], 4)
-            return_mmh_posttax = round(row[f'__{row["mmh"]}_performance_posttax'], 4)
+        mmh = df['mmh'].to_numpy(dtype=object)
+        tickers = {}
+        for component in self.components:
+            tickers.update(dict.fromkeys(component.ticker_list))
+        tickers.update(dict.fromkeys(['CASH'] + list(dict.fromkeys(mmh))))
+        tickers = {ticker: idx for idx, ticker in enumerate(tickers)}
+        mmh_idx = np.array([tickers[holding] for holding in mmh], dtype=int)
+
+        return_mmh = {}
+        for tax_type in ['pretax', 'posttax']:
+            return_mmh[tax_type] = np.zeros(len(df))
+            for holding in set(mmh):
+                return_mmh[tax_type] = np.where(
+                    mmh == holding, df[f'__{holding}_performance_{tax_type}'].to_numpy(float),
+                    return_mmh[tax_type])
+            return_mmh[tax_type] = return_mmh[tax_type].round(4)
+
+        components = []
+        for component in self.components:
+            columns = [f'{component.name}_{column}' for column in component.holding_columns]
+            holdings = df[columns].to_numpy(dtype=int)
+            is_cash = holdings == CASH
+            only_cash = is_cash[:, 0]
+
+            # component ticker indexes -> string table indexes. CASH (-1) picks the last one
+            table_idx = np.array([tickers[ticker] for ticker in component.ticker_list] +
+                                 [tickers['CASH']])[holdings]
+            table_idx[only_cash] = -1
+            table_idx[only_cash, 0] = mmh_idx[only_cash]
+
+            # every CASH position returns the money market holding
+            cash_share = is_cash.mean(axis=1)
+            returns = {}
+            for tax_type in ['pretax', 'posttax']:
+                return_tickers = df[f'{component.name}_performance_{tax_type}'].to_numpy(
+                    float).round(4)
+                returns[tax_type] = np.where(
+                    only_cash, return_mmh[tax_type],
+                    return_tickers * (1 - cash_share) + return_mmh[tax_type] * cash_share)
+
+            components.append({
+                'name': component.name,
+                'holdings': table_idx.T.tolist(),
+                'pretax': returns['pretax'].round(4).tolist(),
+                'posttax': returns['posttax'].round(4).tolist()
+            })
 
-            holdings = []
-            for name in [component.name for component in self.components]:
+        return {
+            'year': [int(date[0]) for date in df.index],
+            'month': [int(date[1]) for date in df.index],
+            'tickers': list(tickers),
+            'components': components,
+            'value_start_pretax': np.r_[1.0, cumulative_pretax][months].tolist(),
+            'value_start_posttax': np.r_[1.0, cumulative_posttax][months].tolist(),
+            'value_end_pretax': cumulative_pretax[months].tolist(),
+            'value_end_posttax': cumulative_posttax[months].tolist(),
+            'value_end_spy_pretax': df['performance_sp500_pretax_cumulative'].to_numpy(
+                float).round(4).tolist(),
+            'value_end_spy_posttax': df['performance_sp500_posttax_cumulative'].to_numpy(
+                float).round(4).tolist()
+        }
 
-                holding = {'name': name}
-                tickers = row[f'{name}_holding']
 
-                return_tickers_pretax = round(row[f'{name}_performance_pretax'], 4)
-                return_tickers_posttax = round(row[f'{name}_performance_posttax'], 4)
+def to_json_values(values: np.ndarray) -> list:
+    """
+    Returns values rounded to 4 digits as (nested) lists with None instead of NaN
 
+    :param values: np.ndarray
+    :return: list
+    """
+    values = np.round(values.astype(float), 4)
+    return np.where(np.isnan(values), None, values).tolist()
 
-                # 100% cash -> only list MMH holding and returns
-                if tickers == ['CASH']:
-                    holding['holdings'] = [row['mmh']]
-                    holding['pretax'] = return_mmh_pretax
-                    holding['posttax'] = return_mmh_posttax
 
-                # 50% cash -> returns 50% from tickers and 50% from mmh
-                elif len(tickers) == 2 and tickers[1] == 'CASH':
-                    holding['holdings'] = tickers
-                    holding['pretax'] = return_tickers_pretax / 2 + return_mmh_pretax / 2
-                    holding['posttax'] = return_tickers_posttax / 2 + return_mmh_posttax / 2
+def monthly_data_to_arrow(monthly_data: dict) -> bytes:
+    """
+    Encodes the columnar monthly data (see get_monthly_returns_summaries) as an Arrow IPC
+    stream, e.g. for the chart series. Component returns and holdings become the columns
+    {name}_pretax, {name}_posttax and {name}_holding_{i}. The string tables are stored in the
+    schema metadata as json.
 
-                else:
-                    holding['holdings'] = tickers
-                    holding['pretax'] = return_tickers_pretax
-                    holding['posttax'] = return_tickers_posttax
-
-                holdings.append(holding)
-
-            monthly_data.append({
-                'date': date,
-                'date_str': datetime.datetime(date[0], date[1], 1).strftime("%b %Y"),
-                'holdings': holdings,
-                'value_start_pretax': row['prev_total_pretax'],
-                'value_start_posttax': row['prev_total_posttax'],
-                'value_end_pretax': row['performance_strategy_pretax_cumulative'],
-                'value_end_posttax': row['performance_strategy_posttax_cumulative'],
-                'value_end_spy_pretax': round(row['performance_sp500_pretax_cumulative'], 4),
-                'value_end_spy_posttax': round(row['performance_sp500_posttax_cumulative'], 4)
-            })
+    :param monthly_data: dict
+    :return: bytes
+    """
 
-        return monthly_data
+    columns = {
+        'year': np.array(monthly_data['year'], dtype=np.int16),
+        'month': np.array(monthly_data['month'], dtype=np.int8)
+    }
+    for column in ['value_start_pretax', 'value_start_posttax', 'value_end_pretax',
+                   'value_end_posttax', 'value_end_spy_pretax', 'value_end_spy_posttax']:
+        columns[column] = np.array(monthly_data[column], dtype=np.float64)
+    for component in monthly_data['components']:
+        for tax_type in ['pretax', 'posttax']:
+            columns[f'{component["name"]}_{tax_type}'] = np.array(component[tax_type],
+                                                                 dtype=np.float64)
+        for idx, holdings in enumerate(component['holdings']):
+            columns[f'{component["name"]}_holding_{idx}'] = np.array(holdings, dtype=np.int16)
+
+    metadata = {
+        'tickers': json.dumps(monthly_data['tickers']),
+        'components': json.dumps([component['name'] for component in
+                                  monthly_data['components']])
+    }
+    return to_arrow_ipc(columns, metadata=metadata)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,343 @@
+"""
+Vectorized simulation engine for dual momentum components.
+
+All functions operate on numpy arrays with months along the second to last and tickers along
+the last axis, i.e. (months x tickers). Holdings are stored as ticker indexes with -1 standing
+for CASH.
+"""
+
+import numpy as np
+
+CASH = -1
+
+# holdings get stored as one int column per position, e.g. holding_0, holding_1
+HOLDING_DTYPE = np.int16
+
+
+def encode_holdings(holdings: list, ticker_list: list, n_positions: int) -> np.ndarray:
+    """
+    Turns lists of held tickers into ticker indexes, e.g. with ticker_list ['VTI', 'VNQ']:
+    [['VNQ', 'CASH'], ['CASH']] -> [[1, -1], [-1, -1]]
+
+    :param holdings: list of lists of tickers, one list per month
+    :param ticker_list: list
+    :param n_positions: int
+    :return: np.ndarray (months x positions)
+    """
+    ticker_idx = {ticker: idx for idx, ticker in enumerate(ticker_list)}
+    codes = np.full((len(holdings), n_positions), CASH, dtype=HOLDING_DTYPE)
+    for month, tickers in enumerate(holdings):
+        for position, ticker in enumerate(tickers):
+            if ticker != 'CASH':
+                codes[month, position] = ticker_idx[ticker]
+    return codes
+
+
+def decode_holdings(holdings: np.ndarray, ticker_list: list) -> list:
+    """
+    Turns ticker indexes back into lists of tickers. Months that are only CASH are ['CASH'].
+    Inverse of encode_holdings.
+
+    :param holdings: np.ndarray (months x positions) of ticker indexes
+    :param ticker_list: list
+    :return: list of lists of tickers, one list per month
+    """
+    # CASH (-1) picks the last name
+    names = np.array(list(ticker_list) + ['CASH'], dtype=object)
+    return [['CASH'] if row[0] == CASH else list(names[row]) for row in holdings]
+
+
+def calculate_hurdle(tbil_performance_pretax: np.ndarray, lookback_months: int) -> np.ndarray:
+    """
+    Returns the momentum a ticker needs to beat to be held, i.e. the t-bill return over the
+    lookback period. E.g. with a 5% t-bill rate, a 6 month lookback has a hurdle of ~2.5%.
+
+    :param tbil_performance_pretax: np.ndarray of monthly t-bill performance, e.g. 1.004
+    :param lookback_months: int
+    :return: np.ndarray
+    """
+    return (tbil_performance_pretax - 1) * lookback_months / 12 + 1
+
+
+def select_holdings(momentum: np.ndarray, hurdle: np.ndarray, max_holdings: int) -> np.ndarray:
+    """
+    For each month, selects the max_holdings tickers with the best momentum. Every position that
+    cannot be filled with a ticker beating the hurdle is CASH (-1).
+    Ties are broken by the order of the tickers.
+
+    Uses a partial sort: only the selected tickers get sorted, not the full ticker axis.
+
+    :param momentum: np.ndarray (months x tickers)
+    :param hurdle: np.ndarray (months)
+    :param max_holdings: int
+    :return: np.ndarray (months x max_holdings) of ticker indexes
+    """
+
+    n_tickers = momentum.shape[-1]
+    n_selected = min(max_holdings, n_tickers)
+
+    # NaN momentum (e.g. ticker not yet available) never beats the hurdle
+    beats_hurdle = momentum > hurdle[..., None]
+    ranked_momentum = np.where(beats_hurdle, momentum, -np.inf)
+
+    # momentum of the n_selected-th best ticker. Everything better gets selected and ties
+    # at the threshold get filled up in ticker order
+    threshold = -np.partition(-ranked_momentum, n_selected - 1, axis=-1)
+    threshold = threshold[..., n_selected - 1:n_selected]
+    above = ranked_momentum > threshold
+    at_threshold = ranked_momentum == threshold
+    n_missing = n_selected - above.sum(axis=-1, keepdims=True)
+    selected = above | (at_threshold & (np.cumsum(at_threshold, axis=-1) <= n_missing))
+
+    # exactly n_selected tickers per month, in ticker order
+    shape = momentum.shape[:-1] + (n_selected,)
+    top = np.nonzero(selected.reshape(-1, n_tickers))[1].reshape(shape)
+
+    # sort the selected tickers by momentum (best first), ties by ticker order
+    top_momentum = np.take_along_axis(ranked_momentum, top, axis=-1)
+    order = np.argsort(-top_momentum, axis=-1, kind='stable')
+    top = np.take_along_axis(top, order, axis=-1)
+    top = np.where(np.take_along_axis(beats_hurdle, top, axis=-1), top, CASH)
+
+    # more positions than tickers -> the remaining positions are CASH
+    if max_holdings > n_tickers:
+        cash = np.full(momentum.shape[:-1] + (max_holdings - n_tickers,), CASH)
+        top = np.concatenate([top, cash], axis=-1)
+    return top
+
+
+def calculate_position_weights(momentum: np.ndarray, hurdle: np.ndarray, holdings: np.ndarray,
+                               holding_weighting: str = 'equal') -> np.ndarray:
+    """
+    Returns the share of the portfolio in each position.
+
+    equal: every position gets 1 / positions
+    momentum: every CASH position gets 1 / positions. The rest gets split between the tickers
+              in proportion to how much their momentum beats the hurdle.
+
+    :param momentum: np.ndarray (months x tickers)
+    :param hurdle: np.ndarray (months)
+    :param holdings: np.ndarray (months x positions) of ticker indexes
+    :param holding_weighting: str, 'equal' or 'momentum'
+    :return: np.ndarray (months x positions)
+    """
+
+    n_positions = holdings.shape[-1]
+    equal_weights = np.full(holdings.shape, 1 / n_positions)
+    if holding_weighting == 'equal':
+        return equal_weights
+    if holding_weighting != 'momentum':
+        raise ValueError(f'holding_weighting has to be "equal" or "momentum", not '
+                         f'{holding_weighting}.')
+
+    is_cash = holdings == CASH
+    held_momentum = np.take_along_axis(momentum, np.where(is_cash, 0, holdings), axis=-1)
+    excess = np.where(is_cash, 0.0, held_momentum - hurdle[..., None])
+    total_excess = excess.sum(axis=-1, keepdims=True)
+    invested = (~is_cash).sum(axis=-1, keepdims=True) / n_positions
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        momentum_weights = np.where(is_cash, 1 / n_positions, invested * excess / total_excess)
+    # months without any excess (e.g. all CASH) fall back to equal weights
+    return np.where(total_excess > 0, momentum_weights, equal_weights)
+
+
+def running_count(mask: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    Counts consecutive True values along an axis, e.g. [1, 1, 0, 1] -> [1, 2, 0, 1]
+
+    :param mask: np.ndarray of bools
+    :param axis: int
+    :return: np.ndarray of ints
+    """
+    counts = np.cumsum(mask, axis=axis)
+    resets = np.maximum.accumulate(np.where(mask, 0, counts), axis=axis)
+    return counts - resets
+
+
+def calculate_months_held(holdings: np.ndarray, n_tickers: int, max_months: int = 12):
+    """
+    For each month and ticker, counts for how many consecutive months before the current
+    month the ticker was held.
+
+    Shortcut: stop at max_months. We only care about long term vs short term
+
+    :param holdings: np.ndarray (months x positions) of ticker indexes
+    :param n_tickers: int
+    :param max_months: int
+    :return: np.ndarray (months x tickers)
+    """
+
+    held = np.zeros(holdings.shape[:-1] + (n_tickers + 1,), dtype=bool)
+    # CASH (-1) gets written into the extra last column, which is dropped afterwards
+    np.put_along_axis(held, holdings, True, axis=-1)
+    held = held[..., :n_tickers]
+
+    held_consecutively = running_count(held, axis=-2)
+
+    months_held = np.zeros_like(held_consecutively)
+    months_held[..., 1:, :] = held_consecutively[..., :-1, :]
+    return np.minimum(months_held, max_months)
+
+
+def calculate_returns(close: np.ndarray, adj_close: np.ndarray, holdings: np.ndarray,
+                      st_gains_rates: np.ndarray, lt_gains_rates: np.ndarray,
+                      income_rates: np.ndarray, position_weights: np.ndarray = None) -> dict:
+    """
+    Calculates the monthly returns and taxes based on the holdings. CASH positions have no gains
+    or losses (money market holding gets accounted for with leverage).
+
+    Returns for the last month are unknown -> no gains, performance of 1.
+
+    Holdings can have leading dimensions (e.g. multiple parameter variants) that the prices
+    get broadcast to.
+
+    :param close: np.ndarray (months x tickers)
+    :param adj_close: np.ndarray (months x tickers)
+    :param holdings: np.ndarray (months x positions) of ticker indexes
+    :param st_gains_rates: np.ndarray (tickers)
+    :param lt_gains_rates: np.ndarray (tickers)
+    :param income_rates: np.ndarray (tickers)
+    :param position_weights: np.ndarray, share of the portfolio in each position, broadcastable
+                             to holdings. Default: every position gets the same weight
+    :return: dict of np.ndarrays (months)
+    """
+
+    n_tickers = close.shape[-1]
+    is_cash = holdings == CASH
+    ticker_idx = np.where(is_cash, 0, holdings)
+    if position_weights is None:
+        position_weights = np.full(holdings.shape[-1], 1 / holdings.shape[-1])
+
+    # gains for every ticker from this month to the next
+    cap_gains_by_ticker = np.zeros_like(close)
+    total_gains_by_ticker = np.zeros_like(adj_close)
+    cap_gains_by_ticker[..., :-1, :] = close[..., 1:, :] / close[..., :-1, :] - 1
+    total_gains_by_ticker[..., :-1, :] = adj_close[..., 1:, :] / adj_close[..., :-1, :] - 1
+    div_gains_by_ticker = total_gains_by_ticker - cap_gains_by_ticker
+
+    months_held = calculate_months_held(holdings, n_tickers)
+    gains_rates = np.where(months_held >= 12, lt_gains_rates, st_gains_rates)
+    taxes_by_ticker = (cap_gains_by_ticker * gains_rates +
+                       div_gains_by_ticker * income_rates)
+
+    by_ticker_shape = holdings.shape[:-1] + (n_tickers,)
+    result = {}
+    for name, by_ticker in [('cap_gains', cap_gains_by_ticker),
+                            ('div_gains', div_gains_by_ticker),
+                            ('taxes', taxes_by_ticker)]:
+        by_ticker = np.broadcast_to(by_ticker, by_ticker_shape)
+        by_position = np.take_along_axis(by_ticker, ticker_idx, axis=-1)
+        by_position = np.where(is_cash, 0.0, by_position * position_weights)
+        result[name] = by_position.sum(axis=-1)
+
+    result['cash_portion'] = (is_cash * position_weights).sum(axis=-1)
+    result['performance_pretax'] = result['cap_gains'] + result['div_gains'] + 1
+    result['performance_posttax'] = (result['cap_gains'] + result['div_gains'] -
+                                     result['taxes'] + 1)
+    return result
+
+
+def calculate_leveraged_ledger(performance_pretax: np.ndarray, taxes: np.ndarray,
+                               cash_portion: np.ndarray, mm_performance_pretax: np.ndarray,
+                               mm_taxes: np.ndarray, libor: np.ndarray,
+                               months_of_year: np.ndarray, leverage: float,
+                               borrowing_cost_above_libor: float, start_idx: int = 0,
+                               initial_value: float = 10000,
+                               initial_taxes_due: float = 0.0) -> dict:
+    """
+    Applies leverage, money market returns for the cash portion, borrowing costs and annual
+    tax payments to the (unleveraged) monthly returns of a portfolio.
+
+    Leverage, cash share and borrowing costs are calculated element-wise. Portfolio values get
+    compounded with cumulative products within each tax year and the taxes due get paid at the
+    end of each December.
+    Arrays can have leading dimensions (e.g. multiple portfolios) with months along the last axis.
+
+    :param performance_pretax: np.ndarray, e.g. 1.01 -> 1% gain
+    :param taxes: np.ndarray, taxes due as share of the portfolio value
+    :param cash_portion: np.ndarray, share of the portfolio held in cash
+    :param mm_performance_pretax: np.ndarray of money market holding returns or None if the cash
+                                  portion does not get invested
+    :param mm_taxes: np.ndarray of money market holding taxes or None
+    :param libor: np.ndarray of libor rates, e.g. 102.5 -> 2.5%
+    :param months_of_year: np.ndarray of ints 1-12
+    :param leverage: float
+    :param borrowing_cost_above_libor: float, e.g. 1.5 -> 1.5% above libor
+    :param start_idx: int, first month to simulate. Earlier months keep their initial values
+    :param initial_value: float, portfolio value before start_idx
+    :param initial_taxes_due: float, taxes due before start_idx
+    :return: dict of np.ndarrays
+    """
+
+    shape = np.broadcast(performance_pretax, taxes, cash_portion).shape
+    n_months = shape[-1]
+
+    lev_performance_pretax = leverage * (performance_pretax - 1) + 1
+    percentage_cash = 1 - ((1 - cash_portion) * leverage)
+    taxes_rate = leverage * taxes
+
+    # if we hold some cash, put it into the money market holding
+    holds_cash = percentage_cash >= 0
+    if mm_performance_pretax is not None:
+        lev_performance_pretax = lev_performance_pretax + np.where(
+            holds_cash, percentage_cash * (mm_performance_pretax - 1), 0.0)
+        taxes_rate = taxes_rate + np.where(holds_cash, mm_taxes * percentage_cash, 0.0)
+
+    # otherwise, we are borrowing money for leverage. monthly_borrowing_rate is the monthly
+    # borrowing cost, e.g. 0.01 -> leverage costs 1% of the leveraged capital per month
+    if np.all(holds_cash):
+        leverage_costs = np.zeros(shape)
+    else:
+        monthly_borrowing_rate = ((libor + borrowing_cost_above_libor) / 100) ** (1 / 12) - 1
+        leverage_costs = np.where(holds_cash, 0.0, -percentage_cash * monthly_borrowing_rate)
+    lev_performance_pretax = lev_performance_pretax - leverage_costs
+
+    lev_performance_pretax = np.broadcast_to(lev_performance_pretax, shape)
+    taxes_rate = np.broadcast_to(taxes_rate, shape)
+
+    lev_performance_posttax = np.full(shape, initial_value, dtype=float)
+    taxes_month = np.zeros(shape)
+    taxes_due_total = np.zeros(shape)
+    taxes_paid = np.zeros(shape)
+
+    # each tax year runs until the end of december (or the last month)
+    year_ends = [idx for idx in range(start_idx, n_months)
+                 if months_of_year[idx] == 12 or idx == n_months - 1]
+
+    prev_total = np.full(shape[:-1], initial_value, dtype=float)
+    prev_taxes_due = np.full(shape[:-1], initial_taxes_due, dtype=float)
+    year_start = start_idx
+    for year_end in year_ends:
+        year = slice(year_start, year_end + 1)
+        totals = prev_total[..., None] * np.cumprod(lev_performance_pretax[..., year], axis=-1)
+        prev_totals = np.concatenate([prev_total[..., None], totals[..., :-1]], axis=-1)
+
+        taxes_month[..., year] = taxes_rate[..., year] * prev_totals
+        taxes_due = prev_taxes_due[..., None] + np.cumsum(taxes_month[..., year], axis=-1)
+
+        # end of december -> pay taxes
+        if months_of_year[year_end] == 12:
+            due = taxes_due[..., -1]
+            paid = np.where(due > 0, due, 0.0)
+            totals[..., -1] -= paid
+            taxes_due[..., -1] -= paid
+            taxes_paid[..., year_end] = paid
+
+        lev_performance_posttax[..., year] = totals
+        taxes_due_total[..., year] = taxes_due
+        prev_total = totals[..., -1]
+        prev_taxes_due = taxes_due[..., -1]
+        year_start = year_end + 1
+
+    simulated = np.arange(n_months) >= start_idx
+    return {
+        'lev_performance_pretax': np.where(simulated, lev_performance_pretax, 1.0),
+        'taxes_month': taxes_month,
+        'taxes_due_total': taxes_due_total,
+        'taxes_paid': taxes_paid,
+        'lev_performance_posttax': lev_performance_posttax,
+        'leverage': np.where(simulated, leverage, 0.0) * np.ones(shape),
+        'leverage_costs': np.where(simulated, leverage_costs, 0.0) * np.ones(shape),
+        'cash_portion': np.where(simulated, np.maximum(0, percentage_cash), cash_portion)
+    }
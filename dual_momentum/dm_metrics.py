@@ -0,0 +1,240 @@
+"""
+Risk and return metrics for many return series at once.
+
+All functions take 2-D arrays with one series per row and months along the last axis, e.g.
+(strategy pretax, strategy posttax, S&P 500 pretax, S&P 500 posttax) x months.
+Every metric is calculated in O(months) with cumulative numpy operations.
+"""
+
+import numpy as np
+
+from dual_momentum.dm_engine import running_count
+
+
+def calculate_drawdowns(cumulative: np.ndarray) -> np.ndarray:
+    """
+    Returns the drawdown of each month as share of the highest value so far, e.g. 0.8 -> 20%
+    below the high. 1 means that the series is at a high.
+
+    The first month has no earlier high and is 0.
+
+    :param cumulative: np.ndarray (series x months) of cumulative performance
+    :return: np.ndarray (series x months)
+    """
+    drawdowns = cumulative / np.maximum.accumulate(cumulative, axis=-1)
+    drawdowns[..., 0] = 0.0
+    return drawdowns
+
+
+def calculate_max_drawdowns(drawdowns: np.ndarray) -> tuple:
+    """
+    Returns the max drawdown of each series and the index of the month when it was reached
+    (the first one if it was reached multiple times). Series that never fell below their high
+    have a max drawdown of 1 and an index of -1.
+
+    :param drawdowns: np.ndarray (series x months), see calculate_drawdowns
+    :return: (np.ndarray, np.ndarray)
+    """
+    # skip the first month, which has no drawdown
+    drawdowns = np.where(np.isnan(drawdowns[..., 1:]), np.inf, drawdowns[..., 1:])
+    max_dd_idx = np.argmin(drawdowns, axis=-1)
+    max_dd = np.minimum(np.take_along_axis(drawdowns, max_dd_idx[..., None], axis=-1)[..., 0],
+                        1.0)
+    return max_dd, np.where(max_dd < 1.0, max_dd_idx + 1, -1)
+
+
+def calculate_underwater_months(drawdowns: np.ndarray) -> np.ndarray:
+    """
+    Returns the longest number of consecutive months each series spent below its high
+
+    :param drawdowns: np.ndarray (series x months), see calculate_drawdowns
+    :return: np.ndarray (series)
+    """
+    underwater = drawdowns[..., 1:] < 1.0
+    return running_count(underwater, axis=-1).max(axis=-1, initial=0)
+
+
+def calculate_recovery_months(drawdowns: np.ndarray, max_dd_idx: np.ndarray) -> np.ndarray:
+    """
+    Returns the number of months it took each series to get back to its high after its max
+    drawdown. -1 if the series has not recovered (or never had a drawdown).
+
+    :param drawdowns: np.ndarray (series x months), see calculate_drawdowns
+    :param max_dd_idx: np.ndarray (series), see calculate_max_drawdowns
+    :return: np.ndarray (series)
+    """
+    months = np.arange(drawdowns.shape[-1])
+    recovered = (drawdowns >= 1.0) & (months > max_dd_idx[..., None])
+    has_recovered = recovered.any(axis=-1) & (max_dd_idx >= 0)
+    return np.where(has_recovered, np.argmax(recovered, axis=-1) - max_dd_idx, -1)
+
+
+def calculate_metrics(performance: np.ndarray, riskfree: np.ndarray, start_idx: int) -> dict:
+    """
+    Calculates return and risk metrics for multiple series of monthly returns.
+
+    Returns in excess of the risk free rate are taken from start_idx until the second to last
+    month (the last month has no returns yet).
+
+    :param performance: np.ndarray (series x months) of monthly performance, e.g. 1.01
+    :param riskfree: np.ndarray (months) of the monthly risk free performance, e.g. 1.003
+    :param start_idx: int, first simulated month (months before have a performance of 1)
+    :return: dict of np.ndarrays (series), cumulative and drawdowns are (series x months)
+    """
+
+    performance = np.atleast_2d(performance)
+    cumulative = np.cumprod(performance, axis=-1)
+    drawdowns = calculate_drawdowns(cumulative)
+    max_dd, max_dd_idx = calculate_max_drawdowns(drawdowns)
+
+    total_returns = cumulative[..., -1] - 1
+    years = (performance.shape[-1] - start_idx) / 12
+    cagr = cumulative[..., -1] ** (1 / years)
+
+    return_minus_riskfree = (performance - riskfree)[..., start_idx:-1]
+    mean = np.nanmean(return_minus_riskfree, axis=-1)
+    std = np.nanstd(return_minus_riskfree, axis=-1, ddof=1)
+    downside_dev = np.sqrt(np.nanmean(np.minimum(return_minus_riskfree, 0) ** 2, axis=-1)) * \
+        np.sqrt(12)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'cumulative': cumulative,
+            'drawdowns': drawdowns,
+            'max_dd': max_dd,
+            'max_dd_idx': max_dd_idx,
+            'underwater_months': calculate_underwater_months(drawdowns),
+            'recovery_months': calculate_recovery_months(drawdowns, max_dd_idx),
+            'total_returns': total_returns,
+            'cagr': cagr,
+            'sharpe': np.sqrt(12) * mean / std,
+            'sortino': mean / downside_dev * 12,
+            'annual_volatility': std * np.sqrt(12)
+        }
+
+
+def calculate_window_metrics(performance: np.ndarray, riskfree: np.ndarray, starts: np.ndarray,
+                             ends: np.ndarray) -> dict:
+    """
+    Calculates CAGR, max drawdown and sharpe ratio of one series for every pair of start and
+    end months, e.g. for every start year and every end year, from prefix sums of log returns
+    and excess returns and prefix maxima of the portfolio value.
+
+    Windows include the start and the end month. Pairs with fewer than two months are NaN.
+
+    :param performance: np.ndarray (months) of monthly performance, e.g. 1.01
+    :param riskfree: np.ndarray (months) of the monthly risk free performance
+    :param starts: np.ndarray of month indexes
+    :param ends: np.ndarray of month indexes
+    :return: dict of np.ndarrays (starts x ends)
+    """
+
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    n_months = ends[None, :] - starts[:, None] + 1
+    valid = n_months >= 2
+
+    log_cumulative = np.concatenate([[0.0], np.cumsum(np.log(performance))])
+    excess = performance - riskfree
+    excess_sum = np.concatenate([[0.0], np.cumsum(excess)])
+    excess_sum_sq = np.concatenate([[0.0], np.cumsum(excess ** 2)])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_returns = log_cumulative[ends + 1][None, :] - log_cumulative[starts][:, None]
+        cagr = np.exp(log_returns * 12 / n_months)
+
+        total = excess_sum[ends + 1][None, :] - excess_sum[starts][:, None]
+        total_sq = excess_sum_sq[ends + 1][None, :] - excess_sum_sq[starts][:, None]
+        mean = total / n_months
+        std = np.sqrt(np.maximum(total_sq - n_months * mean ** 2, 0) / (n_months - 1))
+        sharpe = np.sqrt(12) * mean / std
+
+    # value of the portfolio started at each start month (1 before the start), its running
+    # maximum and the lowest drawdown so far: (starts x months)
+    months = np.arange(len(performance))
+    started = months[None, :] >= starts[:, None]
+    value = np.exp(np.where(started, log_cumulative[1:][None, :] -
+                            log_cumulative[starts][:, None], 0.0))
+    drawdowns = value / np.maximum(np.maximum.accumulate(value, axis=-1), 1.0)
+    max_dd = np.minimum.accumulate(drawdowns, axis=-1)[:, ends]
+
+    return {
+        'cagr': np.where(valid, cagr, np.nan),
+        'max_dd': np.where(valid, max_dd, np.nan),
+        'sharpe': np.where(valid, sharpe, np.nan)
+    }
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Returns the sum over the last window months for every month from cumulative sums.
+    Months without a full window are NaN.
+
+    :param values: np.ndarray (series x months)
+    :param window: int
+    :return: np.ndarray (series x months)
+    """
+    cumulative = np.concatenate([np.zeros(values.shape[:-1] + (1,)),
+                                 np.cumsum(values, axis=-1)], axis=-1)
+    sums = np.full(values.shape, np.nan)
+    sums[..., window - 1:] = cumulative[..., window:] - cumulative[..., :-window]
+    return sums
+
+
+def calculate_rolling_metrics(performance: np.ndarray, benchmark: np.ndarray,
+                              riskfree: np.ndarray, window: int) -> dict:
+    """
+    Calculates CAGR, volatility, sharpe ratio, max drawdown and correlation to a benchmark over
+    the last window months for every month and every series.
+
+    Sums come from cumulative sums. Max drawdowns get calculated on strided views of the
+    log portfolio values, one view per window, without copying them.
+    Months without a full window are NaN.
+
+    :param performance: np.ndarray (series x months) of monthly performance, e.g. 1.01
+    :param benchmark: np.ndarray (months) of monthly benchmark performance, e.g. S&P 500
+    :param riskfree: np.ndarray (months) of the monthly risk free performance
+    :param window: int, months
+    :return: dict of np.ndarrays (series x months)
+    """
+
+    performance = np.atleast_2d(performance)
+    n_months = performance.shape[-1]
+    if not 1 < window <= n_months:
+        raise ValueError(f'window has to be between 2 and {n_months} months, not {window}.')
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_performance = np.log(performance)
+        cagr = np.exp(rolling_sum(log_performance, window) * 12 / window)
+
+        excess = performance - riskfree
+        mean = rolling_sum(excess, window) / window
+        std = np.sqrt(np.maximum(rolling_sum(excess ** 2, window) - window * mean ** 2, 0) /
+                      (window - 1))
+
+        sum_x = rolling_sum(performance, window)
+        sum_y = rolling_sum(benchmark[None, :], window)
+        covariance = rolling_sum(performance * benchmark, window) - sum_x * sum_y / window
+        variance_x = rolling_sum(performance ** 2, window) - sum_x ** 2 / window
+        variance_y = rolling_sum(benchmark[None, :] ** 2, window) - sum_y ** 2 / window
+        correlation = covariance / np.sqrt(variance_x * variance_y)
+
+        # log portfolio values, a window needs the value before its first month
+        log_values = np.ascontiguousarray(np.concatenate(
+            [np.zeros(performance.shape[:-1] + (1,)), np.cumsum(log_performance, axis=-1)],
+            axis=-1))
+        windows = np.lib.stride_tricks.as_strided(
+            log_values, shape=log_values.shape[:-1] + (n_months - window + 1, window + 1),
+            strides=log_values.strides + log_values.strides[-1:], writeable=False)
+        values = np.exp(windows - windows[..., :1])
+        max_dd = np.full(performance.shape, np.nan)
+        max_dd[..., window - 1:] = np.min(values / np.maximum.accumulate(values, axis=-1),
+                                          axis=-1)
+
+        return {
+            'cagr': cagr,
+            'annual_volatility': std * np.sqrt(12),
+            'sharpe': np.sqrt(12) * mean / std,
+            'max_dd': max_dd,
+            'correlation': correlation
+        }
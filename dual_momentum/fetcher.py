@@ -0,0 +1,162 @@
+"""
+Fetches the raw yahoo data of all tickers that a simulation needs before it starts.
+
+A ticker needs its whole chain of early replacements, e.g. VWO -> EEM -> EFA -> AAIEX. ONES
+is not downloaded but is built from EFA. Tickers that are already cached get skipped with
+one batched existence check in redis and a look at the local store, the rest get downloaded by
+a bounded pool of threads.
+
+>>> fetch_tickers(['VTI', 'VNQ'])
+VTI yahoo
+VTI fetched in 1.32s
+...
+{'VTI': 1.32, 'VFINX': 1.1, 'VNQ': 1.24, ...}
+
+refresh_data is the refresh pass for all tickers, run hourly by the refresh service in
+docker-compose.yml with
+python -m dual_momentum.fetcher
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import redis
+
+from dual_momentum.local_store import get_fetch_time, RAW_DATA_MAX_AGE
+from dual_momentum.momentum import build_momentum_store, get_store_key
+from dual_momentum.storage import keys_exist, get_data_version, bump_data_version
+from dual_momentum.ticker_config import TICKER_CONFIG
+from dual_momentum.ticker_data import TickerData
+
+# downloads are io bound. More workers than this mostly trigger yahoo's rate limits.
+MAX_FETCH_WORKERS = 8
+
+# ONES (all 1.0) uses the dates of EFA, see TickerData.load_ticker_data
+ONES_SOURCE_TICKER = 'EFA'
+
+
+def get_required_tickers(tickers: list, use_early_replacements: bool = True) -> list:
+    """
+    Returns all tickers whose raw data is needed to load the passed tickers, i.e. the tickers
+    themselves and their early replacements. ONES and tickers with an index replacement need
+    EFA and its replacements.
+
+    :param tickers: list
+    :param use_early_replacements: bool
+    :return: list, in the order in which the tickers were first reached
+    """
+
+    required = {}
+    to_visit = list(tickers)
+    while to_visit:
+        ticker = to_visit.pop(0)
+        if ticker in required:
+            continue
+
+        if ticker == 'ONES':
+            # ONES is built from EFA, which is always loaded with its early replacements
+            required[ticker] = None
+            to_visit += get_required_tickers([ONES_SOURCE_TICKER], use_early_replacements=True)
+            continue
+
+        required[ticker] = None
+        if use_early_replacements and TICKER_CONFIG[ticker]['early_replacement']:
+            to_visit.append(TICKER_CONFIG[ticker]['early_replacement'])
+        if TICKER_CONFIG[ticker]['early_monthly_index_replacement']:
+            to_visit.append('ONES')
+
+    return [ticker for ticker in required if ticker != 'ONES']
+
+
+def fetch_tickers(tickers: list, use_early_replacements: bool = True,
+                  force_new_data: bool = False, max_workers: int = MAX_FETCH_WORKERS,
+                  changed_tickers: set = None) -> dict:
+    """
+    Downloads the raw data of the tickers and their replacements that are not cached yet.
+
+    :param tickers: list
+    :param use_early_replacements: bool
+    :param force_new_data: bool, download all tickers even if they are cached
+    :param max_workers: int, maximum number of parallel downloads
+    :param changed_tickers: set, optional. Tickers with new prices get added to it
+    :return: dict, {ticker: seconds it took to fetch}
+    """
+
+    tickers = get_required_tickers(tickers, use_early_replacements=use_early_replacements)
+    if not force_new_data:
+        try:
+            cached = keys_exist([TickerData(ticker).redis_key_yahoo for ticker in tickers])
+        except redis.exceptions.ConnectionError:
+            cached = [False] * len(tickers)
+        tickers = [ticker for ticker, is_cached in zip(tickers, cached)
+                   if not is_cached and not is_stored_locally(ticker)]
+    if not tickers:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tickers))) as executor:
+        fetch_times = executor.map(
+            lambda t: fetch_ticker(t, force_new_data, changed_tickers=changed_tickers), tickers)
+        return dict(zip(tickers, fetch_times))
+
+
+def fetch_ticker(ticker: str, force_new_data: bool = False,
+                 changed_tickers: set = None) -> float:
+    """
+    Downloads the raw data of one ticker and returns how long it took
+
+    :param ticker: str
+    :param force_new_data: bool
+    :param changed_tickers: set, optional. The ticker gets added to it if its prices changed
+    :return: float, seconds
+    """
+    start_time = time.time()
+    ticker_data = TickerData(ticker=ticker, force_new_data=force_new_data)
+    ticker_data.load_raw_data_or_get_from_yahoo()
+    if ticker_data.prices_changed and changed_tickers is not None:
+        changed_tickers.add(ticker)
+    fetch_time = time.time() - start_time
+    print(f'{ticker} fetched in {round(fetch_time, 2)}s')
+    return fetch_time
+
+
+def refresh_data(max_workers: int = MAX_FETCH_WORKERS) -> set:
+    """
+    Refresh pass: downloads all outdated tickers in TICKER_CONFIG. If any prices changed, the
+    momentum store gets built for the next data version, which then replaces the current one.
+    Data derived from multiple tickers (momentum stores, signals, benchmarks) thus only changes
+    once per pass and requests never build the momentum store themselves.
+
+    :param max_workers: int, maximum number of parallel downloads
+    :return: set, tickers with new prices
+    """
+
+    changed_tickers = set()
+    fetch_tickers([t for t in TICKER_CONFIG if t not in ['ONES', 'TBIL']],
+                  max_workers=max_workers, changed_tickers=changed_tickers)
+
+    data_version = get_data_version()
+    if changed_tickers:
+        # build the store before bumping, so requests always find one
+        build_momentum_store(data_version=data_version + 1)
+        bump_data_version()
+    elif not keys_exist([get_store_key(True, -1, data_version)])[0]:
+        build_momentum_store(data_version=data_version)
+
+    print(f'refreshed data, {len(changed_tickers)} tickers with new prices')
+    return changed_tickers
+
+
+def is_stored_locally(ticker: str) -> bool:
+    """
+    Returns True if the local store has data of the ticker that is not outdated
+
+    :param ticker: str
+    :return: bool
+    """
+    fetched_at = get_fetch_time(ticker)
+    return fetched_at is not None and time.time() - fetched_at <= RAW_DATA_MAX_AGE
+
+
+if __name__ == '__main__':
+    refresh_data()
@@ -7,25 +7,41 @@ import requests
 import pandas as pd
 from dual_momentum.dm_config import DATA_PATH
 from dual_momentum.storage import read_from_redis, write_to_redis
+from dual_momentum.panel import MonthlyPanel
+from dual_momentum.data_bundle import load_index_data
+
+FRED_SERIES = {
+    'libor_rate':           'USDONTD156N',      # overnight libor
+    'tbil_rate':            'TB3MS',            # 3 month t bill rate
+    'term_premium_10y':     'ACMTP10',          # 10 year term premium
+    'treasuries_10y_yield': 'GS10'              # 10 year constant maturity yield
+}
 
 
 def load_fred_data(name, return_type='dict'):
     """
+    Loads a FRED series either as a dict ({(1980, 1): 111.5, ...}), as a dataframe or as a
+    MonthlyPanel with an 'index' column.
+
+    Dict and panel values have 100 added to them, e.g. 111.5 -> 11.5%. Missing months in the
+    panel get filled with the previous month.
 
-    :param name:
+    :param name: str
+    :param return_type: 'dict', 'df', or 'panel'
     :return:
     """
+
+    if return_type == 'panel':
+        panel = MonthlyPanel.from_dict(load_fred_data(name, return_type='dict'), name='index')
+        panel.fill_forward('index')
+        return panel
+
     data = read_from_redis(key=f'{name}_{return_type}')
     if data is not None:
         print("cache", name, return_type)
         return data
 
-    index_names = {
-        'libor_rate':           'USDONTD156N',      # overnight libor
-        'tbil_rate':            'TB3MS',            # 3 month t bill rate
-        'term_premium_10y':     'ACMTP10',          # 10 year term premium
-        'treasuries_10y_yield': 'GS10'              # 10 year constant maturity yield
-    }
+    index_names = dict(FRED_SERIES)
     # add secondary mapping to allow lookup by values
     for n in list(index_names.values()):
         index_names[n] = n
@@ -55,37 +71,23 @@ def load_fred_data(name, return_type='dict'):
     elif return_type == 'df':
         return df
     else:
-        raise ValueError(f"return_type for load_fred_data has to be 'dict' or 'df' but not "
-                         f"{return_type}.")
+        raise ValueError(f"return_type for load_fred_data has to be 'dict', 'df', or 'panel' "
+                         f"but not {return_type}.")
 
 
 def parse_index_data(file_path, index_name):
     """
     Given a downloaded index file, parses the data into the usual format for this library
 
+    The monthly values come from the compiled data bundle if it is up to date, see
+    data_bundle.load_index_data. Missing values (e.g. '.' for libor rates) are skipped.
+
     :param file_path:
     :return:
     """
 
-    data = {}
-    with open(file_path) as csvfile:
-        r = csv.reader(csvfile)
-        for idx, row in enumerate(r):
-            if idx == 0: continue
-
-            year = int(row[0][:4])
-            month = int(row[0][5:7])
-
-            # for libor rates, some values are simply periods ('.'). I don't know why
-            try:
-                val = float(row[1])
-            except ValueError:
-                continue
-
-            if val == 0:
-                continue
-
-            data[(year, month)] = val + 100
+    index_data = load_index_data(Path(file_path).name)[index_name].dropna()
+    data = {month: value + 100 for month, value in index_data.items()}
 
     today = datetime.datetime.today()
     last_month_date = today - relativedelta(months=1)
@@ -187,6 +189,26 @@ def download_term_premium_data():
         writer.writerows(data)
 
 
+def download_missing_fred_data():
+    """
+    Downloads all FRED series that haven't been downloaded yet, e.g. before compiling the data
+    bundle. Series that can't be downloaded get downloaded again when they are loaded.
+
+    :return:
+    """
+
+    for index_name in FRED_SERIES.values():
+        if Path(DATA_PATH, 'index_data', f'{index_name}.csv').exists():
+            continue
+        try:
+            if index_name == 'ACMTP10':
+                download_term_premium_data()
+            else:
+                download_fred_data(index_name)
+        except Exception as e:
+            print(f'{index_name} could not be downloaded: {e}')
+
+
 def download_fred_data(index_name):
     """
     Downloads updated FRED data
@@ -0,0 +1,116 @@
+"""
+Persistent on-disk store for the raw daily ticker data, one Arrow IPC file per ticker in
+DATA_PATH/ticker_data.
+
+Redis only keeps the raw data for an hour. The local store keeps it across redis restarts,
+so tickers only need to be downloaded again once they are outdated.
+
+Files get read through memory maps, i.e. only the pages that are used get loaded. Files get
+written to a temporary file first and then moved into place with os.replace, which is
+atomic, so other gunicorn workers never see a partially written file.
+
+>>> write_ticker_data('SPY', df)
+>>> read_ticker_data('SPY', max_age=3600)
+
+"""
+
+import os
+from pathlib import Path
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+from dual_momentum.dm_config import DATA_PATH
+
+LOCAL_STORE_PATH = Path(DATA_PATH, 'ticker_data')
+
+# raw data younger than this doesn't get downloaded again, same as the redis expiration
+RAW_DATA_MAX_AGE = 3600
+
+
+def get_ticker_path(ticker: str) -> Path:
+    """
+    Path of the arrow file of a ticker
+
+    :param ticker: str
+    :return: Path
+    """
+    return Path(LOCAL_STORE_PATH, f'{ticker}.arrow')
+
+
+def write_ticker_data(ticker: str, df: pd.DataFrame, fetched_at: float = None):
+    """
+    Stores the daily data of a ticker, replacing earlier data atomically
+
+    :param ticker: str
+    :param df: pd.DataFrame with a DatetimeIndex, e.g. Close and Adj Close
+    :param fetched_at: float, unix time when the data was downloaded. Default: now
+    :return:
+    """
+
+    if fetched_at is None:
+        fetched_at = time.time()
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata({**table.schema.metadata,
+                                           b'fetched_at': str(fetched_at).encode()})
+
+    os.makedirs(LOCAL_STORE_PATH, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=LOCAL_STORE_PATH, suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as sink:
+            writer = pa.RecordBatchFileWriter(sink, table.schema)
+            writer.write_table(table)
+            writer.close()
+        os.replace(temp_path, get_ticker_path(ticker))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def read_ticker_data(ticker: str, max_age: float = None):
+    """
+    Returns the stored daily data of a ticker. Returns None if the ticker is not stored or if
+    it was downloaded more than max_age seconds ago.
+
+    :param ticker: str
+    :param max_age: float, seconds. None -> any age
+    :return: pd.DataFrame or None
+    """
+
+    path = get_ticker_path(ticker)
+    if not path.exists():
+        return None
+
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        if max_age is not None and time.time() - get_fetched_at(reader.schema) > max_age:
+            return None
+        return reader.read_all().to_pandas()
+
+
+def get_fetch_time(ticker: str):
+    """
+    Returns when the stored data of a ticker was downloaded (unix time) without reading the
+    data. None if the ticker is not stored.
+
+    :param ticker: str
+    :return: float or None
+    """
+
+    path = get_ticker_path(ticker)
+    if not path.exists():
+        return None
+    with pa.memory_map(str(path)) as source:
+        return get_fetched_at(pa.ipc.open_file(source).schema)
+
+
+def get_fetched_at(schema: pa.Schema) -> float:
+    """
+    Reads the download time from the metadata of a stored file
+
+    :param schema: pa.Schema
+    :return: float
+    """
+    return float(schema.metadata[b'fetched_at'])
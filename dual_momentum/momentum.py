@@ -0,0 +1,306 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from dual_momentum.panel import align_months
+from dual_momentum.ticker_config import TICKER_CONFIG
+from dual_momentum.ticker_data import TickerData
+from dual_momentum.storage import write_to_redis, read_from_redis, get_data_version
+
+MAX_LOOKBACK_MONTHS = 24
+
+# refresh passes run hourly and build the store again if it expired
+MOMENTUM_STORE_EXPIRATION = 3 * 3600
+
+# momentum stores shared by all components in this process.
+# {store name: (redis key incl. data version, MomentumStore)}
+_MOMENTUM_STORES = {}
+
+
+class MomentumStore:
+    """
+    MomentumStore holds capital gains and total gains over every lookback period from 1 to
+    MAX_LOOKBACK_MONTHS for a set of tickers as (ticker x lookback x month) arrays.
+
+    The store gets built once per data version and then shared by all components, which only
+    need to look up their momentum.
+
+    >>> store = get_momentum_store(['VTI', 'VNQ'])
+    >>> momentum = store.pretax_momentum('VTI', lookback_months=12)
+
+    """
+
+    def __init__(self, tickers: list, first_month: int, close: np.ndarray,
+                 adj_close: np.ndarray, cap_dur: np.ndarray = None,
+                 total_dur: np.ndarray = None):
+        """
+        :param tickers: list of tickers
+        :param first_month: int, month number of the first month (see panel.month_ordinal)
+        :param close: np.ndarray (ticker x month)
+        :param adj_close: np.ndarray (ticker x month)
+        :param cap_dur: np.ndarray (ticker x lookback x month). Calculated if not passed
+        :param total_dur: np.ndarray (ticker x lookback x month). Calculated if not passed
+        """
+
+        self.tickers = list(tickers)
+        self.ticker_idx = {ticker: idx for idx, ticker in enumerate(self.tickers)}
+        self.first_month = first_month
+        self.n_months = close.shape[-1]
+        self.close = close
+        self.adj_close = adj_close
+
+        if cap_dur is None or total_dur is None:
+            cap_dur = self.calculate_duration_gains(close)
+            total_dur = self.calculate_duration_gains(adj_close)
+        self.cap_dur = cap_dur
+        self.total_dur = total_dur
+
+        # tax adjusted momentum by (ticker, lookback_months, st_gains, lt_gains, income)
+        self._tax_adjusted = OrderedDict()
+
+    @classmethod
+    def build(cls, tickers: list = None, use_early_replacements: bool = True,
+              day_of_month_for_monthly_data: int = -1, force_new_data: bool = False,
+              data_version: int = None):
+        """
+        Loads the monthly data for the tickers and calculates their momentum.
+        Default: all tickers in TICKER_CONFIG
+
+        :param tickers: list
+        :param use_early_replacements: bool
+        :param day_of_month_for_monthly_data: int
+        :param force_new_data: bool
+        :param data_version: int, data version of the ticker data. Default: current version
+        :return: MomentumStore
+        """
+
+        if tickers is None:
+            tickers = [t for t in TICKER_CONFIG if t not in ['ONES', 'TBIL']]
+
+        ones = TickerData('ONES', data_version=data_version).panel_monthly
+        close = np.empty((len(tickers), len(ones)))
+        adj_close = np.empty((len(tickers), len(ones)))
+        for idx, ticker in enumerate(tickers):
+            panel = TickerData(ticker=ticker, use_early_replacements=use_early_replacements,
+                               day_of_month_for_monthly_data=day_of_month_for_monthly_data,
+                               force_new_data=force_new_data,
+                               data_version=data_version).panel_monthly
+            close[idx] = panel.column('close', ones.first_month, len(ones))
+            adj_close[idx] = panel.column('adj_close', ones.first_month, len(ones))
+
+        return cls(tickers=tickers, first_month=ones.first_month, close=close,
+                   adj_close=adj_close)
+
+    @staticmethod
+    def calculate_duration_gains(prices: np.ndarray) -> np.ndarray:
+        """
+        Calculates the gains over every lookback period, e.g. price / price 12 months ago
+
+        :param prices: np.ndarray (ticker x month)
+        :return: np.ndarray (ticker x lookback x month)
+        """
+
+        gains = np.full((prices.shape[0], MAX_LOOKBACK_MONTHS, prices.shape[1]), np.nan)
+        for lookback in range(1, min(MAX_LOOKBACK_MONTHS, prices.shape[1] - 1) + 1):
+            gains[:, lookback - 1, lookback:] = prices[:, lookback:] / prices[:, :-lookback]
+        return gains
+
+    def to_dict(self) -> dict:
+        """
+        Returns the store as a dict of lists and arrays that can be stored in redis
+
+        :return: dict
+        """
+        return {'tickers': self.tickers, 'first_month': self.first_month, 'close': self.close,
+                'adj_close': self.adj_close, 'cap_dur': self.cap_dur,
+                'total_dur': self.total_dur}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+    def __contains__(self, ticker):
+        return ticker in self.ticker_idx
+
+    @property
+    def last_month(self) -> int:
+        """
+        Month number of the last month in the store, i.e. the current month
+
+        :return: int
+        """
+        return self.first_month + self.n_months - 1
+
+    def _lookup(self, array: np.ndarray, ticker: str, lookback_months: int, first_month: int,
+                n_months: int) -> np.ndarray:
+
+        idx = self.ticker_idx[ticker]
+        if lookback_months <= MAX_LOOKBACK_MONTHS:
+            values = array[idx, lookback_months - 1]
+        # longer lookbacks are not materialized
+        else:
+            prices = self.close[idx] if array is self.cap_dur else self.adj_close[idx]
+            values = np.full(self.n_months, np.nan)
+            values[lookback_months:] = prices[lookback_months:] / prices[:-lookback_months]
+
+        if first_month is None:
+            return values
+        return align_months(values, self.first_month, first_month, n_months)
+
+    def prices(self, ticker: str, first_month: int = None, n_months: int = None) -> tuple:
+        """
+        Returns the monthly close and adj close prices of a ticker
+
+        :param ticker: str
+        :param first_month: int, optional month number to align the prices to
+        :param n_months: int
+        :return: (np.ndarray, np.ndarray)
+        """
+        idx = self.ticker_idx[ticker]
+        if first_month is None:
+            return self.close[idx], self.adj_close[idx]
+        return (align_months(self.close[idx], self.first_month, first_month, n_months),
+                align_months(self.adj_close[idx], self.first_month, first_month, n_months))
+
+    def pretax_momentum(self, ticker: str, lookback_months: int, first_month: int = None,
+                        n_months: int = None) -> np.ndarray:
+        """
+        Returns the total gains (incl. dividends) over the lookback period for each month
+
+        :param ticker: str
+        :param lookback_months: int
+        :param first_month: int, optional month number to align the momentum to
+        :param n_months: int
+        :return: np.ndarray
+        """
+        return self._lookup(self.total_dur, ticker, lookback_months, first_month, n_months)
+
+    def tax_adjusted_momentum(self, ticker: str, lookback_months: int, tax_rates: dict,
+                              first_month: int = None, n_months: int = None) -> tuple:
+        """
+        Returns the short term and long term momentum after taxes. Computed lazily for each
+        ticker, lookback, and tax rates and then kept in the store.
+
+        :param ticker: str
+        :param lookback_months: int
+        :param tax_rates: dict with 'ST_GAINS', 'LT_GAINS', and 'INCOME'
+        :param first_month: int, optional month number to align the momentum to
+        :param n_months: int
+        :return: (np.ndarray, np.ndarray)
+        """
+
+        key = (ticker, lookback_months, tax_rates['ST_GAINS'], tax_rates['LT_GAINS'],
+               tax_rates['INCOME'])
+        if key not in self._tax_adjusted:
+            cap_dur = self._lookup(self.cap_dur, ticker, lookback_months, None, None)
+            total_dur = self._lookup(self.total_dur, ticker, lookback_months, None, None)
+            div_dur = total_dur - cap_dur
+
+            st = 1 - tax_rates['ST_GAINS']
+            lt = 1 - tax_rates['LT_GAINS']
+            div = 1 - tax_rates['INCOME']
+
+            # ST momentum = capital gains + dividends. Tax cap gains only if greater than 1
+            st_mom = np.where(cap_dur <= 1.0, cap_dur, (cap_dur - 1) * st + 1) + div_dur * div
+            lt_mom = np.where(cap_dur <= 1.0, cap_dur, (cap_dur - 1) * lt + 1) + div_dur * div
+
+            self._tax_adjusted[key] = (st_mom, lt_mom)
+            if len(self._tax_adjusted) > 4096:
+                self._tax_adjusted.popitem(last=False)
+
+        st_mom, lt_mom = self._tax_adjusted[key]
+        if first_month is None:
+            return st_mom, lt_mom
+        return (align_months(st_mom, self.first_month, first_month, n_months),
+                align_months(lt_mom, self.first_month, first_month, n_months))
+
+
+def get_momentum_store(tickers: list = None, use_early_replacements: bool = True,
+                       day_of_month_for_monthly_data: int = -1,
+                       force_new_data: bool = False) -> MomentumStore:
+    """
+    Returns the momentum store for the current data version, which includes at least tickers.
+    Stores get built for all tickers once per refresh pass (see build_momentum_store) and are
+    only read here, shared within the process and through redis.
+
+    If no store with all tickers was built for the current data version, a store for only
+    these tickers gets built for this call without sharing it.
+
+    :param tickers: list. Default: all tickers in TICKER_CONFIG
+    :param use_early_replacements: bool
+    :param day_of_month_for_monthly_data: int
+    :param force_new_data: bool
+    :return: MomentumStore
+    """
+
+    if tickers is None:
+        tickers = [t for t in TICKER_CONFIG if t not in ['ONES', 'TBIL']]
+    tickers = list(dict.fromkeys(tickers))
+
+    if force_new_data:
+        return MomentumStore.build(tickers, use_early_replacements=use_early_replacements,
+                                   day_of_month_for_monthly_data=day_of_month_for_monthly_data,
+                                   force_new_data=True)
+
+    store_name = f'momentum_store{use_early_replacements}{day_of_month_for_monthly_data}'
+    key = get_store_key(use_early_replacements, day_of_month_for_monthly_data,
+                        get_data_version())
+
+    store = None
+    if store_name in _MOMENTUM_STORES and _MOMENTUM_STORES[store_name][0] == key:
+        store = _MOMENTUM_STORES[store_name][1]
+    else:
+        data = read_from_redis(key=key)
+        if data is not None:
+            store = MomentumStore.from_dict(data)
+            # only keep the store of the current data version
+            _MOMENTUM_STORES[store_name] = (key, store)
+
+    if store is None or any(t not in store for t in tickers):
+        print(f'no momentum store with {tickers} for {key}, building it for this request.')
+        store = MomentumStore.build(tickers, use_early_replacements=use_early_replacements,
+                                    day_of_month_for_monthly_data=day_of_month_for_monthly_data)
+    return store
+
+
+def build_momentum_store(use_early_replacements: bool = True,
+                         day_of_month_for_monthly_data: int = -1,
+                         data_version: int = None) -> MomentumStore:
+    """
+    Builds the momentum store of all tickers in TICKER_CONFIG and shares it through redis.
+    Runs once per refresh pass, see fetcher.refresh_data
+
+    :param use_early_replacements: bool
+    :param day_of_month_for_monthly_data: int
+    :param data_version: int, e.g. the next version, so the store is ready before the version
+                         gets bumped. Default: current version
+    :return: MomentumStore
+    """
+
+    if data_version is None:
+        data_version = get_data_version()
+    store = MomentumStore.build(use_early_replacements=use_early_replacements,
+                                day_of_month_for_monthly_data=day_of_month_for_monthly_data,
+                                data_version=data_version)
+    write_to_redis(key=get_store_key(use_early_replacements, day_of_month_for_monthly_data,
+                                     data_version),
+                   value=store.to_dict(), expiration=MOMENTUM_STORE_EXPIRATION)
+    return store
+
+
+def get_store_key(use_early_replacements: bool, day_of_month_for_monthly_data: int,
+                  data_version: int) -> str:
+    """
+    Name of a momentum store (for redis)
+
+    :param use_early_replacements: bool
+    :param day_of_month_for_monthly_data: int
+    :param data_version: int
+    :return: str
+    """
+    return f'momentum_store{use_early_replacements}{day_of_month_for_monthly_data}_{data_version}'
+
+
+if __name__ == '__main__':
+    # build the store for all tickers, usually done by fetcher.refresh_data
+    build_momentum_store()
@@ -0,0 +1,307 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+def month_ordinal(year: int, month: int) -> int:
+    """
+    Turns a (year, month) into an integer month number, e.g. (1980, 1) -> 23760
+    Consecutive months have consecutive month numbers.
+
+    :param year: int
+    :param month: int
+    :return: int
+    """
+    return year * 12 + month - 1
+
+
+def ordinal_to_year_month(ordinal: int) -> tuple:
+    """
+    Turns an integer month number back into a (year, month) tuple
+
+    :param ordinal: int
+    :return: tuple
+    """
+    year, month = divmod(int(ordinal), 12)
+    return year, month + 1
+
+
+def lag(values: np.ndarray, months: int) -> np.ndarray:
+    """
+    Shifts an array by months along the month axis (the first axis), padding with NaN.
+    Equivalent to pd.Series.shift(months)
+
+    :param values: np.ndarray
+    :param months: int, positive -> values from earlier months
+    :return: np.ndarray
+    """
+    shifted = np.full(values.shape, np.nan)
+    if months == 0:
+        shifted[:] = values
+    elif months > 0:
+        shifted[months:] = values[:-months]
+    else:
+        shifted[:months] = values[-months:]
+    return shifted
+
+
+def empty_months(shape: tuple, dtype) -> np.ndarray:
+    """
+    Returns an array for months without data: NaN for floats, None for object arrays and
+    -1 for integer arrays (e.g. holding codes). Floats and ints keep their precision.
+
+    :param shape: tuple
+    :param dtype: np.dtype
+    :return: np.ndarray
+    """
+    dtype = np.dtype(dtype)
+    if dtype == object:
+        return np.empty(shape, dtype=object)
+    elif np.issubdtype(dtype, np.integer):
+        return np.full(shape, -1, dtype=dtype)
+    elif np.issubdtype(dtype, np.floating):
+        return np.full(shape, np.nan, dtype=dtype)
+    else:
+        return np.full(shape, np.nan)
+
+
+def align_months(values: np.ndarray, values_first_month: int, first_month: int,
+                 n_months: int) -> np.ndarray:
+    """
+    Aligns an array with months along the last axis to another range of months by slicing
+    with the offset between the first months. Months not covered by values are empty (see
+    empty_months).
+
+    :param values: np.ndarray
+    :param values_first_month: int, month number of the first month of values
+    :param first_month: int, first month of the requested range
+    :param n_months: int, number of months of the requested range
+    :return: np.ndarray
+    """
+
+    aligned = empty_months(values.shape[:-1] + (n_months,), values.dtype)
+
+    offset = values_first_month - first_month
+    start = max(offset, 0)
+    end = min(offset + values.shape[-1], n_months)
+    if start < end:
+        aligned[..., start:end] = values[..., start - offset:end - offset]
+    return aligned
+
+
+def month_offset_rows(dates: pd.DatetimeIndex, offsets) -> tuple:
+    """
+    Finds the row of the n-th trading day of every month in sorted daily dates, for multiple
+    offsets at once. Offsets work like groupby(month).nth(offset): 0 is the first trading day
+    of a month, -1 the last one.
+
+    Month boundaries are found with searchsorted on the month numbers of the dates, so this
+    is a single pass over the dates for all offsets.
+
+    >>> months, rows = month_offset_rows(df.index, offsets=[0, -1])
+    >>> df['Close'].to_numpy()[rows[:, 1]]  # close of the last trading day of each month
+
+    :param dates: pd.DatetimeIndex, sorted
+    :param offsets: list of ints
+    :return: (np.ndarray of month numbers from the first to the last month,
+              np.ndarray (months x offsets) of rows, -1 if a month has fewer trading days)
+    """
+
+    dates = pd.DatetimeIndex(dates)
+    ordinals = month_ordinal(np.asarray(dates.year, dtype=int), np.asarray(dates.month, dtype=int))
+    months = np.arange(ordinals[0], ordinals[-1] + 1) if len(ordinals) else np.zeros(0, int)
+
+    starts = np.searchsorted(ordinals, months, side='left')[:, None]
+    ends = np.searchsorted(ordinals, months, side='right')[:, None]
+    offsets = np.asarray(offsets, dtype=int)[None, :]
+    rows = np.where(offsets >= 0, starts + offsets, ends + offsets)
+    return months, np.where((rows >= starts) & (rows < ends), rows, -1)
+
+
+def months_checksum(columns: list, n_months: int) -> str:
+    """
+    Returns an md5 checksum of the first n_months of multiple columns, e.g. to check if an
+    earlier simulation used the same prices for the months it keeps.
+
+    :param columns: list of np.ndarrays with months on the first axis
+    :param n_months: int
+    :return: str
+    """
+    md5 = hashlib.md5(str(n_months).encode('utf8'))
+    for values in columns:
+        md5.update(np.ascontiguousarray(values[:n_months], dtype=np.float64).tobytes())
+    return md5.hexdigest()
+
+
+class MonthlyPanel:
+    """
+    MonthlyPanel holds monthly data as contiguous numpy columns keyed by integer month numbers
+    (see month_ordinal). All columns cover the same consecutive months, starting at first_month.
+
+    Aligning data between panels only requires slicing by the offset between the first months,
+    which avoids pandas index alignment on every column assignment.
+
+    >>> panel = MonthlyPanel(first_month=month_ordinal(1980, 1), n_months=12)
+    >>> panel['tbil_rate'] = np.full(12, 105.0)
+    >>> panel.index[0]
+    (1980, 1)
+
+    """
+
+    def __init__(self, first_month: int, n_months: int, columns: dict = None):
+
+        self.first_month = first_month
+        self.n_months = n_months
+        self.columns = {}
+        if columns:
+            for name, values in columns.items():
+                self[name] = values
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: dict = None):
+        """
+        Creates a panel from a dataframe indexed by (year, month) tuples.
+        Months missing from the dataframe are empty in the panel (see empty_months).
+
+        :param df: pd.DataFrame
+        :param columns: dict, maps dataframe columns to panel column names. Default: all columns
+        :return: MonthlyPanel
+        """
+
+        if columns is None:
+            columns = {c: c for c in df.columns}
+
+        ordinals = month_ordinal(np.asarray(df.index.get_level_values(0), dtype=int),
+                                 np.asarray(df.index.get_level_values(1), dtype=int))
+        first_month = int(ordinals[0]) if len(ordinals) else 0
+        n_months = int(ordinals[-1]) - first_month + 1 if len(ordinals) else 0
+        panel = cls(first_month=first_month, n_months=n_months)
+
+        offsets = ordinals - first_month
+        for df_column, name in columns.items():
+            values = df[df_column].to_numpy()
+            column = empty_months(n_months, values.dtype)
+            column[offsets] = values
+            panel[name] = column
+        return panel
+
+    @classmethod
+    def from_dict(cls, data: dict, name: str):
+        """
+        Creates a panel with one column from a dict like {(1980, 1): 105.0, ...}
+
+        :param data: dict
+        :param name: str, column name
+        :return: MonthlyPanel
+        """
+        ordinals = np.array([month_ordinal(year, month) for year, month in data], dtype=int)
+        values = np.array(list(data.values()), dtype=float)
+
+        first_month = int(ordinals.min())
+        panel = cls(first_month=first_month, n_months=int(ordinals.max()) - first_month + 1)
+        column = np.full(panel.n_months, np.nan)
+        column[ordinals - first_month] = values
+        panel[name] = column
+        return panel
+
+    def __len__(self):
+        return self.n_months
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name) -> np.ndarray:
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        if np.isscalar(values):
+            values = np.full(self.n_months, values)
+        values = np.ascontiguousarray(values)
+        if len(values) != self.n_months:
+            raise ValueError(f'Column {name} has {len(values)} months but the panel has '
+                             f'{self.n_months}.')
+        self.columns[name] = values
+
+    @property
+    def last_month(self) -> int:
+        return self.first_month + self.n_months - 1
+
+    @property
+    def months(self) -> np.ndarray:
+        """
+        Integer month numbers of all months in the panel
+
+        :return: np.ndarray
+        """
+        return np.arange(self.first_month, self.first_month + self.n_months)
+
+    @property
+    def months_of_year(self) -> np.ndarray:
+        """
+        Month of the year (1-12) for each month in the panel
+
+        :return: np.ndarray
+        """
+        return self.months % 12 + 1
+
+    @property
+    def index(self) -> list:
+        """
+        (year, month) tuples for each month in the panel, the index used by the dataframes
+
+        :return: list
+        """
+        return [ordinal_to_year_month(m) for m in self.months]
+
+    def column(self, name: str, first_month: int, n_months: int) -> np.ndarray:
+        """
+        Returns a column aligned to another range of months. Months not covered by this panel
+        are empty (see empty_months).
+
+        :param name: str
+        :param first_month: int, first month of the requested range
+        :param n_months: int, number of months of the requested range
+        :return: np.ndarray
+        """
+
+        return align_months(self.columns[name], self.first_month, first_month, n_months)
+
+    def align(self, other, columns: dict = None):
+        """
+        Adds columns from another panel to this panel, aligned to this panel's months
+
+        :param other: MonthlyPanel
+        :param columns: dict, maps columns of other to column names in this panel.
+                        Default: all columns
+        :return:
+        """
+        if columns is None:
+            columns = {c: c for c in other.columns}
+        for other_name, name in columns.items():
+            self[name] = other.column(other_name, self.first_month, self.n_months)
+
+    def fill_forward(self, name: str):
+        """
+        Replaces missing values in a column with the last available value
+
+        :param name: str
+        :return:
+        """
+        values = self.columns[name]
+        valid_idx = np.where(np.isnan(values), 0, np.arange(self.n_months))
+        np.maximum.accumulate(valid_idx, out=valid_idx)
+        self.columns[name] = values[valid_idx]
+
+    def to_frame(self, columns: list = None) -> pd.DataFrame:
+        """
+        Returns the panel as a dataframe indexed by (year, month) tuples
+
+        :param columns: list of column names. Default: all columns
+        :return: pd.DataFrame
+        """
+        if columns is None:
+            columns = list(self.columns)
+        months = self.months
+        index = pd.MultiIndex.from_arrays([months // 12, months % 12 + 1])
+        return pd.DataFrame({c: self.columns[c] for c in columns}, index=index)
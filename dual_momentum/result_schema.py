@@ -0,0 +1,91 @@
+"""
+Result schemas define which columns of the simulation panels get kept and cached, and their
+dtypes. Intermediate columns like {ticker}_close or {ticker}_st_mom are only needed while
+simulating and get dropped.
+
+Performance and portfolio values compound over hundreds of months and stay float64. Taxes
+and cash shares are only summed for one month at a time, so float32 is precise enough.
+Strings like the money market holding are stored as categoricals.
+
+Results sent to the frontend can be encoded as Arrow IPC streams with to_arrow_ipc.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dual_momentum.panel import MonthlyPanel
+
+CATEGORY = 'category'
+
+# columns read by DualMomentumComposite. Holding columns get added per component
+COMPONENT_RESULT_COLUMNS = {
+    'tbil_performance_pretax': np.float64,
+    'performance_pretax': np.float64,
+    'performance_posttax': np.float64,
+    'taxes': np.float32,
+    'cash_portion': np.float32
+}
+
+# columns read by the summaries. Component and money market columns get added per composite
+COMPOSITE_RESULT_COLUMNS = {
+    'tbil_performance_pretax': np.float64,
+    'lev_performance_pretax': np.float64,
+    'lev_performance_posttax': np.float64,
+    'taxes_due_total': np.float64,
+    'cash_portion': np.float32,
+    'mmh': CATEGORY
+}
+
+
+def apply_schema(panel: MonthlyPanel, schema: dict) -> MonthlyPanel:
+    """
+    Returns a panel with only the columns of the schema, cast to their dtypes.
+    Categorical columns stay object arrays in the panel.
+
+    :param panel: MonthlyPanel
+    :param schema: dict, maps column names to dtypes
+    :return: MonthlyPanel
+    """
+    result = MonthlyPanel(first_month=panel.first_month, n_months=len(panel))
+    for column, dtype in schema.items():
+        if dtype == CATEGORY:
+            result[column] = panel[column]
+        else:
+            result[column] = panel[column].astype(dtype, copy=False)
+    return result
+
+
+def to_result_frame(panel: MonthlyPanel, schema: dict) -> pd.DataFrame:
+    """
+    Returns the columns of the schema as a dataframe that can be cached
+
+    :param panel: MonthlyPanel
+    :param schema: dict, maps column names to dtypes
+    :return: pd.DataFrame
+    """
+    df = apply_schema(panel, schema).to_frame(list(schema))
+    for column, dtype in schema.items():
+        if dtype == CATEGORY:
+            df[column] = df[column].astype(CATEGORY)
+    return df
+
+
+def to_arrow_ipc(columns: dict, metadata: dict = None) -> bytes:
+    """
+    Encodes equally long 1-D arrays as an Arrow IPC stream with one record batch
+
+    :param columns: dict, maps column names to np.ndarrays
+    :param metadata: dict of str, stored in the schema metadata
+    :return: bytes
+    """
+    batch = pa.RecordBatch.from_arrays([pa.array(values) for values in columns.values()],
+                                       list(columns))
+    if metadata:
+        batch = batch.replace_schema_metadata(metadata)
+
+    sink = pa.BufferOutputStream()
+    writer = pa.RecordBatchStreamWriter(sink, batch.schema)
+    writer.write_batch(batch)
+    writer.close()
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,207 @@
+"""
+Bulk evaluation of the current signals of many saved portfolios.
+
+Portfolios share most of their tickers and lookbacks. Instead of building one
+DualMomentumComposite per portfolio, prices get loaded once for all tickers, momentum gets
+calculated once per lookback and every distinct component gets evaluated once.
+
+>>> portfolios = [{'parts': parts, 'money_market_holding': 'VGIT'}, ...]
+>>> signals = evaluate_signals(portfolios)
+>>> signals[0]['components'][0]['holdings']
+['VTI']
+
+"""
+
+import numpy as np
+
+from dual_momentum.dm_composite import INVESTED_MONEY_MARKET_HOLDINGS
+from dual_momentum.dm_engine import calculate_hurdle, select_holdings, \
+    calculate_position_weights, decode_holdings, CASH
+from dual_momentum.fred_data import load_fred_data
+from dual_momentum.momentum import get_momentum_store
+from dual_momentum.panel import ordinal_to_year_month
+
+
+def get_ticker_names(ticker_list: list) -> list:
+    """
+    Returns the tickers of a ticker_list that can contain dicts like
+    {'ticker': 'VTI', 'tax_category': 'equities'}
+
+    :param ticker_list: list
+    :return: list
+    """
+    return [t['ticker'] if isinstance(t, dict) else t for t in ticker_list]
+
+
+def get_component_key(part: dict) -> tuple:
+    """
+    Returns everything that determines the holdings of a part. Parts with the same key get
+    evaluated once.
+
+    :param part: dict
+    :return: tuple
+    """
+    tickers = tuple(get_ticker_names(part['ticker_list']))
+    if not part['use_dual_momentum']:
+        return tickers, 0, 1, False, 'equal'
+    return (tickers, part['lookback_months'], min(part['max_holdings'], len(tickers)), True,
+            part.get('holding_weighting', 'equal'))
+
+
+def evaluate_signals(portfolios: list, use_early_replacements: bool = True,
+                     day_of_month_for_monthly_data: int = -1) -> list:
+    """
+    Returns the current holdings and the return of the last month for many portfolios.
+
+    :param portfolios: list of dicts with 'parts' (as passed to DualMomentumComposite) and
+                       'money_market_holding'
+    :param use_early_replacements: bool
+    :param day_of_month_for_monthly_data: int
+    :return: list of dicts, one per portfolio
+    """
+
+    tickers = []
+    for portfolio in portfolios:
+        for part in portfolio['parts']:
+            tickers += get_ticker_names(part['ticker_list'])
+        if portfolio['money_market_holding'] in INVESTED_MONEY_MARKET_HOLDINGS:
+            tickers.append(portfolio['money_market_holding'])
+    tickers = list(dict.fromkeys(tickers))
+
+    max_lookback_months = max([part['lookback_months'] for portfolio in portfolios
+                               for part in portfolio['parts'] if part['use_dual_momentum']],
+                              default=1)
+
+    # load the prices once for all tickers. The previous month needs one more month.
+    store = get_momentum_store(tickers, use_early_replacements=use_early_replacements,
+                               day_of_month_for_monthly_data=day_of_month_for_monthly_data)
+    last_month = store.last_month
+    n_months = max_lookback_months + 2
+    first_month = last_month - n_months + 1
+    adj_close = np.stack([store.prices(ticker, first_month, n_months)[1] for ticker in tickers])
+
+    tbil_rate = load_fred_data('tbil_rate', return_type='panel').column(
+        'index', last_month - 1, 2)
+
+    return evaluate_signals_on_prices(portfolios, tickers, adj_close,
+                                      (tbil_rate / 100) ** (1 / 12),
+                                      ordinal_to_year_month(last_month))
+
+
+def evaluate_signals_on_prices(portfolios: list, tickers: list, adj_close: np.ndarray,
+                               tbil_performance_pretax: np.ndarray, month: tuple) -> list:
+    """
+    Evaluates the signals of all portfolios on the passed prices.
+
+    Holdings get selected for the previous and the current month. The previous holdings give
+    the return of the last month (pretax, unleveraged, CASH earns the money market holding).
+
+    :param portfolios: list of dicts with 'parts' and 'money_market_holding'
+    :param tickers: list of all tickers
+    :param adj_close: np.ndarray (tickers x months), the last month is the current month
+    :param tbil_performance_pretax: np.ndarray of the previous and the current month
+    :param month: tuple, (year, month) of the current month
+    :return: list of dicts, one per portfolio
+    """
+
+    ticker_idx = {ticker: idx for idx, ticker in enumerate(tickers)}
+    last_month_returns = adj_close[:, -1] / adj_close[:, -2] - 1
+
+    components = {}
+    for portfolio in portfolios:
+        for part in portfolio['parts']:
+            components[get_component_key(part)] = None
+
+    # components with the same lookback, max_holdings and weighting get evaluated at once
+    groups = {}
+    for key in components:
+        groups.setdefault(key[1:], []).append(key)
+
+    for (lookback_months, max_holdings, use_dual_momentum, holding_weighting), keys in \
+            groups.items():
+
+        # (components x tickers) indexes into tickers, padded with -1
+        n_tickers = max(len(key[0]) for key in keys)
+        component_tickers = np.full((len(keys), n_tickers), -1)
+        for idx, key in enumerate(keys):
+            component_tickers[idx, :len(key[0])] = [ticker_idx[t] for t in key[0]]
+        padding = component_tickers == -1
+
+        if use_dual_momentum:
+            # momentum of the previous and the current month: (components x 2 x tickers)
+            momentum_by_ticker = adj_close[:, -2:] / \
+                adj_close[:, -2 - lookback_months:adj_close.shape[1] - lookback_months]
+            momentum = momentum_by_ticker[component_tickers].transpose(0, 2, 1)
+            momentum[np.broadcast_to(padding[:, None, :], momentum.shape)] = np.nan
+
+            hurdle = np.broadcast_to(calculate_hurdle(tbil_performance_pretax, lookback_months),
+                                     (len(keys), 2))
+            holdings = select_holdings(momentum, hurdle, max_holdings)
+            weights = calculate_position_weights(momentum, hurdle, holdings, holding_weighting)
+        else:
+            momentum = hurdle = None
+            holdings = np.zeros((len(keys), 2, 1), dtype=int)
+            weights = np.ones((len(keys), 2, 1))
+
+        # return of the previous holdings over the last month. CASH positions are handled by
+        # the portfolio
+        is_cash = holdings == CASH
+        held = np.take_along_axis(component_tickers, np.where(is_cash, 0, holdings)[:, 0],
+                                  axis=-1)
+        position_returns = np.where(is_cash[:, 0], 0.0, last_month_returns[held])
+        returns = (position_returns * weights[:, 0]).sum(axis=-1)
+        cash_portions = (is_cash * weights).sum(axis=-1)
+
+        for idx, key in enumerate(keys):
+            current_holdings = decode_holdings(holdings[idx, 1:], key[0])[0]
+            current_weights = weights[idx, 1, :len(current_holdings)]
+            if current_holdings == ['CASH']:
+                current_weights = [1.0]
+            components[key] = {
+                'holdings': current_holdings,
+                'weights': [float(w) for w in current_weights],
+                # buy and hold doesn't use momentum
+                'momentum': {} if momentum is None else {
+                    t: float(m) for t, m in zip(key[0], momentum[idx, 1])},
+                'hurdle': None if hurdle is None else float(hurdle[idx, 1]),
+                'cash_portion': float(cash_portions[idx, 1]),
+                'last_month_return': float(returns[idx]),
+                'last_month_cash_portion': float(cash_portions[idx, 0])
+            }
+
+    signals = []
+    for portfolio in portfolios:
+        money_market_holding = portfolio['money_market_holding']
+        if money_market_holding in INVESTED_MONEY_MARKET_HOLDINGS:
+            mm_return = last_month_returns[ticker_idx[money_market_holding]]
+        else:
+            mm_return = 0.0
+
+        portfolio_components = []
+        cash_portion = 0.0
+        last_month_return = 0.0
+        for part in portfolio['parts']:
+            component = components[get_component_key(part)]
+            portfolio_components.append({
+                'name': part['name'],
+                'month': month,
+                'holdings': component['holdings'],
+                'weights': component['weights'],
+                'momentum': component['momentum'],
+                'hurdle': component['hurdle'],
+                'weight': part['weight']
+            })
+            cash_portion += part['weight'] * component['cash_portion']
+            last_month_return += part['weight'] * (
+                component['last_month_return'] +
+                component['last_month_cash_portion'] * mm_return)
+
+        signals.append({
+            'month': month,
+            'money_market_holding': money_market_holding,
+            'cash_portion': cash_portion,
+            'last_month_return': float(last_month_return),
+            'components': portfolio_components
+        })
+
+    return signals
@@ -21,6 +21,9 @@ if RUNNING_IN_DOCKER:
 else:
     HOST = 'localhost'
 
+# simulation histories get extended month by month, so they are kept much longer than results
+HISTORY_EXPIRATION = 3600 * 24 * 40
+
 
 def write_to_redis(key: str, value, expiration: int = 3600):
     """
@@ -56,3 +59,76 @@ def read_from_redis(key: str):
         return context.deserialize(val_serialized)
     else:
         return None
+
+
+def read_from_optional_redis(key: str):
+    """
+    Same as read_from_redis for data that is also stored somewhere else, e.g. in the local
+    store. Returns None if redis is not available.
+
+    :param key: str
+    :return:
+    """
+
+    try:
+        return read_from_redis(key)
+    except redis.exceptions.ConnectionError:
+        print(f'redis is not available, could not read {key}.')
+        return None
+
+
+def write_to_optional_redis(key: str, value, expiration: int = 3600):
+    """
+    Same as write_to_redis for data that is also stored somewhere else, e.g. in the local
+    store. Does nothing if redis is not available.
+
+    :param key: str
+    :param value:
+    :param expiration: int, time until value expires in seconds
+    :return:
+    """
+
+    try:
+        write_to_redis(key, value, expiration=expiration)
+    except redis.exceptions.ConnectionError:
+        print(f'redis is not available, could not write {key}.')
+
+
+def keys_exist(keys: list) -> list:
+    """
+    Checks if multiple keys exist in the local redis instance with one round trip
+
+    :param keys: list of str
+    :return: list of bool
+    """
+
+    redis_con = redis.Redis(host=HOST, port=6379, db=0)
+    pipeline = redis_con.pipeline(transaction=False)
+    for key in keys:
+        pipeline.exists(key)
+    return [bool(exists) for exists in pipeline.execute()]
+
+
+def get_data_version() -> int:
+    """
+    Returns the current data version. The data version changes once per refresh pass that
+    downloaded new prices (see fetcher.refresh_data), so it can be used in keys of data derived
+    from multiple tickers.
+
+    :return: int
+    """
+
+    redis_con = redis.Redis(host=HOST, port=6379, db=0)
+    version = redis_con.get(name='data_version')
+    return int(version) if version else 0
+
+
+def bump_data_version():
+    """
+    Marks that new ticker data is available.
+
+    :return:
+    """
+
+    redis_con = redis.Redis(host=HOST, port=6379, db=0)
+    redis_con.incr(name='data_version')
@@ -0,0 +1,21 @@
+"""
+Stand-ins shared by the tests
+"""
+
+from datetime import date
+
+import pandas as pd
+
+
+class LocalDataProvider:
+    """
+    Stand-in for yahoo that serves a fixed history and records the requested ranges
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+        self.requests = []
+
+    def __call__(self, ticker: str, start: date, end: date) -> pd.DataFrame:
+        self.requests.append((start, end))
+        return self.data[pd.Timestamp(start):pd.Timestamp(end)].copy()
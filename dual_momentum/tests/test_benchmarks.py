@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+
+from dual_momentum import benchmarks
+from dual_momentum.benchmarks import register_benchmark, get_benchmark, BENCHMARK_DEFINITIONS
+from dual_momentum.dm_component import DualMomentumComponent
+from dual_momentum.tests.test_dm_engine import generate_component_panel
+
+
+class BuyAndHoldStandIn:
+    """
+    Stand-in for simulate_buy_and_hold that simulates generated prices instead of loading
+    ticker data and records the simulated tickers
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, ticker: str, tax_config: dict, **kwargs):
+        self.calls.append(ticker)
+        component = DualMomentumComponent(
+            name=f'__{ticker}', ticker_list=[ticker], tax_config=tax_config,
+            lookback_months=12, max_holdings=1, use_dual_momentum=False,
+            start_date='1980-01-01', money_market_holding=ticker)
+        component.panel = generate_component_panel([ticker], seed=len(ticker))
+        component.run_vectorized_simulation()
+        return component.panel
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    tax_config = {'fed_st_gains': 0.22, 'fed_lt_gains': 0.15, 'state_st_gains': 0.12,
+                  'state_lt_gains': 0.051}
+
+    def setUp(self):
+        benchmarks._BENCHMARKS.clear()
+        self.max_cached_benchmarks = benchmarks.MAX_CACHED_BENCHMARKS
+        self.simulate = BuyAndHoldStandIn()
+
+    def tearDown(self):
+        benchmarks._BENCHMARKS.clear()
+        benchmarks.MAX_CACHED_BENCHMARKS = self.max_cached_benchmarks
+
+    def get(self, name, tax_config=None, data_version=0):
+        return get_benchmark(name, tax_config=tax_config or self.tax_config,
+                             data_version=data_version, simulate=self.simulate)
+
+    def test_register_benchmark(self):
+        register_benchmark('80/20', {'SPY': 0.8, 'VGIT': 0.2})
+        self.assertEqual(BENCHMARK_DEFINITIONS['80/20'], {'SPY': 0.8, 'VGIT': 0.2})
+        del BENCHMARK_DEFINITIONS['80/20']
+
+    def test_weights_sum_to_one(self):
+        with self.assertRaises(ValueError):
+            register_benchmark('too_much', {'SPY': 0.8, 'VGIT': 0.4})
+
+    def test_60_40(self):
+        blend = self.get('60/40')
+        spy = self.simulate('SPY', self.tax_config)
+        vgit = self.simulate('VGIT', self.tax_config)
+
+        # rebalanced every month -> every month has the weighted average of both tickers
+        for column in ['performance_pretax', 'performance_posttax', 'taxes']:
+            self.assertTrue(np.allclose(blend[column], 0.6 * spy[column] + 0.4 * vgit[column]),
+                            column)
+
+        # without rebalancing, the weights would drift with the performance of the tickers
+        buy_and_hold = 0.6 * np.cumprod(spy['performance_pretax']) + \
+            0.4 * np.cumprod(vgit['performance_pretax'])
+        self.assertFalse(np.allclose(np.cumprod(blend['performance_pretax']), buy_and_hold))
+
+    def test_shared_between_composites(self):
+        # a second composite with the same tax config gets the same series without simulating
+        spy = self.get('SPY')
+        self.assertIs(self.get('SPY'), spy)
+        self.assertEqual(self.simulate.calls, ['SPY'])
+
+        # other tax configs and new data get simulated again
+        other_tax_config = {**self.tax_config, 'fed_st_gains': 0.35}
+        self.assertIsNot(self.get('SPY', tax_config=other_tax_config), spy)
+        self.assertIsNot(self.get('SPY', data_version=1), spy)
+        self.assertEqual(self.simulate.calls, ['SPY'] * 3)
+
+    def test_least_recently_used_gets_dropped(self):
+        benchmarks.MAX_CACHED_BENCHMARKS = 2
+        spy = self.get('SPY')
+        self.get('VGIT')
+        self.get('SPY')
+        self.get('TLT')
+
+        # VGIT was used least recently
+        self.assertIs(self.get('SPY'), spy)
+        self.assertEqual(len(benchmarks._BENCHMARKS), 2)
+        self.get('VGIT')
+        self.assertEqual(self.simulate.calls, ['SPY', 'VGIT', 'TLT', 'VGIT'])
+
+    def test_register_drops_shared_series(self):
+        register_benchmark('80/20', {'SPY': 0.8, 'VGIT': 0.2})
+        self.get('80/20')
+        register_benchmark('80/20', {'SPY': 0.7, 'VGIT': 0.3})
+        self.get('80/20')
+        self.assertEqual(self.simulate.calls, ['SPY', 'VGIT'] * 2)
+        del BENCHMARK_DEFINITIONS['80/20']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from dual_momentum import data_bundle
+from dual_momentum.data_bundle import build_data_bundle, load_index_data, parse_index_csv
+
+
+class TestDataBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index_path = Path(self.temp_dir.name, 'index_data')
+        self.bundle_path = Path(self.temp_dir.name, 'index_data.arrow')
+        shutil.copytree(data_bundle.INDEX_DATA_PATH, self.index_path)
+
+        # FRED style series with missing values ('.' and 0) and multiple days per month
+        with open(Path(self.index_path, 'TB3MS.csv'), 'w') as out:
+            out.write('DATE,TB3MS\n1979-12-03,12.0\n1980-01-02,11.5\n1980-01-15,.\n'
+                      '1980-02-01,11.8\n1980-02-29,0\n1980-04-01,12.2\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def load(self, file_name):
+        return load_index_data(file_name, index_data_path=self.index_path,
+                               bundle_path=self.bundle_path)
+
+    def test_parse_fred_data(self):
+        data = parse_index_csv(Path(self.index_path, 'TB3MS.csv'))['TB3MS']
+        self.assertEqual(data.to_dict(), {(1979, 12): 12.0, (1980, 1): 11.5, (1980, 2): 11.8,
+                                          (1980, 4): 12.2})
+
+    def test_bundle_matches_csv(self):
+        names = build_data_bundle(self.index_path, self.bundle_path)
+        self.assertIn('alpha_architect.csv', names)
+        self.assertIn('TB3MS.csv', names)
+
+        for name in names:
+            bundled = self.load(name)
+            parsed = parse_index_csv(Path(self.index_path, name))
+            self.assertEqual(list(bundled.columns), list(parsed.columns))
+            # the bundle is month-aligned -> months without values are NaN
+            self.assertTrue(bundled.reindex(parsed.index).equals(parsed))
+            self.assertTrue(np.all(bundled.drop(parsed.index).isna()))
+
+        self.assertTrue(np.isnan(self.load('TB3MS.csv')['TB3MS'][(1980, 3)]))
+
+    def test_changed_csv_gets_parsed(self):
+        build_data_bundle(self.index_path, self.bundle_path)
+        with open(Path(self.index_path, 'TB3MS.csv'), 'a') as out:
+            out.write('1980-05-01,12.5\n')
+        self.assertEqual(self.load('TB3MS.csv')['TB3MS'][(1980, 5)], 12.5)
+
+        # without a bundle, the csv gets parsed
+        os.remove(self.bundle_path)
+        self.assertEqual(self.load('eq_reit.csv')['Close'][(1972, 1)], 98.65)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -65,7 +65,139 @@ class TestBasicDMCompositeExample(unittest.TestCase):
         # random example to see if summary was generated properly
         self.assertTrue(0 < dm.summary['max_dd_strategy_pretax'] < 1 )
 
+    def test_summary_sections(self):
+        """
+        Only the requested summary sections get generated. Later requests for other sections
+        return the same data as generating all sections at once.
+
+        :return:
+        """
+        tax_config = {'fed_st_gains': 0.22, 'fed_lt_gains': 0.15, 'state_st_gains': 0.12,
+                      'state_lt_gains': 0.051}
+        parts = [
+            {
+                'name': 'equities',
+                'ticker_list': ['VTI', 'QQQ', 'IEMG', 'IEFA'],
+                'lookback_months': 12, 'use_dual_momentum': True, 'max_holdings': 2, 'weight': 1
+            }
+        ]
+
+        def get_composite():
+            return DualMomentumComposite(parts=parts, money_market_holding='VGIT',
+                                         momentum_leverages={'months_for_lev': 3},
+                                         tax_config=tax_config, start_date='1980-01-01',
+                                         leverage=1, borrowing_cost_above_libor=1.5)
+
+        dm = get_composite()
+        metrics = dm.generate_results_summary(sections=['metrics'])
+        self.assertIn('max_dd_strategy_pretax', metrics)
+        self.assertNotIn('monthly_data', metrics)
+        self.assertNotIn('correlations', metrics)
+
+        # the monthly data gets loaded later by a new request
+        monthly_data = get_composite().generate_results_summary(sections=['monthly_data'])
+        self.assertEqual(list(monthly_data.keys()), ['monthly_data'])
+
+        # by default, only the headline metrics get generated
+        self.assertNotIn('monthly_data', get_composite().generate_results_summary())
+
+        self.redis_con.flushall()
+        full_summary = get_composite().generate_results_summary(
+            sections=['metrics', 'correlations', 'monthly_data'])
+        self.assertEqual(full_summary['monthly_data'], monthly_data['monthly_data'])
+        self.assertEqual(full_summary['max_dd_strategy_pretax'], metrics['max_dd_strategy_pretax'])
+
+        # optional sections only get generated when requested
+        self.assertNotIn('start_dates', full_summary)
+        start_dates = get_composite().generate_results_summary(sections=['start_dates'])
+        self.assertEqual(len(start_dates['start_dates']['cagr_pretax']),
+                         len(start_dates['start_dates']['start_years']))
+
+        rolling = get_composite().generate_results_summary(sections=['rolling'])['rolling']
+        self.assertEqual(rolling['series'], ['strategy', 'equities'])
+        self.assertEqual(len(rolling['windows']['12']['strategy']['sharpe']),
+                         len(rolling['year']))
+
+        with self.assertRaises(ValueError):
+            get_composite().generate_results_summary(sections=['holdings'])
+
+
+    def test_sweep_weights(self):
+        """
+        A weighting from the sweep has the same metrics as a composite with those weights
+
+        :return:
+        """
+        tax_config = {'fed_st_gains': 0.22, 'fed_lt_gains': 0.15, 'state_st_gains': 0.12,
+                      'state_lt_gains': 0.051}
+        parts = [
+            {
+                'name': 'equities',
+                'ticker_list': ['VTI', 'QQQ', 'IEMG', 'IEFA'],
+                'lookback_months': 12, 'use_dual_momentum': True, 'max_holdings': 2, 'weight': 0.7
+            },
+            {
+                'name': 'reits',
+                'ticker_list': ['VNQ', 'VNQI', 'REM'],
+                'lookback_months': 12, 'use_dual_momentum': True, 'max_holdings': 1, 'weight': 0.3
+            }
+        ]
+        dm = DualMomentumComposite(parts=parts, money_market_holding='VGIT',
+                                   momentum_leverages={'months_for_lev': 3},
+                                   tax_config=tax_config, start_date='1980-01-01',
+                                   leverage=1.2, borrowing_cost_above_libor=1.5)
+
+        sweep = dm.sweep_weights([[0.5, 0.5], [0.7, 0.3], [1.0, 0.0]])
+        self.assertEqual(len(sweep), 3)
+        self.assertEqual(list(sweep['equities']), [0.5, 0.7, 1.0])
+
+        dm.generate_results_summary(sections=['metrics'])
+        self.assertAlmostEqual(sweep['cagr_posttax'][1], dm.summary['cagr_strategy_posttax'],
+                               places=4)
+        self.assertAlmostEqual(sweep['max_dd_pretax'][1], dm.summary['max_dd_strategy_pretax'],
+                               places=4)
 
+        with self.assertRaises(ValueError):
+            dm.sweep_weights([[0.5, 0.6]])
+
+        with self.assertRaises(ValueError):
+            dm.sweep_weights([[0.5, 0.3, 0.2]])
+
+    def test_block_bootstrap(self):
+        """
+        Bootstrapped percentiles are ordered and a single block as long as the backtest
+        reproduces the backtest
+
+        :return:
+        """
+        tax_config = {'fed_st_gains': 0.22, 'fed_lt_gains': 0.15, 'state_st_gains': 0.12,
+                      'state_lt_gains': 0.051}
+        parts = [
+            {
+                'name': 'equities',
+                'ticker_list': ['VTI', 'QQQ', 'IEMG', 'IEFA'],
+                'lookback_months': 12, 'use_dual_momentum': True, 'max_holdings': 2, 'weight': 1
+            }
+        ]
+        dm = DualMomentumComposite(parts=parts, money_market_holding='VGIT',
+                                   momentum_leverages={'months_for_lev': 3},
+                                   tax_config=tax_config, start_date='1980-01-01',
+                                   leverage=1, borrowing_cost_above_libor=1.5)
+
+        results = dm.run_block_bootstrap(n_paths=200, block_months=12, seed=0)
+        self.assertEqual(results['percentiles'], [5, 25, 50, 75, 95])
+        for metric in ['cagr_pretax', 'max_dd_posttax', 'terminal_wealth_posttax']:
+            self.assertTrue((results[metric][1:] >= results[metric][:-1]).all())
+
+        dm.run_multi_component_dual_momentum()
+        dm.generate_results_summary(sections=['metrics'])
+        n_months = len(dm.df) - 1 - dm.max_lookback_months
+        results = dm.run_block_bootstrap(n_paths=2, block_months=n_months, seed=0)
+        self.assertAlmostEqual(results['max_dd_pretax'][2], dm.summary['max_dd_strategy_pretax'],
+                               places=2)
+
+        with self.assertRaises(ValueError):
+            dm.run_block_bootstrap(n_paths=2, block_months=n_months + 1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,387 @@
+import unittest
+
+import numpy as np
+
+from dual_momentum.dm_component import DualMomentumComponent
+from dual_momentum.panel import MonthlyPanel, month_ordinal, lag
+from dual_momentum.result_schema import apply_schema
+from dual_momentum.dm_engine import running_count, calculate_months_held, select_holdings, \
+    calculate_leveraged_ledger, calculate_position_weights, encode_holdings, decode_holdings
+
+
+def generate_component_panel(ticker_list, n_months=240, seed=0):
+    """
+    Generates a component panel with random prices in the format produced by
+    add_ticker_to_panel
+
+    :param ticker_list: list
+    :param n_months: int
+    :param seed: int
+    :return: MonthlyPanel
+    """
+    rng = np.random.RandomState(seed)
+    panel = MonthlyPanel(first_month=month_ordinal(1980, 1), n_months=n_months)
+    panel['tbil_performance_pretax'] = 1 + rng.uniform(0, 0.005, n_months)
+    panel['tbil_performance_posttax'] = panel['tbil_performance_pretax']
+    panel['cap_gains'] = 0.0
+    panel['div_gains'] = 0.0
+    panel['performance_pretax'] = 1.0
+    panel['taxes'] = 0.0
+    panel['performance_posttax'] = 1.0
+    panel['cash_portion'] = 0.0
+
+    for ticker in ticker_list:
+        close = np.cumprod(1 + rng.normal(0.005, 0.05, n_months))
+        adj_close = close * np.cumprod(1 + rng.uniform(0, 0.003, n_months))
+        panel[f'{ticker}_adj_close'] = adj_close
+        panel[f'{ticker}_close'] = close
+        panel[f'{ticker}_pretax_mom'] = adj_close / lag(adj_close, 12)
+    return panel
+
+
+class TestVectorizedEngine(unittest.TestCase):
+    """
+    Test that the numpy engine produces the same results as the month-by-month python engine
+    """
+
+    tax_config = {'fed_st_gains': 0.22, 'fed_lt_gains': 0.15, 'state_st_gains': 0.12,
+                  'state_lt_gains': 0.051}
+
+    def run_both_engines(self, ticker_list, max_holdings, use_dual_momentum=True,
+                         holding_weighting='equal'):
+        results = []
+        for engine in ['python', 'numpy']:
+            dmc = DualMomentumComponent(
+                name='test', ticker_list=ticker_list, lookback_months=12,
+                max_holdings=max_holdings, start_date='1980-01-01',
+                use_dual_momentum=use_dual_momentum, money_market_holding='VGIT',
+                tax_config=self.tax_config, engine=engine, holding_weighting=holding_weighting)
+            dmc.panel = generate_component_panel(dmc.ticker_list)
+            if engine == 'numpy':
+                dmc.run_vectorized_simulation()
+            else:
+                dmc.run_python_simulation()
+            results.append(dmc.panel.to_frame())
+        return results
+
+    def assert_same_results(self, df_python, df_numpy):
+        holding_columns = [c for c in df_python.columns if c.startswith('holding_')]
+        self.assertTrue(holding_columns)
+        self.assertEqual(holding_columns,
+                         [c for c in df_numpy.columns if c.startswith('holding_')])
+        for column in holding_columns:
+            self.assertEqual(df_numpy[column].dtype, np.int16)
+            self.assertEqual(list(df_python[column]), list(df_numpy[column]))
+        for column in ['performance_pretax', 'taxes', 'performance_posttax', 'cash_portion']:
+            self.assertTrue(np.allclose(df_python[column], df_numpy[column], equal_nan=True),
+                            column)
+
+    def test_one_holding(self):
+        self.assert_same_results(*self.run_both_engines(['VNQ', 'VNQI', 'IEF'], 1))
+
+    def test_two_holdings(self):
+        self.assert_same_results(*self.run_both_engines(['VNQ', 'VNQI', 'IEF'], 2))
+
+    def test_n_holdings(self):
+        ticker_list = ['VNQ', 'VNQI', 'IEF', 'VTI', 'VWO', 'TLT']
+        self.assert_same_results(*self.run_both_engines(ticker_list, 4))
+
+    def test_momentum_weighting(self):
+        ticker_list = ['VNQ', 'VNQI', 'IEF', 'VTI', 'VWO', 'TLT']
+        self.assert_same_results(*self.run_both_engines(ticker_list, 3,
+                                                        holding_weighting='momentum'))
+
+    def test_buy_and_hold(self):
+        self.assert_same_results(*self.run_both_engines(['VTI'], 1, use_dual_momentum=False))
+
+    def test_variants(self):
+        ticker_list = ['VNQ', 'VNQI', 'IEF']
+        variants = [{'lookback_months': 12, 'max_holdings': 1},
+                    {'lookback_months': 6, 'max_holdings': 2},
+                    {'lookback_months': 9, 'max_holdings': 3,
+                     'holding_weighting': 'momentum'}]
+        components = []
+        singles = []
+        for variant in variants:
+            kwargs = {'name': 'test', 'ticker_list': ticker_list, 'start_date': '1980-01-01',
+                      'use_dual_momentum': True, 'money_market_holding': 'VGIT',
+                      'tax_config': self.tax_config, **variant}
+            component = DualMomentumComponent(**kwargs)
+            component.panel = generate_component_panel(ticker_list)
+            components.append(component)
+
+            single = DualMomentumComponent(**kwargs)
+            single.panel = generate_component_panel(ticker_list)
+            single.run_vectorized_simulation()
+            singles.append(single.panel.to_frame())
+
+        DualMomentumComponent.simulate_variants(components)
+        for component, single in zip(components, singles):
+            self.assert_same_results(single, component.panel.to_frame())
+
+    def test_variants_with_different_prices(self):
+        # variants with a different day of the month load different prices -> separate batches
+        ticker_list = ['VNQ', 'VNQI', 'IEF']
+        components = []
+        singles = []
+        for variant in [{'day_of_month_for_monthly_data': -1},
+                        {'day_of_month_for_monthly_data': 0},
+                        {'day_of_month_for_monthly_data': -1,
+                         'max_holdings': 2}]:
+            kwargs = {'name': 'test', 'ticker_list': ticker_list, 'lookback_months': 12,
+                      'max_holdings': 1, 'start_date': '1980-01-01', 'use_dual_momentum': True,
+                      'money_market_holding': 'VGIT', 'tax_config': self.tax_config, **variant}
+            day = variant['day_of_month_for_monthly_data']
+            component = DualMomentumComponent(**kwargs)
+            component.panel = generate_component_panel(ticker_list, seed=day + 1)
+            components.append(component)
+
+            single = DualMomentumComponent(**kwargs)
+            single.panel = generate_component_panel(ticker_list, seed=day + 1)
+            single.run_vectorized_simulation()
+            singles.append(single.panel.to_frame())
+
+        with self.assertRaises(ValueError):
+            DualMomentumComponent.simulate_variants(components)
+
+        batches = DualMomentumComponent.batch_variants(components)
+        self.assertEqual(batches, [[components[0], components[2]], [components[1]]])
+        for batch in batches:
+            DualMomentumComponent.simulate_variants(batch)
+        for component, single in zip(components, singles):
+            self.assert_same_results(single, component.panel.to_frame())
+
+    def test_current_signal(self):
+        # the signal for the last month matches the holdings of the simulation
+        ticker_list = ['VNQ', 'VNQI', 'IEF', 'VTI']
+        panel = generate_component_panel(ticker_list, seed=4)
+        for max_holdings in [1, 2, 3]:
+            dmc = DualMomentumComponent(
+                name='test', ticker_list=ticker_list, lookback_months=12,
+                max_holdings=max_holdings, start_date='1980-01-01', use_dual_momentum=True,
+                money_market_holding='VGIT', tax_config=self.tax_config)
+            dmc.panel = truncate_panel(panel, len(panel))
+            dmc.run_vectorized_simulation()
+
+            adj_close = np.column_stack([panel[f'{t}_adj_close'] for t in ticker_list])
+            signal = dmc.evaluate_signal(adj_close[-24:], panel['tbil_performance_pretax'][-1],
+                                         (1999, 12))
+            last_holdings = [[dmc.panel[c][-1] for c in dmc.holding_columns]]
+            self.assertEqual(signal['holdings'],
+                             decode_holdings(np.array(last_holdings), ticker_list)[0])
+            self.assertAlmostEqual(sum(signal['weights']), 1.0)
+            self.assertAlmostEqual(signal['momentum']['VTI'], panel['VTI_pretax_mom'][-1])
+
+
+def truncate_panel(panel, n_months):
+    """
+    Returns the first n_months of a panel
+
+    :param panel: MonthlyPanel
+    :param n_months: int
+    :return: MonthlyPanel
+    """
+    truncated = MonthlyPanel(first_month=panel.first_month, n_months=n_months)
+    truncated.align(panel)
+    return truncated
+
+
+class TestExtendSimulation(unittest.TestCase):
+    """
+    Test that extending an earlier simulation by new months gives the same results as
+    simulating all months
+    """
+
+    def run_extension(self, max_holdings, holding_weighting='equal'):
+        ticker_list = ['VNQ', 'VNQI', 'IEF', 'VTI']
+        kwargs = {'name': 'test', 'ticker_list': ticker_list, 'lookback_months': 12,
+                  'max_holdings': max_holdings, 'start_date': '1980-01-01',
+                  'use_dual_momentum': True, 'money_market_holding': 'VGIT',
+                  'tax_config': TestVectorizedEngine.tax_config,
+                  'holding_weighting': holding_weighting}
+
+        full = DualMomentumComponent(**kwargs)
+        full.panel = generate_component_panel(ticker_list)
+        full.run_vectorized_simulation()
+
+        earlier = DualMomentumComponent(**kwargs)
+        earlier.panel = truncate_panel(generate_component_panel(ticker_list), 230)
+        earlier.run_vectorized_simulation()
+        input_checksum = earlier.get_input_checksum(len(earlier.panel) - 1)
+        history = apply_schema(earlier.panel, earlier.result_schema)
+
+        extended = DualMomentumComponent(**kwargs)
+        extended.panel = generate_component_panel(ticker_list)
+        self.assertTrue(extended.extend_simulation(history, input_checksum=input_checksum))
+
+        for column in extended.result_schema:
+            self.assertTrue(np.allclose(full.panel[column], extended.panel[column]), column)
+
+        # restated prices of a month that would be kept -> the history can't be used
+        restated = DualMomentumComponent(**kwargs)
+        restated.panel = generate_component_panel(ticker_list)
+        restated.panel['VTI_adj_close'][100] *= 1.01
+        self.assertFalse(restated.extend_simulation(history, input_checksum=input_checksum))
+
+    def test_one_holding(self):
+        self.run_extension(1)
+
+    def test_momentum_weighting(self):
+        self.run_extension(3, holding_weighting='momentum')
+
+    def test_extend_ledger(self):
+        rng = np.random.RandomState(3)
+        kwargs = {'performance_pretax': 1 + rng.normal(0.008, 0.04, 100),
+                  'taxes': rng.normal(0.001, 0.005, 100), 'cash_portion': np.zeros(100),
+                  'mm_performance_pretax': None, 'mm_taxes': None,
+                  'libor': np.full(100, 102.0), 'months_of_year': np.arange(100) % 12 + 1,
+                  'leverage': 1.5, 'borrowing_cost_above_libor': 1.5}
+        full = calculate_leveraged_ledger(start_idx=12, **kwargs)
+        extended = calculate_leveraged_ledger(
+            start_idx=70, initial_value=full['lev_performance_posttax'][69],
+            initial_taxes_due=full['taxes_due_total'][69], **kwargs)
+        for column in ['lev_performance_posttax', 'taxes_due_total']:
+            self.assertTrue(np.allclose(full[column][70:], extended[column][70:]), column)
+
+
+def run_ledger_month_by_month(rows, leverage, borrowing_cost_above_libor, start_idx,
+                              use_mm_holding):
+    """
+    Reference implementation of the leverage and tax ledger, processing one month at a time
+
+    :param rows: list of dicts
+    :return: list of dicts
+    """
+    prev_total = 10000
+    prev_taxes_due = 0.0
+    results = []
+    for idx, row in enumerate(rows):
+        if idx < start_idx:
+            results.append({'lev_performance_posttax': 10000, 'taxes_due_total': 0.0})
+            continue
+        lev_performance_pretax = leverage * (row['performance_pretax'] - 1) + 1
+        percentage_cash = 1 - ((1 - row['cash_portion']) * leverage)
+        taxes_month = leverage * row['taxes'] * prev_total
+        if percentage_cash >= 0:
+            if use_mm_holding:
+                lev_performance_pretax += percentage_cash * (row['mm_performance_pretax'] - 1)
+                taxes_month += row['mm_taxes'] * percentage_cash * prev_total
+        else:
+            monthly_borrowing_rate = ((row['libor'] + borrowing_cost_above_libor) / 100) ** (
+                1 / 12) - 1
+            lev_performance_pretax -= -percentage_cash * monthly_borrowing_rate
+
+        taxes_due_total = taxes_month + prev_taxes_due
+        lev_performance_posttax = lev_performance_pretax * prev_total
+        if row['month'] == 12 and taxes_due_total > 0:
+            lev_performance_posttax -= taxes_due_total
+            taxes_due_total = 0
+        results.append({'lev_performance_posttax': lev_performance_posttax,
+                        'taxes_due_total': taxes_due_total})
+        prev_total = lev_performance_posttax
+        prev_taxes_due = taxes_due_total
+    return results
+
+
+class TestVectorizedLedger(unittest.TestCase):
+    """
+    Test that the vectorized ledger matches month-by-month processing
+    """
+
+    def run_ledger(self, leverage, use_mm_holding):
+        rng = np.random.RandomState(1)
+        n_months = 300
+        data = {
+            'performance_pretax': 1 + rng.normal(0.008, 0.04, n_months),
+            'taxes': rng.normal(0.001, 0.005, n_months),
+            'cash_portion': rng.choice([0.0, 0.5, 1.0], n_months),
+            'mm_performance_pretax': 1 + rng.normal(0.003, 0.01, n_months),
+            'mm_taxes': rng.normal(0.0005, 0.001, n_months),
+            'libor': 100 + rng.uniform(0, 8, n_months),
+            'month': np.arange(n_months) % 12 + 1
+        }
+        ledger = calculate_leveraged_ledger(
+            performance_pretax=data['performance_pretax'], taxes=data['taxes'],
+            cash_portion=data['cash_portion'],
+            mm_performance_pretax=data['mm_performance_pretax'] if use_mm_holding else None,
+            mm_taxes=data['mm_taxes'] if use_mm_holding else None,
+            libor=data['libor'], months_of_year=data['month'], leverage=leverage,
+            borrowing_cost_above_libor=1.5, start_idx=12)
+        rows = [{key: values[idx] for key, values in data.items()} for idx in range(n_months)]
+        expected = run_ledger_month_by_month(rows, leverage, 1.5, 12, use_mm_holding)
+
+        for column in ['lev_performance_posttax', 'taxes_due_total']:
+            self.assertTrue(np.allclose(ledger[column], [r[column] for r in expected]), column)
+
+    def test_no_leverage(self):
+        self.run_ledger(leverage=1, use_mm_holding=True)
+
+    def test_leverage(self):
+        self.run_ledger(leverage=1.5, use_mm_holding=True)
+
+    def test_no_mm_holding(self):
+        self.run_ledger(leverage=1.5, use_mm_holding=False)
+
+    def test_multiple_portfolios(self):
+        performance = 1 + np.random.RandomState(2).normal(0.01, 0.03, (3, 36))
+        ledger = calculate_leveraged_ledger(
+            performance_pretax=performance, taxes=np.full((3, 36), 0.001),
+            cash_portion=np.zeros((3, 36)), mm_performance_pretax=None, mm_taxes=None,
+            libor=np.full(36, 102.0), months_of_year=np.arange(36) % 12 + 1, leverage=1,
+            borrowing_cost_above_libor=1.5)
+        self.assertEqual(ledger['lev_performance_posttax'].shape, (3, 36))
+        single = calculate_leveraged_ledger(
+            performance_pretax=performance[1], taxes=np.full(36, 0.001),
+            cash_portion=np.zeros(36), mm_performance_pretax=None, mm_taxes=None,
+            libor=np.full(36, 102.0), months_of_year=np.arange(36) % 12 + 1, leverage=1,
+            borrowing_cost_above_libor=1.5)
+        self.assertTrue(np.allclose(ledger['lev_performance_posttax'][1],
+                                    single['lev_performance_posttax']))
+
+
+class TestEngineHelpers(unittest.TestCase):
+
+    def test_running_count(self):
+        mask = np.array([True, True, False, True, True, True, False])
+        self.assertEqual(list(running_count(mask)), [1, 2, 0, 1, 2, 3, 0])
+
+    def test_months_held(self):
+        # ticker 0 held for 14 months, then ticker 1 for 2 months
+        holdings = np.array([[0]] * 14 + [[1]] * 2)
+        months_held = calculate_months_held(holdings, n_tickers=2)
+        self.assertEqual(list(months_held[:, 0]), list(range(13)) + [12, 12, 0])
+        self.assertEqual(list(months_held[:, 1]), [0] * 15 + [1])
+
+    def test_encode_holdings(self):
+        ticker_list = ['VTI', 'VNQ', 'TLT']
+        holdings = [['VNQ', 'CASH'], ['CASH'], ['TLT', 'VTI']]
+        codes = encode_holdings(holdings, ticker_list, n_positions=2)
+        self.assertEqual(codes.tolist(), [[1, -1], [-1, -1], [2, 0]])
+        self.assertEqual(decode_holdings(codes, ticker_list), holdings)
+
+    def test_select_holdings(self):
+        momentum = np.array([[1.2, 1.1, 0.9],
+                             [0.8, 1.3, 0.9],
+                             [0.8, 0.7, np.nan]])
+        hurdle = np.array([1.0, 1.0, 1.0])
+        holdings = select_holdings(momentum, hurdle, max_holdings=2)
+        self.assertEqual(holdings.tolist(), [[0, 1], [1, -1], [-1, -1]])
+
+    def test_select_holdings_ties(self):
+        # ties are broken by the order of the tickers, more positions than tickers are CASH
+        momentum = np.array([[1.1, 1.2, 1.1, 1.1]])
+        hurdle = np.array([1.0])
+        self.assertEqual(select_holdings(momentum, hurdle, 3).tolist(), [[1, 0, 2]])
+        self.assertEqual(select_holdings(momentum, hurdle, 6).tolist(),
+                         [[1, 0, 2, 3, -1, -1]])
+
+    def test_momentum_weights(self):
+        momentum = np.array([[1.3, 1.1, 0.9]])
+        hurdle = np.array([1.0])
+        holdings = select_holdings(momentum, hurdle, 3)
+        weights = calculate_position_weights(momentum, hurdle, holdings, 'momentum')
+        self.assertTrue(np.allclose(weights, [[0.5, 1 / 6, 1 / 3]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
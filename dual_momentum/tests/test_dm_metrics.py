@@ -0,0 +1,115 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from dual_momentum.dm_metrics import calculate_metrics, calculate_drawdowns, \
+    calculate_max_drawdowns, calculate_underwater_months, calculate_recovery_months, \
+    calculate_window_metrics, calculate_rolling_metrics
+
+
+def calculate_drawdowns_month_by_month(cumulative):
+    """
+    Reference implementation, comparing every month with the maximum of all earlier months
+
+    :param cumulative: np.ndarray (months)
+    :return: (np.ndarray, float, int)
+    """
+    drawdowns = np.zeros(len(cumulative))
+    max_dd = 1.0
+    max_dd_idx = -1
+    for i in range(1, len(cumulative)):
+        dd = min(1.0, cumulative[i] / np.max(cumulative[0:i]))
+        drawdowns[i] = dd
+        if dd < max_dd:
+            max_dd = dd
+            max_dd_idx = i
+    return drawdowns, max_dd, max_dd_idx
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(6)
+        self.performance = 1 + rng.normal(0.007, 0.04, (4, 300))
+        self.performance[:, :12] = 1.0
+        self.riskfree = 1 + rng.uniform(0, 0.004, 300)
+
+    def test_drawdowns(self):
+        metrics = calculate_metrics(self.performance, self.riskfree, start_idx=12)
+        for idx in range(len(self.performance)):
+            drawdowns, max_dd, max_dd_idx = calculate_drawdowns_month_by_month(
+                metrics['cumulative'][idx])
+            self.assertTrue(np.allclose(metrics['drawdowns'][idx], drawdowns))
+            self.assertAlmostEqual(metrics['max_dd'][idx], max_dd)
+            self.assertEqual(metrics['max_dd_idx'][idx], max_dd_idx)
+
+    def test_ratios(self):
+        metrics = calculate_metrics(self.performance, self.riskfree, start_idx=12)
+        excess = pd.Series(self.performance[1] - self.riskfree)[12:-1]
+        self.assertAlmostEqual(metrics['sharpe'][1], np.sqrt(12) * excess.mean() / excess.std())
+        self.assertAlmostEqual(metrics['annual_volatility'][1], excess.std() * np.sqrt(12))
+        years = (300 - 12) / 12
+        self.assertAlmostEqual(metrics['cagr'][1],
+                               np.prod(self.performance[1]) ** (1 / years))
+
+    def test_underwater_and_recovery(self):
+        cumulative = np.array([[1.0, 1.1, 1.0, 0.9, 1.0, 1.2, 1.1, 1.15]])
+        drawdowns = calculate_drawdowns(cumulative)
+        max_dd, max_dd_idx = calculate_max_drawdowns(drawdowns)
+        self.assertEqual(max_dd_idx.tolist(), [3])
+        self.assertEqual(calculate_underwater_months(drawdowns).tolist(), [3])
+        # back at the high 2 months after the max drawdown
+        self.assertEqual(calculate_recovery_months(drawdowns, max_dd_idx).tolist(), [2])
+
+    def test_no_drawdown(self):
+        drawdowns = calculate_drawdowns(np.array([[1.0, 1.1, 1.2]]))
+        max_dd, max_dd_idx = calculate_max_drawdowns(drawdowns)
+        self.assertEqual(max_dd.tolist(), [1.0])
+        self.assertEqual(max_dd_idx.tolist(), [-1])
+        self.assertEqual(calculate_recovery_months(drawdowns, max_dd_idx).tolist(), [-1])
+
+    def test_window_metrics(self):
+        starts = np.arange(12, 300, 12)
+        ends = np.arange(23, 300, 12)
+        windows = calculate_window_metrics(self.performance[2], self.riskfree, starts, ends)
+        self.assertEqual(windows['cagr'].shape, (len(starts), len(ends)))
+
+        # every window is the same as calculating the metrics on that window only
+        for start_idx, end_idx in [(0, len(ends) - 1), (3, 10), (7, 7)]:
+            window = slice(starts[start_idx], ends[end_idx] + 1)
+            performance = self.performance[2, window]
+            metrics = calculate_metrics(performance, self.riskfree[window], start_idx=0)
+            self.assertAlmostEqual(windows['cagr'][start_idx, end_idx], metrics['cagr'][0])
+            self.assertAlmostEqual(windows['max_dd'][start_idx, end_idx],
+                                   np.min(calculate_drawdowns_month_by_month(
+                                       np.r_[1.0, np.cumprod(performance)])[0][1:]))
+            excess = pd.Series(performance - self.riskfree[window])
+            self.assertAlmostEqual(windows['sharpe'][start_idx, end_idx],
+                                   np.sqrt(12) * excess.mean() / excess.std())
+
+        # ends before starts are empty
+        self.assertTrue(np.isnan(windows['cagr'][5, 2]))
+
+    def test_rolling_metrics(self):
+        rolling = calculate_rolling_metrics(self.performance[1:], benchmark=self.performance[0],
+                                            riskfree=self.riskfree, window=36)
+        self.assertTrue(np.isnan(rolling['cagr'][:, :35]).all())
+
+        # the rolling window ending in each month is the window from 35 months earlier
+        windows = calculate_window_metrics(self.performance[2], self.riskfree,
+                                           np.arange(0, 265), np.arange(35, 300))
+        for metric in ['cagr', 'max_dd', 'sharpe']:
+            self.assertTrue(np.allclose(np.diag(windows[metric]), rolling[metric][1, 35:]))
+
+        correlation = pd.Series(self.performance[3]).rolling(36).corr(
+            pd.Series(self.performance[0])).to_numpy()
+        self.assertTrue(np.allclose(correlation[35:], rolling['correlation'][2, 35:]))
+
+        volatility = pd.Series(self.performance[3] - self.riskfree).rolling(36).std().to_numpy()
+        self.assertTrue(np.allclose(volatility[35:] * np.sqrt(12),
+                                    rolling['annual_volatility'][2, 35:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from dual_momentum.fetcher import get_required_tickers
+
+
+class TestRequiredTickers(unittest.TestCase):
+
+    def test_early_replacements(self):
+        self.assertEqual(get_required_tickers(['VTI']), ['VTI', 'SPY', 'VFINX'])
+        self.assertEqual(get_required_tickers(['VTI'], use_early_replacements=False), ['VTI'])
+
+    def test_ones(self):
+        # ONES is built from EFA and its replacements
+        self.assertEqual(get_required_tickers(['ONES']), ['EFA', 'AAIEX', 'OPPAX'])
+
+    def test_shared_replacements(self):
+        # replacements shared by multiple tickers are only listed once
+        self.assertEqual(get_required_tickers(['VTI', 'SPY', 'VEA', 'EFA']),
+                         ['VTI', 'SPY', 'VEA', 'EFA', 'VFINX', 'AAIEX', 'OPPAX'])
+
+    def test_index_replacements(self):
+        # monthly index replacements get merged onto the dates of ONES
+        self.assertIn('EFA', get_required_tickers(['VNQ'], use_early_replacements=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
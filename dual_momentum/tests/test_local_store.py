@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from dual_momentum import local_store, storage
+from dual_momentum.ticker_data import TickerData
+
+
+class TestLocalStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store_path = local_store.LOCAL_STORE_PATH
+        local_store.LOCAL_STORE_PATH = self.temp_dir.name
+
+        index = pd.date_range('2020-01-01', periods=300, freq='B', name='Date')
+        self.df = pd.DataFrame({'Close': np.linspace(100, 130, 300),
+                                'Adj Close': np.linspace(90, 125, 300)}, index=index)
+
+    def tearDown(self):
+        local_store.LOCAL_STORE_PATH = self.store_path
+        self.temp_dir.cleanup()
+
+    def test_write_and_read(self):
+        self.assertIsNone(local_store.read_ticker_data('SPY'))
+
+        local_store.write_ticker_data('SPY', self.df)
+        df = local_store.read_ticker_data('SPY')
+        self.assertTrue(df.equals(self.df))
+
+        # only the arrow file is left, no temporary files
+        self.assertEqual(os.listdir(self.temp_dir.name), ['SPY.arrow'])
+
+    def test_max_age(self):
+        local_store.write_ticker_data('SPY', self.df, fetched_at=time.time() - 7200)
+        self.assertIsNone(local_store.read_ticker_data('SPY', max_age=3600))
+        self.assertIsNotNone(local_store.read_ticker_data('SPY'))
+        self.assertAlmostEqual(local_store.get_fetch_time('SPY'), time.time() - 7200, places=0)
+
+        # newer data replaces the old file
+        local_store.write_ticker_data('SPY', self.df.iloc[:10])
+        self.assertEqual(len(local_store.read_ticker_data('SPY', max_age=3600)), 10)
+
+    def test_redis_not_available(self):
+        # the local store serves the data when redis fails over
+        redis_host = storage.HOST
+        storage.HOST = 'redis.invalid'
+        try:
+            local_store.write_ticker_data('VFINX', self.df)
+            ticker_data = TickerData('VFINX', use_early_replacements=False,
+                                     data_provider=lambda ticker, start, end: None)
+            self.assertTrue(ticker_data.data_daily.equals(self.df))
+            self.assertEqual(len(ticker_data.data_monthly), 14)
+            self.assertEqual(ticker_data.data_monthly['Close'].iloc[-1], self.df['Close'].iloc[-1])
+        finally:
+            storage.HOST = redis_host
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from dual_momentum.momentum import MomentumStore, MAX_LOOKBACK_MONTHS
+from dual_momentum.panel import lag, month_ordinal
+
+
+class TestMomentumStore(unittest.TestCase):
+    """
+    Test that momentum looked up from the store matches momentum calculated for one ticker
+    """
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.close = np.cumprod(1 + rng.normal(0.005, 0.04, (2, 120)), axis=1)
+        self.adj_close = self.close * np.cumprod(1 + rng.uniform(0, 0.003, (2, 120)), axis=1)
+        self.store = MomentumStore(tickers=['VTI', 'VNQ'], first_month=month_ordinal(1990, 1),
+                                   close=self.close, adj_close=self.adj_close)
+
+    def test_pretax_momentum(self):
+        for lookback in [1, 12, MAX_LOOKBACK_MONTHS, 36]:
+            expected = self.adj_close[1] / lag(self.adj_close[1], lookback)
+            momentum = self.store.pretax_momentum('VNQ', lookback)
+            self.assertTrue(np.allclose(momentum, expected, equal_nan=True))
+
+    def test_tax_adjusted_momentum(self):
+        tax_rates = {'ST_GAINS': 0.3, 'LT_GAINS': 0.2, 'INCOME': 0.2}
+        st_mom, lt_mom = self.store.tax_adjusted_momentum('VTI', 6, tax_rates)
+
+        cap_dur = self.close[0] / lag(self.close[0], 6)
+        div_dur = self.adj_close[0] / lag(self.adj_close[0], 6) - cap_dur
+        expected = np.where(cap_dur <= 1, cap_dur, (cap_dur - 1) * 0.7 + 1) + div_dur * 0.8
+        self.assertTrue(np.allclose(st_mom, expected, equal_nan=True))
+        self.assertTrue(np.all(lt_mom[6:] >= st_mom[6:]))
+
+    def test_alignment(self):
+        momentum = self.store.pretax_momentum('VTI', 12, first_month=month_ordinal(1989, 1),
+                                              n_months=24)
+        self.assertTrue(np.all(np.isnan(momentum[:12 + 12])))
+        momentum = self.store.pretax_momentum('VTI', 12, first_month=month_ordinal(1991, 1),
+                                              n_months=12)
+        self.assertTrue(np.allclose(momentum, self.adj_close[0][12:24] / self.adj_close[0][:12]))
+
+    def test_last_prices(self):
+        # the current signal only reads the last months of the store
+        self.assertEqual(self.store.last_month, month_ordinal(1999, 12))
+        close, adj_close = self.store.prices('VNQ', self.store.last_month - 23, 24)
+        self.assertTrue(np.array_equal(adj_close, self.adj_close[1][-24:]))
+        self.assertTrue(np.array_equal(close, self.close[1][-24:]))
+
+    def test_serialization(self):
+        store = MomentumStore.from_dict(self.store.to_dict())
+        self.assertTrue('VNQ' in store)
+        self.assertTrue(np.allclose(store.pretax_momentum('VNQ', 3),
+                                    self.store.pretax_momentum('VNQ', 3), equal_nan=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from dual_momentum.panel import MonthlyPanel, month_ordinal, ordinal_to_year_month, lag, \
+    month_offset_rows, months_checksum
+
+
+class TestMonthlyPanel(unittest.TestCase):
+    """
+    Test that panels convert from and to (year, month) indexed data and align by month numbers
+    """
+
+    def setUp(self):
+        index = pd.MultiIndex.from_tuples([(1999, 11), (1999, 12), (2000, 1), (2000, 3)])
+        self.df = pd.DataFrame({'Close': [1.0, 2.0, 3.0, 4.0]}, index=index)
+
+    def test_month_ordinal(self):
+        self.assertEqual(month_ordinal(2000, 1) - month_ordinal(1999, 12), 1)
+        self.assertEqual(ordinal_to_year_month(month_ordinal(2020, 12)), (2020, 12))
+
+    def test_from_frame(self):
+        panel = MonthlyPanel.from_frame(self.df, columns={'Close': 'close'})
+        self.assertEqual(len(panel), 5)
+        self.assertEqual(panel.index[0], (1999, 11))
+        self.assertTrue(np.isnan(panel['close'][3]))
+        self.assertEqual(list(panel.months_of_year), [11, 12, 1, 2, 3])
+
+        df = panel.to_frame()
+        self.assertEqual(df.loc[(2000, 3), 'close'], 4.0)
+
+    def test_from_dict(self):
+        panel = MonthlyPanel.from_dict({(2000, 1): 101.0, (2000, 3): 103.0}, name='index')
+        panel.fill_forward('index')
+        self.assertEqual(list(panel['index']), [101.0, 101.0, 103.0])
+
+    def test_column_alignment(self):
+        panel = MonthlyPanel.from_frame(self.df, columns={'Close': 'close'})
+
+        # requested range starts before and ends after the panel
+        aligned = panel.column('close', first_month=month_ordinal(1999, 10), n_months=7)
+        self.assertTrue(np.isnan(aligned[0]))
+        self.assertEqual(list(aligned[1:3]), [1.0, 2.0])
+        self.assertEqual(aligned[5], 4.0)
+        self.assertTrue(np.isnan(aligned[6]))
+
+        # requested range lies within the panel
+        aligned = panel.column('close', first_month=month_ordinal(1999, 12), n_months=2)
+        self.assertEqual(list(aligned), [2.0, 3.0])
+
+        other = MonthlyPanel(first_month=month_ordinal(2000, 1), n_months=3)
+        other.align(panel)
+        self.assertEqual(other['close'][0], 3.0)
+
+    def test_wrong_length(self):
+        panel = MonthlyPanel(first_month=month_ordinal(2000, 1), n_months=3)
+        with self.assertRaises(ValueError):
+            panel['close'] = np.ones(4)
+
+    def test_lag(self):
+        values = np.array([1.0, 2.0, 3.0])
+        self.assertTrue(np.allclose(lag(values, 1)[1:], [1.0, 2.0]))
+        self.assertTrue(np.isnan(lag(values, 1)[0]))
+        self.assertTrue(np.allclose(lag(values, -1)[:2], [2.0, 3.0]))
+
+    def test_months_checksum(self):
+        values = [np.arange(10, dtype=float), np.ones(10, dtype=np.float32)]
+        checksum = months_checksum(values, 8)
+        self.assertEqual(checksum, months_checksum([v.copy() for v in values], 8))
+
+        # changes after the first n_months don't matter, changes before do
+        values[0][9] = 100.0
+        self.assertEqual(checksum, months_checksum(values, 8))
+        values[1][3] = 2.0
+        self.assertNotEqual(checksum, months_checksum(values, 8))
+        self.assertNotEqual(months_checksum(values, 8), months_checksum(values, 9))
+
+    def test_month_offset_rows(self):
+        # 2020-02 has no trading days, 2020-03 only 2
+        dates = pd.to_datetime(['2020-01-02', '2020-01-03', '2020-01-06', '2020-03-02',
+                                '2020-03-03', '2020-04-01'])
+        months, rows = month_offset_rows(dates, offsets=[0, 1, 2, -1, -2])
+        self.assertEqual(months.tolist(), [month_ordinal(2020, m) for m in range(1, 5)])
+        self.assertEqual(rows.tolist(), [[0, 1, 2, 2, 1],
+                                         [-1, -1, -1, -1, -1],
+                                         [3, 4, -1, 4, 3],
+                                         [5, -1, -1, 5, -1]])
+
+        # same rows as groupby().nth()
+        df = pd.DataFrame({'Close': np.arange(len(dates))}, index=dates)
+        for idx, offset in enumerate([0, 1, 2, -1, -2]):
+            expected = df.groupby([df.index.year, df.index.month]).nth(offset)['Close']
+            self.assertEqual(rows[:, idx][rows[:, idx] >= 0].tolist(), expected.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import tempfile
+import time
+import unittest
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from dual_momentum import local_store
+from dual_momentum.ticker_data import refresh_ticker_data, REFRESH_OVERLAP_ROWS, TickerData
+from dual_momentum.tests.helpers import LocalDataProvider
+
+
+class TestRefreshTickerData(unittest.TestCase):
+
+    def setUp(self):
+        index = pd.date_range('2020-01-01', periods=300, freq='B', name='Date')
+        rng = np.random.RandomState(0)
+        close = 100 * np.cumprod(1 + rng.normal(0, 0.01, 300))
+        self.history = pd.DataFrame({'Close': close, 'Adj Close': close * 0.9}, index=index)
+
+    def test_full_download(self):
+        provider = LocalDataProvider(self.history)
+        data = refresh_ticker_data('SPY', None, data_provider=provider)
+        self.assertTrue(data.equals(self.history))
+        self.assertEqual(provider.requests[0][0], date(1980, 1, 1))
+
+    def test_only_missing_days(self):
+        provider = LocalDataProvider(self.history)
+        data = refresh_ticker_data('SPY', self.history.iloc[:250], data_provider=provider)
+        self.assertTrue(data.equals(self.history))
+
+        # only the overlap and the missing days get requested
+        self.assertEqual(len(provider.requests), 1)
+        self.assertEqual(provider.requests[0][0],
+                         self.history.index[250 - REFRESH_OVERLAP_ROWS].date())
+
+    def test_dividend_rescales_history(self):
+        # a dividend lowers the adjusted close of the whole history by a constant factor
+        after_dividend = self.history.copy()
+        after_dividend['Adj Close'] *= 0.98
+        provider = LocalDataProvider(after_dividend)
+
+        data = refresh_ticker_data('SPY', self.history.iloc[:250], data_provider=provider)
+        self.assertTrue(np.allclose(data['Adj Close'], after_dividend['Adj Close']))
+        self.assertTrue(np.allclose(data['Close'], after_dividend['Close']))
+        self.assertEqual(len(provider.requests), 1)
+
+    def test_inconsistent_history_gets_downloaded_again(self):
+        changed = self.history.copy()
+        changed.iloc[247, 1] *= 1.05
+        provider = LocalDataProvider(changed)
+
+        data = refresh_ticker_data('SPY', self.history.iloc[:250], data_provider=provider)
+        self.assertTrue(data.equals(changed))
+        self.assertEqual(provider.requests[-1][0], date(1980, 1, 1))
+
+    def test_last_stored_day_gets_replaced(self):
+        # the last stored day was downloaded during trading hours
+        stored = self.history.iloc[:250].copy()
+        stored.iloc[-1] *= 1.01
+        provider = LocalDataProvider(self.history)
+
+        data = refresh_ticker_data('SPY', stored, data_provider=provider)
+        self.assertTrue(data.equals(self.history))
+
+    def test_provider_not_available(self):
+        data = refresh_ticker_data('SPY', self.history.iloc[:250],
+                                   data_provider=lambda ticker, start, end: None)
+        self.assertIsNone(data)
+
+    def test_prices_changed(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        store_path = local_store.LOCAL_STORE_PATH
+        local_store.LOCAL_STORE_PATH = temp_dir.name
+        try:
+            provider = LocalDataProvider(self.history)
+            ticker_data = TickerData('VFINX', force_new_data=True, data_provider=provider)
+            ticker_data.load_raw_data_or_get_from_yahoo()
+            self.assertTrue(ticker_data.prices_changed)
+
+            # refreshing outdated data without new prices doesn't change the data version
+            local_store.write_ticker_data('VFINX', self.history, fetched_at=time.time() - 7200)
+            ticker_data = TickerData('VFINX', data_provider=provider)
+            ticker_data.load_raw_data_or_get_from_yahoo()
+            self.assertFalse(ticker_data.prices_changed)
+        finally:
+            local_store.LOCAL_STORE_PATH = store_path
+            temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
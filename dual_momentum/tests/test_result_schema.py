@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+import pyarrow as pa
+
+from dual_momentum.panel import MonthlyPanel, month_ordinal
+from dual_momentum.result_schema import apply_schema, to_result_frame, to_arrow_ipc, \
+    CATEGORY
+
+
+class TestResultSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.panel = MonthlyPanel(first_month=month_ordinal(1990, 1), n_months=3)
+        self.panel['performance_pretax'] = np.array([1.01, 0.99, 1.0])
+        self.panel['taxes'] = np.array([0.001, 0.0, 0.002])
+        self.panel['holding_0'] = np.array([0, -1, 1], dtype=np.int16)
+        self.panel['mmh'] = np.array(['VGIT'] * 3, dtype=object)
+        self.panel['VTI_st_mom'] = np.array([1.1, 1.2, 1.3])
+        self.schema = {'performance_pretax': np.float64, 'taxes': np.float32,
+                       'holding_0': np.int16, 'mmh': CATEGORY}
+
+    def test_apply_schema(self):
+        panel = apply_schema(self.panel, self.schema)
+        self.assertEqual(list(panel.columns), list(self.schema))
+        self.assertEqual(panel['taxes'].dtype, np.float32)
+        self.assertEqual(panel['holding_0'].dtype, np.int16)
+
+    def test_to_result_frame(self):
+        df = to_result_frame(self.panel, self.schema)
+        self.assertEqual(list(df.columns), list(self.schema))
+        self.assertEqual(df['mmh'].dtype, 'category')
+        self.assertEqual(df['taxes'].dtype, np.float32)
+
+        # cached frames turn back into panels with the same dtypes
+        panel = MonthlyPanel.from_frame(df)
+        self.assertEqual(panel['taxes'].dtype, np.float32)
+        self.assertEqual(panel['holding_0'].dtype, np.int16)
+        self.assertEqual(list(panel['mmh']), ['VGIT'] * 3)
+
+    def test_to_arrow_ipc(self):
+        columns = {'performance_pretax': self.panel['performance_pretax'],
+                   'holding_0': self.panel['holding_0']}
+        table = pa.ipc.open_stream(to_arrow_ipc(columns, metadata={'tickers': '["VTI"]'})
+                                   ).read_all()
+        self.assertEqual(table.column_names, ['performance_pretax', 'holding_0'])
+        self.assertEqual(table.schema.field('holding_0').type, pa.int16())
+        self.assertEqual(table.column('holding_0').to_pylist(), [0, -1, 1])
+        self.assertEqual(table.schema.metadata[b'tickers'], b'["VTI"]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from dual_momentum.dm_component import DualMomentumComponent
+from dual_momentum.signals import evaluate_signals_on_prices
+
+
+class TestSignals(unittest.TestCase):
+
+    tax_config = {'fed_st_gains': 0.22, 'fed_lt_gains': 0.15, 'state_st_gains': 0.12,
+                  'state_lt_gains': 0.051}
+
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        self.tickers = ['VTI', 'QQQ', 'IEFA', 'VNQ', 'VNQI', 'VGIT', 'SPY']
+        self.adj_close = np.cumprod(1 + rng.normal(0.005, 0.05, (len(self.tickers), 30)),
+                                    axis=1)
+        self.tbil = np.array([1.002, 1.003])
+
+        self.parts = [
+            {'name': 'equities', 'ticker_list': ['VTI', 'QQQ', 'IEFA'], 'lookback_months': 12,
+             'use_dual_momentum': True, 'max_holdings': 2, 'weight': 0.5},
+            {'name': 'reits', 'ticker_list': ['VNQ', 'VNQI'], 'lookback_months': 6,
+             'use_dual_momentum': True, 'max_holdings': 1, 'weight': 0.3},
+            {'name': 'spy', 'ticker_list': ['SPY'], 'lookback_months': 12,
+             'use_dual_momentum': False, 'max_holdings': 1, 'weight': 0.2}
+        ]
+
+    def component_signal(self, part, months_back=0):
+        component = DualMomentumComponent(
+            name=part['name'], ticker_list=part['ticker_list'],
+            lookback_months=part['lookback_months'], max_holdings=part['max_holdings'],
+            start_date='1980-01-01', use_dual_momentum=part['use_dual_momentum'],
+            money_market_holding='VGIT', tax_config=self.tax_config)
+        end = self.adj_close.shape[1] - months_back
+        adj_close = np.column_stack([self.adj_close[self.tickers.index(t), :end]
+                                     for t in part['ticker_list']])
+        return component.evaluate_signal(adj_close, self.tbil[1 - months_back], (2020, 1))
+
+    def test_same_holdings_as_components(self):
+        portfolios = [{'parts': self.parts, 'money_market_holding': 'VGIT'},
+                      {'parts': self.parts[1:2], 'money_market_holding': 'VGIT'}]
+        signals = evaluate_signals_on_prices(portfolios, self.tickers, self.adj_close,
+                                             self.tbil, (2020, 1))
+        self.assertEqual(len(signals), 2)
+        for part, signal in zip(self.parts, signals[0]['components']):
+            expected = self.component_signal(part)
+            self.assertEqual(signal['holdings'], expected['holdings'])
+            self.assertTrue(np.allclose(signal['weights'], expected['weights']))
+        self.assertEqual(signals[1]['components'][0]['holdings'],
+                         signals[0]['components'][1]['holdings'])
+
+    def test_last_month_return(self):
+        portfolios = [{'parts': self.parts, 'money_market_holding': 'VGIT'}]
+        signal = evaluate_signals_on_prices(portfolios, self.tickers, self.adj_close,
+                                            self.tbil, (2020, 1))[0]
+
+        returns = self.adj_close[:, -1] / self.adj_close[:, -2] - 1
+        expected = 0.0
+        for part in self.parts:
+            previous = self.component_signal(part, months_back=1)
+            for ticker, weight in zip(previous['holdings'], previous['weights']):
+                ticker = 'VGIT' if ticker == 'CASH' else ticker
+                expected += part['weight'] * weight * returns[self.tickers.index(ticker)]
+        self.assertAlmostEqual(signal['last_month_return'], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
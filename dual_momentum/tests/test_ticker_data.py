@@ -1,7 +1,11 @@
+import tempfile
 import unittest
 import time
 import numpy as np
-from dual_momentum.ticker_data import TickerData
+from dual_momentum import local_store
+from dual_momentum.ticker_data import TickerData, get_replacement_chain, \
+    splice_replacement_chain, build_monthly_price_table, monthly_data_from_table
+from dual_momentum.tests.helpers import LocalDataProvider
 from dual_momentum.ticker_config import TICKER_CONFIG
 from IPython import embed
 import pandas as pd
@@ -75,6 +79,101 @@ class TestTickerMerge(unittest.TestCase):
             ret_merged = (self.new_merged[c] / self.new_merged[c].shift(1)).head()[1:]
             self.assertTrue(np.allclose(ret_old, ret_merged))
 
+
+class TestSpliceReplacementChain(unittest.TestCase):
+    """
+    Test splicing a ticker with its chain of early replacements without downloading data
+    """
+
+    def setUp(self):
+        dates = pd.date_range('1990-01-01', periods=30, freq='B')
+        self.new = pd.DataFrame({'Close': 20.0, 'Adj Close': 10.0}, index=dates[20:])
+        self.middle = pd.DataFrame({'Close': np.arange(10, 30, dtype=float),
+                                    'Adj Close': 5.0}, index=dates[10:])
+        self.old = pd.DataFrame({'Close': np.arange(1, 31, dtype=float), 'Adj Close': 1.0},
+                                index=dates)
+
+    def test_get_replacement_chain(self):
+        self.assertEqual(get_replacement_chain('VTI'), ['VTI', 'SPY', 'VFINX'])
+        self.assertEqual(get_replacement_chain('VFINX'), ['VFINX'])
+
+    def test_splice(self):
+        spliced = splice_replacement_chain([self.new, self.middle, self.old])
+        self.assertEqual(len(spliced), 30)
+        self.assertTrue(spliced.index.is_monotonic_increasing)
+        self.assertTrue(spliced[20:].equals(self.new[spliced.columns]))
+
+        # middle is scaled by 20 / 20 on the first day of new, old by 1 * 10 / 11 on the first
+        # day of middle
+        self.assertTrue(np.allclose(spliced['Close'][10:20], np.arange(10, 20)))
+        self.assertTrue(np.allclose(spliced['Close'][:10], np.arange(1, 11) * 10 / 11))
+        self.assertTrue(np.allclose(spliced['Adj Close'][:20], 10.0))
+
+        # returns within each part stay the same
+        returns = spliced['Close'].pct_change()
+        self.assertTrue(np.allclose(returns[1:10], self.old['Close'].pct_change()[1:10]))
+
+    def test_replacement_starting_later_gets_skipped(self):
+        spliced = splice_replacement_chain([self.middle, self.new, self.old])
+        self.assertTrue(spliced.equals(splice_replacement_chain([self.middle, self.old])))
+
+
+class TestMonthlyPriceTable(unittest.TestCase):
+    """
+    Test that the monthly data of every day of the month comes out of one table
+    """
+
+    def setUp(self):
+        dates = pd.date_range('2020-01-01', periods=300, freq='B', name='Date')
+        # a holiday, a month with few trading days and a day without a price
+        dates = dates.drop(dates[[3, 4]]).drop(dates[25:40])
+        rng = np.random.RandomState(0)
+        close = 100 * np.cumprod(1 + rng.normal(0, 0.01, len(dates)))
+        self.history = pd.DataFrame({'Close': close, 'Adj Close': close * 0.9}, index=dates)
+        self.history.iloc[50] = np.nan
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store_path = local_store.LOCAL_STORE_PATH
+        local_store.LOCAL_STORE_PATH = self.temp_dir.name
+
+    def tearDown(self):
+        local_store.LOCAL_STORE_PATH = self.store_path
+        self.temp_dir.cleanup()
+
+    def test_table_matches_resampling(self):
+        table = build_monthly_price_table(self.history)
+        for day in [0, 5, 21, -1, -2, -23]:
+            months = self.history.groupby([self.history.index.year, self.history.index.month])
+            expected = pd.DataFrame(
+                {key: month.iloc[day] for key, month in months if -len(month) <= day < len(month)}
+            ).T
+            monthly_data = monthly_data_from_table(table, day)
+            self.assertEqual(list(monthly_data.index), list(expected.index), day)
+            self.assertTrue(np.allclose(monthly_data.to_numpy(), expected.to_numpy(),
+                                        equal_nan=True), day)
+
+    def test_data_monthly_uses_table(self):
+        redis_con = redis.Redis(host='localhost', port=6379, db=1)
+        redis_con.flushall()
+        provider = LocalDataProvider(self.history)
+        table = TickerData('VFINX', use_early_replacements=False,
+                           data_provider=provider).monthly_price_table
+        self.assertEqual(len(provider.requests), 1)
+
+        for day in [0, 5, -1]:
+            ticker = TickerData('VFINX', use_early_replacements=False,
+                                day_of_month_for_monthly_data=day, data_provider=provider)
+            self.assertTrue(ticker.data_monthly.equals(monthly_data_from_table(table, day)))
+            # sliced out of the shared table without loading and resampling the daily data
+            self.assertIsNone(ticker._data_daily)
+        self.assertEqual(len(provider.requests), 1)
+        redis_con.flushall()
+
+    def test_day_outside_of_table(self):
+        with self.assertRaises(ValueError):
+            TickerData('VFINX', day_of_month_for_monthly_data=23)
+
+
 class TestTickerConfig(unittest.TestCase):
     """
     Test if the configuration for each ticker in ticker_config is complete
@@ -1,6 +1,7 @@
 from datetime import date
 from pathlib import Path
 import os
+import random
 import time
 import pickle
 
@@ -8,18 +9,204 @@ import numpy as np
 import pandas as pd
 import pandas_datareader as pdr
 import pandas_datareader.data as web
-from IPython import embed
+import redis
 from dual_momentum.ticker_config import TICKER_CONFIG
 from dual_momentum.dm_config import DATA_PATH
 
-from dual_momentum.storage import write_to_redis, read_from_redis
+from dual_momentum.storage import get_data_version, read_from_optional_redis, \
+    write_to_optional_redis
+from dual_momentum.panel import MonthlyPanel, month_offset_rows
+from dual_momentum.local_store import read_ticker_data, write_ticker_data, RAW_DATA_MAX_AGE
+from dual_momentum.data_bundle import load_index_data
+
+# downloads from yahoo get retried with exponential backoff (with jitter, so parallel
+# downloads don't retry at the same time): up to 1, 2, 4, 8, ... seconds
+MAX_DOWNLOAD_ATTEMPTS = 6
+DOWNLOAD_BACKOFF_SECONDS = 1
+
+# trading day offsets of TickerData.monthly_price_table. Months have at most 23 trading days.
+MONTHLY_TABLE_OFFSETS = list(range(0, 23)) + list(range(-23, 0))
+
+# refreshes download the last stored rows again to detect dividends and splits that changed
+# the history, see refresh_ticker_data
+REFRESH_OVERLAP_ROWS = 5
+# relative difference of overlapping prices that counts as changed history
+REFRESH_TOLERANCE = 1e-6
+
+
+def download_yahoo_data(ticker: str, start: date, end: date):
+    """
+    Downloads the daily Close and Adj Close of a ticker from yahoo.
+    Returns None if yahoo isn't available after MAX_DOWNLOAD_ATTEMPTS.
+
+    :param ticker: str
+    :param start: date, first day to download
+    :param end: date, last day to download
+    :return: pd.DataFrame or None
+    """
+
+    for attempt in range(MAX_DOWNLOAD_ATTEMPTS):
+        try:
+            stock_data = web.DataReader(ticker, data_source='yahoo', start=start, end=end)
+            stock_data.drop(['Open', 'High', 'Low', 'Volume'], inplace=True, axis=1)
+            return stock_data
+
+        except pdr._utils.RemoteDataError as e:
+            print(ticker, start, end)
+            print(e)
+            if attempt < MAX_DOWNLOAD_ATTEMPTS - 1:
+                time.sleep(random.uniform(0, DOWNLOAD_BACKOFF_SECONDS * 2 ** attempt))
+    return None
+
+
+def refresh_ticker_data(ticker: str, stored_data: pd.DataFrame = None,
+                        data_provider=download_yahoo_data):
+    """
+    Brings stored daily data of a ticker up to date by only downloading the missing days.
+
+    The last REFRESH_OVERLAP_ROWS stored days get downloaded again. If a dividend or split
+    changed the history since the stored data was downloaded, the overlapping prices differ by
+    a constant factor -> the stored history gets rescaled by that factor. The last stored day
+    is ignored in the comparison because it might have been downloaded during trading hours.
+    If the overlap doesn't differ by a constant factor, the whole history gets downloaded again.
+
+    :param ticker: str
+    :param stored_data: pd.DataFrame with Close and Adj Close or None to download everything
+    :param data_provider: function (ticker, start, end) -> pd.DataFrame or None, e.g. a local
+                          stand-in for yahoo
+    :return: pd.DataFrame or None if the data provider isn't available
+    """
+
+    full_start = date(1980, 1, 1)
+    if stored_data is None or len(stored_data) <= REFRESH_OVERLAP_ROWS:
+        return data_provider(ticker, full_start, date.today())
+
+    overlap_start = stored_data.index[-REFRESH_OVERLAP_ROWS]
+    new_data = data_provider(ticker, overlap_start.date(), date.today())
+    if new_data is None or len(new_data) == 0:
+        return None
+
+    overlap = new_data.index.intersection(stored_data.index[-REFRESH_OVERLAP_ROWS:-1])
+    if len(overlap) == 0:
+        print(f'{ticker}: no overlap with the stored data, downloading the full history.')
+        return data_provider(ticker, full_start, date.today())
+
+    stored_data = stored_data.copy()
+    for column in ['Close', 'Adj Close']:
+        ratios = (new_data.loc[overlap, column] / stored_data.loc[overlap, column]).to_numpy()
+        if np.any(np.abs(ratios / ratios[0] - 1) > REFRESH_TOLERANCE):
+            print(f'{ticker}: {column} changed inconsistently, downloading the full history.')
+            return data_provider(ticker, full_start, date.today())
+        if abs(ratios[0] - 1) > REFRESH_TOLERANCE:
+            print(f'{ticker}: rescaling the stored {column} by {ratios[0]}.')
+            stored_data[column] *= ratios[0]
+
+    return pd.concat([stored_data[stored_data.index < new_data.index[0]], new_data[
+        stored_data.columns]])
+
+
+def build_monthly_price_table(data_daily: pd.DataFrame) -> dict:
+    """
+    Resamples daily Close and Adj Close to months for all trading day offsets at once
+    (MONTHLY_TABLE_OFFSETS, 0 -> first trading day, -1 -> last trading day).
+
+    >>> table = build_monthly_price_table(data_daily)
+    >>> table['Adj Close'][:, table['offsets'].index(-1)]  # last trading day of each month
+
+    :param data_daily: pd.DataFrame with a DatetimeIndex
+    :return: dict with first_month, offsets, columns, index_name, (months x offsets) arrays
+             of every column (NaN if a month has fewer trading days) and has_day
+    """
+
+    months, rows = month_offset_rows(data_daily.index, MONTHLY_TABLE_OFFSETS)
+    table = {'first_month': int(months[0]), 'offsets': list(MONTHLY_TABLE_OFFSETS),
+             'columns': list(data_daily.columns), 'index_name': data_daily.index.name,
+             'has_day': rows >= 0}
+    for column in data_daily.columns:
+        values = np.append(data_daily[column].to_numpy(dtype=float), np.nan)
+        # rows of -1 pick the NaN at the end
+        table[column] = values[rows]
+    return table
+
+
+def monthly_data_from_table(table: dict, day_of_month: int) -> pd.DataFrame:
+    """
+    Returns the monthly data for one trading day offset of a monthly price table, indexed by
+    (year, month). Months without that trading day are left out.
+
+    :param table: dict, see build_monthly_price_table
+    :param day_of_month: int, one of the offsets of the table
+    :return: pd.DataFrame
+    """
+
+    offset = table['offsets'].index(day_of_month)
+    has_day = table['has_day'][:, offset]
+    years, months_of_year = np.divmod(table['first_month'] + np.flatnonzero(has_day), 12)
+    index = pd.MultiIndex.from_arrays([years, months_of_year + 1],
+                                      names=[table['index_name']] * 2)
+    return pd.DataFrame({column: table[column][has_day, offset]
+                         for column in table['columns']}, index=index)
+
+
+def get_replacement_chain(ticker: str) -> list:
+    """
+    Returns a ticker followed by its early replacements, newest first.
+
+    >>> get_replacement_chain('VTI')
+    ['VTI', 'SPY', 'VFINX']
+
+    :param ticker: str
+    :return: list
+    """
+
+    chain = [ticker]
+    while TICKER_CONFIG[chain[-1]]['early_replacement']:
+        replacement = TICKER_CONFIG[chain[-1]]['early_replacement']
+        if replacement in chain:
+            raise ValueError(f'Early replacements of {ticker} form a cycle: {chain}.')
+        chain.append(replacement)
+    return chain
+
+
+def splice_replacement_chain(chain_data: list) -> pd.DataFrame:
+    """
+    Splices the daily data of a ticker and its early replacements into one series.
+
+    Each replacement gets used for the days before its newer ticker starts and gets scaled so
+    that both match on the first day of the newer ticker. The scale factors are multiplied up in
+    one pass from the newest to the oldest ticker and all parts get concatenated once.
+    A replacement that doesn't start before its newer ticker gets skipped.
+
+    :param chain_data: list of pd.DataFrames with Close and Adj Close, newest first, see
+                       get_replacement_chain
+    :return: pd.DataFrame
+    """
+
+    parts = [chain_data[0]]
+    scales = {'Close': 1.0, 'Adj Close': 1.0}
+    newer = chain_data[0]
+    for data in chain_data[1:]:
+        first_date = newer.index[0]
+        if data.index[0] >= first_date:
+            continue
+        for column in scales:
+            scales[column] *= newer[column][first_date] / data[column][first_date]
+        earlier = data[data.index < first_date]
+        parts.append(earlier.assign(**{column: earlier[column] * scale
+                                       for column, scale in scales.items()}))
+        newer = data
+
+    return pd.concat(parts[::-1], sort=True)
+
 
 class TickerData:
 
 
     def __init__(self, ticker, use_early_replacements=True, force_new_data=False,
                  day_of_month_for_monthly_data=-1,
-                 is_replacement_ticker=False
+                 is_replacement_ticker=False,
+                 data_provider=download_yahoo_data,
+                 data_version=None
                  ):
         """
         TickerData class holds daily and monthly information for one ticker
@@ -33,6 +220,10 @@ class TickerData:
                                               be used? Default: -1, last trading day of the month
         :param is_replacement_ticker: Is this an early replacement ticker? If so, data needs to be
                                       from today but not from the last hour.
+        :param data_provider: function (ticker, start, end) -> pd.DataFrame that downloads raw
+                              daily data. Default: yahoo
+        :param data_version: int, data version of the cached daily and monthly data.
+                             Default: current version, see storage.get_data_version
         """
 
         self.ticker = ticker
@@ -45,10 +236,20 @@ class TickerData:
         self.use_early_replacements = use_early_replacements
         self.force_new_data = force_new_data
         self.is_replacement_ticker = is_replacement_ticker
+        if day_of_month_for_monthly_data not in MONTHLY_TABLE_OFFSETS:
+            raise ValueError(f'day_of_month_for_monthly_data has to be between '
+                             f'{min(MONTHLY_TABLE_OFFSETS)} and {max(MONTHLY_TABLE_OFFSETS)}, '
+                             f'not {day_of_month_for_monthly_data}.')
         self.day_of_the_month_for_monthly_data = day_of_month_for_monthly_data
+        self.data_provider = data_provider
+        # set if loading the raw data downloaded prices that differ from the stored ones
+        self.prices_changed = False
 
+        self._data_version = data_version
         self._data_daily = None
         self._data_monthly = None
+        self._panel_monthly = None
+        self._monthly_price_table = None
 
 
     @property
@@ -63,12 +264,13 @@ class TickerData:
             return self._data_daily
 
         if not self.force_new_data:
-            self._data_daily = read_from_redis(key=self.redis_key_daily)
+            self._data_daily = read_from_optional_redis(key=self.redis_key_daily)
 
         if self._data_daily is None:
             self.load_ticker_data() # loads data and updates self._data_daily
 
-            write_to_redis(key=self.redis_key_daily, value=self._data_daily, expiration=3600)
+            write_to_optional_redis(key=self.redis_key_daily, value=self._data_daily,
+                                    expiration=3600)
 
         return self._data_daily
 
@@ -84,21 +286,60 @@ class TickerData:
             return self._data_monthly
 
         if not self.force_new_data:
-            self._data_monthly = read_from_redis(key=self.redis_key_monthly)
+            self._data_monthly = read_from_optional_redis(key=self.redis_key_monthly)
 
         if self._data_monthly is None:
-            # update data_monthly in case the stored version had a different day_of_month...
-            self._data_monthly = self.data_daily.groupby(
-                by=[self.data_daily.index.year,self.data_daily.index.month]).nth(
-                self.day_of_the_month_for_monthly_data)
+            # all days of the month share one resampled table -> only pick the day's column
+            self._data_monthly = monthly_data_from_table(self.monthly_price_table,
+                                                         self.day_of_the_month_for_monthly_data)
 
             if self.monthly_index_replacement:
                 self.merge_monthly_data_with_index(self.monthly_index_replacement)
 
-            write_to_redis(key=self.redis_key_monthly, value=self._data_monthly, expiration=3600)
+            write_to_optional_redis(key=self.redis_key_monthly, value=self._data_monthly,
+                                    expiration=3600)
 
         return self._data_monthly
 
+    @property
+    def monthly_price_table(self) -> dict:
+        """
+        Returns the Close and Adj Close of every month for all trading day offsets at once,
+        see build_monthly_price_table. data_monthly picks the column of its day of the month,
+        so changing the day doesn't resample the daily data again.
+
+        Only covers months with daily data, i.e. no monthly index replacements.
+
+        :return: dict
+        """
+
+        if self._monthly_price_table is not None:
+            return self._monthly_price_table
+
+        if not self.force_new_data:
+            self._monthly_price_table = read_from_optional_redis(
+                key=self.redis_key_monthly_table)
+
+        if self._monthly_price_table is None:
+            self._monthly_price_table = build_monthly_price_table(self.data_daily)
+            write_to_optional_redis(key=self.redis_key_monthly_table,
+                                    value=self._monthly_price_table, expiration=3600)
+
+        return self._monthly_price_table
+
+    @property
+    def panel_monthly(self) -> MonthlyPanel:
+        """
+        Returns the monthly data as a MonthlyPanel with columns 'close' and 'adj_close'
+
+        :return: MonthlyPanel
+        """
+
+        if self._panel_monthly is None:
+            self._panel_monthly = MonthlyPanel.from_frame(
+                self.data_monthly, columns={'Close': 'close', 'Adj Close': 'adj_close'})
+        return self._panel_monthly
+
     def __eq__(self, other):
         return (
             self.ticker == other.ticker and
@@ -110,13 +351,46 @@ class TickerData:
     def __repr__(self):
         return str(self.data_daily)
 
+    @property
+    def data_version(self) -> int:
+        """
+        Data version of the cached daily and monthly data, see storage.get_data_version. Part
+        of their redis keys, so a refresh pass with new prices also refreshes them.
+        Without redis, nothing gets cached and the version doesn't matter.
+
+        :return: int
+        """
+        if self._data_version is None:
+            try:
+                self._data_version = get_data_version()
+            except redis.exceptions.ConnectionError:
+                self._data_version = 0
+        return self._data_version
+
     @property
     def redis_key_daily(self):
         """
         Name for daily returns (for redis)
         :return:
         """
-        return f'daily{self.ticker}{self.use_early_replacements}'
+        return f'daily{self.ticker}{self.use_early_replacements}_{self.data_version}'
+
+    @property
+    def redis_key_monthly_table(self):
+        """
+        Name for the monthly prices of all trading day offsets (for redis)
+        :return:
+        """
+        return f'monthly_price_table{self.ticker}{self.use_early_replacements}_' \
+               f'{self.data_version}'
+
+    @property
+    def redis_key_yahoo(self):
+        """
+        Name for the raw yahoo data (for redis)
+        :return:
+        """
+        return f'yahoo_{self.ticker}'
 
     @property
     def redis_key_monthly(self):
@@ -125,7 +399,7 @@ class TickerData:
         :return:
         """
         return f'monthly{self.ticker}{self.use_early_replacements}' \
-               f'{self.day_of_the_month_for_monthly_data}'
+               f'{self.day_of_the_month_for_monthly_data}_{self.data_version}'
 
     def load_ticker_data(self):
         """
@@ -134,85 +408,77 @@ class TickerData:
         :return:
         """
 
-        # if just all ones -> load ticker going to 1980 and set it to all ones.
-        if self.ticker == 'ONES':
-            self._data_daily = TickerData(ticker='EFA',
-                                    force_new_data=self.force_new_data,
-                                    is_replacement_ticker=True).data_daily
-            self._data_daily['Adj Close'] = 1.00
-            self._data_daily['Close'] = 1.00
-
-        else:
-            self._data_daily = self.load_raw_data_or_get_from_yahoo()
+        self._data_daily = self.load_unmerged_data()
 
-            # if we use early replacements, merge daily data with the replacements.
-            if self.use_early_replacements and self.early_replacement:
-                self.merge_daily_data_with_early_replacements()
+        # if we use early replacements, merge daily data with the replacements.
+        if self.use_early_replacements and self.early_replacement:
+            self.merge_daily_data_with_early_replacements()
 
-    def merge_daily_data_with_early_replacements(self):
+    def load_unmerged_data(self) -> pd.DataFrame:
         """
-        Merges a ticker with its earlier replacements going back to 1980 where possible
-        If no early replacement, does nothing
+        Load the daily data of the ticker itself, without early replacements.
 
+        :return: pd.DataFrame
         """
-        # load the data for the early replacement
-        early_stock_data = TickerData(self.early_replacement,
-                                      force_new_data=self.force_new_data,
-                                      use_early_replacements=True).data_daily
 
-        # adjust stock closing price of replacement for a seamless transition to the new ticker.
-        first_date = self._data_daily.index[0]
+        # if just all ones -> load ticker going to 1980 and set it to all ones.
+        if self.ticker == 'ONES':
+            data_daily = TickerData(ticker='EFA',
+                                    force_new_data=self.force_new_data,
+                                    is_replacement_ticker=True,
+                                    data_version=self._data_version).data_daily
+            data_daily['Adj Close'] = 1.00
+            data_daily['Close'] = 1.00
+            return data_daily
 
-        # TODO: without copying the df, the following code throws an error claiming that
-        #  early_stock_data[c] was readonly. rather strange. copy works but not best performance
+        return self.load_raw_data_or_get_from_yahoo()
 
-        early_stock_data = early_stock_data.copy()
+    def merge_daily_data_with_early_replacements(self):
+        """
+        Merges a ticker with its whole chain of earlier replacements going back to 1980 where
+        possible, e.g. VTI -> SPY -> VFINX. If no early replacement, does nothing
 
-        for c in ['Close', 'Adj Close']:
-            try:
-                early_stock_data[c] *= (self._data_daily[c][first_date] / early_stock_data[c][
-                    first_date])
-            except:
-                print("read only error on merge_daily_data_with_early_replacement")
-                embed()
+        The spliced data gets cached with data_daily (redis_key_daily).
+        """
 
-        # [:-1] to avoid duplicating the first date
-        early_stock_data = early_stock_data[:first_date][:-1]
-        self._data_daily = early_stock_data.append(self._data_daily[first_date:], sort=True)
-        self._data_daily = self._data_daily['1980-01-01':]
+        chain = get_replacement_chain(self.ticker)
+        chain_data = [self._data_daily] + [
+            TickerData(ticker, use_early_replacements=False, force_new_data=self.force_new_data,
+                       is_replacement_ticker=True, data_provider=self.data_provider
+                       ).load_unmerged_data()
+            for ticker in chain[1:]
+        ]
+        self._data_daily = splice_replacement_chain(chain_data)['1980-01-01':]
 
     def merge_monthly_data_with_index(self, index_csv_name: str):
         """
+        Merges the monthly data with an index for the months before the ticker starts.
+        The monthly index data comes from the compiled data bundle, see data_bundle.
 
         :param index_csv_name:
         :return:
         """
 
-        # load index and convert to monthly data
-        index_data = read_from_redis(key=index_csv_name)
-        if index_data is None:
-            index_data = pd.read_csv(Path(DATA_PATH, 'index_data', index_csv_name))
-            write_to_redis(key=index_csv_name, value=index_data, expiration=3600 * 24)
-        index_data['Datetime'] = pd.to_datetime(index_data['Date'])
-        index_data = index_data.set_index('Datetime')
-        index_data = index_data['1980-01-01':]
-        index_data = index_data.groupby(by=[index_data.index.year,
-                                            index_data.index.month]).nth(-1)
-
-        # index_data = index_data.copy()
+        # load monthly index data
+        index_data = load_index_data(index_csv_name)
+        index_data = index_data[index_data.index.get_level_values(0) >= 1980]
 
         first_date = self._data_monthly.index[0]
-        merged_monthly_data = TickerData('ONES').data_monthly.copy()
+        merged_monthly_data = TickerData('ONES', data_version=self._data_version
+                                         ).data_monthly.copy()
 
         for c in ['Close', 'Adj Close']:
             if self.ticker in ['QVAL', 'IVAL', 'QMOM', 'IMOM']:
-                index_data[c] = index_data[f'{self.ticker}_index']
+                index_prices = index_data[f'{self.ticker}_index']
+            else:
+                index_prices = index_data[c]
 
             # adjust index data to fit with ticker monthly data
-            index_data[c] *= (self._data_monthly[c][first_date] / index_data[c][first_date])
+            index_prices = index_prices * (self._data_monthly[c][first_date] /
+                                           index_prices[first_date])
 
             # set merged data until first date to index data
-            merged_monthly_data[c][:first_date] = index_data[c][:first_date]
+            merged_monthly_data[c][:first_date] = index_prices[:first_date]
             # for the rest, use ticker data
             merged_monthly_data[c][first_date:] = self._data_monthly[c][first_date:]
 
@@ -220,34 +486,39 @@ class TickerData:
 
     def load_raw_data_or_get_from_yahoo(self):
         """
-        Loads raw yahoo ticker data either from disk or from yahoo
+        Loads raw yahoo ticker data from redis, from the local store or from yahoo.
 
-        :param ticker:
-        :param force_new_data: bool
-        :param multiprocessing.Queue
-        :return:
+        Redis is optional, the local store keeps the data across redis restarts. If yahoo
+        is not available, outdated data from the local store gets used.
+
+        :return: pd.DataFrame
         """
 
-        redis_key = f'yahoo_{self.ticker}'
         stock_data = None
         if not self.force_new_data:
-            stock_data = read_from_redis(key=redis_key)
+            stock_data = read_from_optional_redis(key=self.redis_key_yahoo)
+            if stock_data is None:
+                stock_data = read_ticker_data(self.ticker, max_age=RAW_DATA_MAX_AGE)
+                if stock_data is not None:
+                    write_to_optional_redis(key=self.redis_key_yahoo, value=stock_data,
+                                            expiration=3600)
 
         if stock_data is None:
             print(self.ticker, "yahoo")
-            for _ in range(20):
-                try:
-                    start_date = '1/1/1980'
-                    stock_data = web.DataReader(self.ticker, data_source='yahoo', start=start_date,
-                                                end=date.today())
-                    stock_data.drop(['Open', 'High', 'Low', 'Volume'], inplace=True, axis=1)
-                    write_to_redis(key=redis_key, value=stock_data, expiration=3600)
-                    break
-
-                except pdr._utils.RemoteDataError as e:
-                    print(self.ticker, date)
-                    print(e)
-                    time.sleep(2)
+            stored_data = None if self.force_new_data else read_ticker_data(self.ticker)
+            stock_data = refresh_ticker_data(self.ticker, stored_data,
+                                             data_provider=self.data_provider)
+            if stock_data is not None:
+                write_ticker_data(self.ticker, stock_data)
+                write_to_optional_redis(key=self.redis_key_yahoo, value=stock_data,
+                                        expiration=3600)
+                # derived data only needs to be recalculated if prices changed. The data
+                # version gets bumped once per refresh pass, see fetcher.refresh_data
+                if stored_data is None or not stock_data.equals(stored_data):
+                    self.prices_changed = True
+            else:
+                print(f'{self.ticker} could not be downloaded, using the local store.')
+                stock_data = read_ticker_data(self.ticker)
 
         return stock_data
 
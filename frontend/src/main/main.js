@@ -20,6 +20,43 @@ import { getCookie } from '../common'
 import './main.css';
 
 
+/**
+ * The backend sends the monthly data as columns (one array per field, holdings as indexes
+ * into the tickers table). Turns them into one object per month for the chart and the tables.
+ */
+function monthly_data_to_rows(monthly_data) {
+    const rows = [];
+    for (let idx = 0; idx < monthly_data.year.length; idx++) {
+        const date = [monthly_data.year[idx], monthly_data.month[idx]];
+        const holdings = [];
+        for (const component of monthly_data.components) {
+            holdings.push({
+                'name': component.name,
+                'holdings': component.holdings
+                    .filter(position => position[idx] >= 0)
+                    .map(position => monthly_data.tickers[position[idx]]),
+                'pretax': component.pretax[idx],
+                'posttax': component.posttax[idx]
+            });
+        }
+        rows.push({
+            'date': date,
+            'date_str': date,
+            'date_start': new Date(date[0], date[1]),
+            'date_end': new Date(date[0], date[1] + 1),
+            'holdings': holdings,
+            'value_start_pretax': monthly_data.value_start_pretax[idx],
+            'value_start_posttax': monthly_data.value_start_posttax[idx],
+            'value_end_pretax': monthly_data.value_end_pretax[idx],
+            'value_end_posttax': monthly_data.value_end_posttax[idx],
+            'value_end_spy_pretax': monthly_data.value_end_spy_pretax[idx],
+            'value_end_spy_posttax': monthly_data.value_end_spy_posttax[idx]
+        });
+    }
+    return rows
+}
+
+
 class MainInterface extends React.Component {
     constructor(props){
         super(props)
@@ -657,12 +694,6 @@ class MainView extends React.Component {
                     .then((d) => {
 
                         if (!d.data_load_error) {
-                            d.data.monthly_data.forEach(element => {
-                                element.date_str = element.date;
-                                element.date_start = new Date(element.date[0], element.date[1]);
-                                element.date_end = new Date(element.date[0], element.date[1]
-                                    + 1);
-                            });
                             let dm_config = this.state.dm_config;
                             dm_config.config_hash = d.config_hash;
                             dm_config.data_load_error = d.data_load_error;
@@ -670,6 +701,9 @@ class MainView extends React.Component {
                                 data: d.data,
                                 dm_config: dm_config
                             });
+                            // headline metrics are rendered -> load the chart and the monthly
+                            // holdings, the most expensive section
+                            this.load_monthly_data(url_params, d.config_hash);
                             return true
                         } else{
                             console.log("error", d.data_load_error);
@@ -681,6 +715,30 @@ class MainView extends React.Component {
             });
     }
 
+    load_monthly_data(url_params, config_hash) {
+        let url = 'get_test_data?' + url_params + '&' +
+            queryString.stringify({'sections': 'monthly_data'});
+        fetch(url)
+            .then((response) => {
+                response
+                    .json()
+                    .then((d) => {
+                        // skip if the config changed while the monthly data was loading
+                        if (!d.data_load_error &&
+                                this.state.dm_config.config_hash === config_hash) {
+                            this.setState({
+                                data: {
+                                    ...this.state.data,
+                                    monthly_data: monthly_data_to_rows(d.data.monthly_data)
+                                }
+                            });
+                        }
+                    })
+            }).catch(() => {
+                console.log("error");
+            });
+    }
+
     render() {
 
         // get total weight allocated (should be 100)
@@ -81,7 +81,7 @@ export class ReturnsChart extends React.Component {
             // if zoom status changed, update paths during render
             (this.state.zoomTransform !== nextState.zoomTransform) ||
             // if we have data but no calculated bars yet, update paths during render
-            (nextProps.data && !this.bars) ||
+            (nextProps.data && nextProps.data.monthly_data && !this.bars) ||
             // if the dual momentum config has changed (indicated by hash) -> update
             (this.props.config_hash === nextProps.config_hash)
         ){
@@ -199,7 +199,8 @@ export class ReturnsChart extends React.Component {
     }
 
     render() {
-        if (!this.props.data) {
+        // the monthly data gets loaded after the headline metrics
+        if (!this.props.data || !this.props.data.monthly_data) {
             return (<div/>);
         } else {
 
@@ -291,6 +292,9 @@ export class ReturnsChart extends React.Component {
 
 
     componentDidUpdate() {
+        if (!this.props.data || !this.props.data.monthly_data) {
+            return;
+        }
 
         // componentDidUpdate fires AFTER render() in an update cycle
         // this means that we have access to the rendered but empty xAxisRef group and can fill
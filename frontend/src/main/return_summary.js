@@ -76,6 +76,9 @@ export class ReturnsSummary extends React.Component {
                     </MDBTable>;
 
 
+            } else  if (this.state.selected_tab === 'Monthly Holdings' && !d.monthly_data){
+                // the monthly data gets loaded after the headline metrics
+                table = <div>Loading monthly holdings...</div>;
             } else  if (this.state.selected_tab === 'Monthly Holdings'){
                 const component_names = [];
                 for (const component of d.monthly_data[0].holdings){